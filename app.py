@@ -1,16 +1,22 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
-import re
-from PIL import Image
 import pandas as pd
 
-from user import process_user_prompt
-from generation import analyze
-from outputllm import run_llm_pipeline
+from llmmchat import run_llm_chat
+from chatcontext import build_chat_context
+from uicache import get_scene_images, refresh_scene_images, load_thumbnail, lazy_download_button
+from tileserver import start_tile_server, slippy_map_html, layer_bounds, register_job_layers, LAYERS, LAYER_FILES
+from workspace import artifact_path
+from jobqueue import submit_job, get_job, start_workers, QUEUED, RUNNING, DONE, FAILED
+from cube import cube_dates, compare_dates
+from llmqueue import llm_metrics
+import matplotlib
+import numpy as np
 import yaml
+from settings import load_config
 
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_config()
 
 DATA_DIR = config["data_dir"]
 WORKFLOW_FILE = config["workflow_file"]
@@ -28,10 +34,6 @@ if 'user_input' not in st.session_state:
     st.session_state['user_input'] = ""
 
 
-# 👉 Function to clean dates
-def clean_date_folder(date_folder):
-    return re.sub(r'_\d+$', '', date_folder)
-
 import yaml
 
 def convert_workflow_txt_to_yaml(txt_path):
@@ -45,31 +47,71 @@ def convert_workflow_txt_to_yaml(txt_path):
     yaml_content = yaml.dump(workflow, sort_keys=False)
     return yaml_content
 
-# 👉 Function to get images
-def get_composite_images(base_dir="DATA_DIR"):
-    images = []
-    for root, dirs, files in os.walk(base_dir):
-        for file in files:
-            if file.lower() == "false_color_composite.png":
-                parts = root.split(os.sep)
-                date_folder = next((p for p in parts if p.startswith("2024") or p.startswith("2025")), "Unknown")
-                date_folder_clean = clean_date_folder(date_folder)
-                images.append((date_folder_clean, os.path.join(root, file)))
-    # Deduplicate
-    unique_images = {}
-    for date, path in images:
-        if date not in unique_images:
-            unique_images[date] = path
-    return sorted(unique_images.items())
+# 📦 Outputs of this session's job (content-addressed), else the shared data_dir files
+def output_path(*parts):
+    job_id = st.session_state.get('job_id')
+    if job_id:
+        path = artifact_path(job_id, "/".join(parts))
+        if path:
+            return path
+    return os.path.join(DATA_DIR, *parts)
+
+def workflow_output_path():
+    job_id = st.session_state.get('job_id')
+    if job_id:
+        for name in ("flood_workflow.txt", "flood_workflow.yaml", "flood_workflow.json"):
+            path = artifact_path(job_id, name)
+            if path:
+                return path
+    return WORKFLOW_FILE
+
+# 🗺️ One tile server per Streamlit server
+@st.cache_resource
+def tile_server():
+    return start_tile_server()
+
+# 👷 Worker processes are started once per Streamlit server, shared by all sessions
+@st.cache_resource
+def job_workers():
+    return start_workers()
 
 def run_workflow():
     st.session_state['submitted'] = True
-    st.info("⏳ Processing your request...")
-    process_user_prompt(st.session_state['user_input'])
-    analyze(DATA_DIR)
-    results = run_llm_pipeline(DATA_DIR)
-    st.session_state['results'] = results
-    st.success("✅ Task processed. Scroll down to see outputs.")
+    st.session_state['results'] = None
+    st.session_state['job_id'] = submit_job("workflow", {"prompt": st.session_state['user_input']})
+
+def render_job_status():
+    job = get_job(st.session_state['job_id'])
+    if job is None:
+        st.warning("⚠️ Job not found.")
+        return
+    if job['status'] in (QUEUED, RUNNING):
+        st.progress(job['progress'] or 0.0, text=f"⏳ Job {job['id']}: {job['stage']} {job['message'] or ''}")
+        preview = (job['result'] or {}).get('preview')
+        if preview:
+            # Coarse first pass; replaced by the full-resolution results when the job finishes
+            st.info(
+                f"⚡ Preview at 1/{preview['decimation']} resolution: "
+                f"flooded ≈ {preview['flood']['flooded_percent']}%, "
+                f"NDVI gain ≈ {preview['ndvi_change']['gain_percent']}%, "
+                f"loss ≈ {preview['ndvi_change']['loss_percent']}% (refining...)"
+            )
+            cols = st.columns(2)
+            for col, key, caption in ((cols[0], 'flood_map_png', "Flood Extent (preview)"),
+                                      (cols[1], 'ndvi_change_png', "NDVI Change (preview)")):
+                if preview.get(key) and os.path.exists(preview[key]):
+                    col.image(load_thumbnail(preview[key]), caption=caption, width=350)
+    elif job['status'] == DONE:
+        if st.session_state.get('results') is None:
+            st.session_state['results'] = job['result']
+            st.rerun()
+        st.success(f"✅ Job {job['id']} processed. Scroll down to see outputs.")
+    elif job['status'] == FAILED:
+        st.error(f"❌ Job {job['id']} failed: {job['error']}")
+
+# Poll the job table every few seconds without rerunning the whole page
+if hasattr(st, "fragment"):
+    render_job_status = st.fragment(run_every=2)(render_job_status)
 
 
 
@@ -82,8 +124,6 @@ st.session_state['user_input'] = st.text_area(
     value=st.session_state['user_input']
 )
 
-import subprocess
-
 # 📌 LLM system prompt
 SYSTEM_PROMPT = """
 You are a geospatial reasoning expert.
@@ -91,45 +131,67 @@ You work with satellite metadata, flood classification, NDVI change detection, a
 Always use snake_case, stay concise, do not add extra explanation.
 """
 
-def run_llm_chat(user_message, conversation_history):
-    prompt = SYSTEM_PROMPT + "\n"
-    for turn in conversation_history:
-        prompt += f"User: {turn['user']}\nAssistant: {turn['assistant']}\n"
-    prompt += f"User: {user_message}\nAssistant:"
-
-    process = subprocess.run(
-        ["ollama", "run", "llama3:8b"],
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    output = process.stdout.decode("utf-8").strip()
-    conversation_history.append({"user": user_message, "assistant": output})
-    return output, conversation_history
+job_workers()
+active_job = get_job(st.session_state['job_id']) if st.session_state.get('job_id') else None
 
-if not st.session_state['submitted']:
+if active_job is None or active_job['status'] in (DONE, FAILED):
     st.button("Submit", on_click=run_workflow)
-else:
-    st.info("✅ Task already submitted. If you want to rerun, restart the app.")
+
+if st.session_state.get('job_id'):
+    render_job_status()
+    if not hasattr(st, "fragment") and active_job and active_job['status'] in (QUEUED, RUNNING):
+        st.button("🔄 Refresh status")
 
 if st.session_state.get("submitted", False):
     results = st.session_state.get("results")
     if results:
+        if results.get('scenes_out_of_range'):
+            scenes = results.get('scenes') or {}
+            st.warning(
+                "⚠️ Fewer than two scenes fall within the requested dates: compared "
+                f"{(scenes.get('before') or {}).get('acquisition_time')} → "
+                f"{(scenes.get('after') or {}).get('acquisition_time')} instead."
+            )
         st.markdown("### 📊 Flood Statistics Summary:")
-        flood = results.get('flood', {})
+        flood = results.get('flood') or {}
         st.write(f"  Flooded Pixels     : {flood.get('flooded_pixels')} ({flood.get('flooded_percent')}%)")
         st.write(f"  Non-Flooded Pixels : {flood.get('non_flooded_pixels')} ({flood.get('non_flooded_percent')}%)")
+        if results.get('preview_error'):
+            errors = ", ".join(f"{k} ±{v} pp" for k, v in results['preview_error'].items())
+            st.caption(f"⚡ Preview (1/{results['preview']['decimation']} resolution) differed by {errors}")
 
         st.markdown("### 📊 NDVI Statistics:")
-        ndvi = results.get('ndvi_change', {})
+        ndvi = results.get('ndvi_change') or {}
         st.write(f"  Gain     : {ndvi.get('gain_pixels')} ({ndvi.get('gain_percent')}%)")
         st.write(f"  Loss     : {ndvi.get('loss_pixels')} ({ndvi.get('loss_percent')}%)")
         st.write(f"  Neutral  : {ndvi.get('neutral_pixels')} ({ndvi.get('neutral_percent')}%)")
 
-        site = results.get('site_suitability', {})
+        site = results.get('site_suitability') or {}
         st.markdown("### 📌 Site Suitability:")
         st.write(f"  Status : {site.get('status')}")
         st.write(f"  Path   : {site.get('path')}")
+        if site.get('suitable_percent') is not None:
+            st.write(f"  Suitable : {site.get('suitable_pixels')} ({site.get('suitable_percent')}%)")
+
+        # 🗓️ Any two acquisitions of this AOI, sliced from the memory-mapped time cube
+        aoi = results.get('aoi')
+        dates = cube_dates(aoi) if aoi else []
+        if len(dates) >= 2:
+            st.markdown("### 🗓️ Compare Any Two Dates:")
+            date_cols = st.columns(2)
+            before_date = date_cols[0].selectbox("Before", dates, index=0, key="cube_before")
+            after_date = date_cols[1].selectbox("After", dates, index=len(dates) - 1, key="cube_after")
+            if before_date == after_date:
+                st.info("Pick two different dates.")
+            else:
+                comparison = compare_dates(aoi, before_date, after_date)
+                st.write(f"  Flooded   : {comparison['flooded_percent']}%")
+                st.write(f"  NDVI Gain : {comparison['gain_percent']}%   Loss : {comparison['loss_percent']}%")
+                delta_rgb = matplotlib.colormaps["RdYlGn"](
+                    np.clip((np.nan_to_num(comparison['delta_ndvi']) + 1) / 2, 0, 1), bytes=True)
+                map_cols = st.columns(2)
+                map_cols[0].image(comparison['flood_mask'] * 255, caption="Flood Extent", width=500)
+                map_cols[1].image(delta_rgb, caption="NDVI Change", width=500)
 
 
 # ✅ Interactive LLM Research Chat
@@ -138,6 +200,13 @@ if st.session_state.get("submitted", False):
     st.markdown("## 🧑‍💻 Interactive LLM Research Chat")
     st.info("Ask any follow-up questions about your analysis results.")
 
+    # 🧠 Shared model load: requests waiting across all sessions and workers
+    llm_load = llm_metrics()
+    if llm_load["queue_depth"] or llm_load["running"]:
+        wait = f", avg wait {llm_load['wait_s_avg']}s" if llm_load["wait_s_avg"] is not None else ""
+        st.caption(f"🧠 LLM busy: {llm_load['running']}/{llm_load['max_concurrency']} generating, "
+                   f"{llm_load['queue_depth']} queued{wait}")
+
     # 👇 Add a text input for user question
     user_chat_input = st.text_input(
         "Type your LLM research question:",
@@ -149,9 +218,14 @@ if st.session_state.get("submitted", False):
     if st.button("Send LLM Query"):
         if user_chat_input.strip():
             with st.spinner("🧠 LLM thinking..."):
+                # Only the analysis facts relevant to this question are added to the turn
+                facts = build_chat_context(user_chat_input.strip(), st.session_state.get('results'))
                 response, st.session_state['conversation_history'] = run_llm_chat(
                     user_chat_input.strip(),
-                    st.session_state['conversation_history']
+                    st.session_state['conversation_history'],
+                    system_prompt=SYSTEM_PROMPT,
+                    facts=facts,
+                    results_key=(st.session_state.get('results') or {}).get('job_id')
                 )
                 st.markdown(f"**LLM:** {response}")
         else:
@@ -168,23 +242,30 @@ if st.session_state.get("submitted", False):
 # ✅ 3️⃣ Continue with image grid below
 st.markdown("### 🛰️ Satellite Composite Outputs")
 
-image_list = get_composite_images()
+image_list = get_scene_images(DATA_DIR)
 
 if image_list:
     cols = st.columns(4)
-    for idx, (date, path) in enumerate(image_list):
+    for idx, (date, scene, path) in enumerate(image_list):
         with cols[idx % 4]:
             try:
-                st.image(Image.open(path), caption="", use_container_width=True)
+                if not path:
+                    # Ingest only computes what the analysis needs; composites are made on request
+                    st.write(f"📅 {date}")
+                    if st.button("🎨 Generate composite", key=f"make_img_{idx}"):
+                        from filehandle import ensure_product
+                        with st.spinner("Rendering false-colour composite..."):
+                            ensure_product(scene, "false_color")
+                        refresh_scene_images()
+                        st.rerun()
+                    continue
+
+                st.image(load_thumbnail(path), caption="", use_container_width=True)
                 st.write(f"📅 {date}")
 
-                # Dummy per-image data: add real logic if needed
-                with open(path, "rb") as img_file:
-                    img_bytes = img_file.read()
-
-                st.download_button(
+                lazy_download_button(
                     label="⬇️ Download Image",
-                    data=img_bytes,
+                    path=path,
                     file_name=f"composite_{date}.png",
                     mime="image/png",
                     key=f"download_img_{idx}"
@@ -202,23 +283,19 @@ st.markdown("## 🗺️ Detailed Benchmark Outputs")
 # 📍 1) Flood Extent
 st.markdown("### 🌊 Flood Extent Risk Map")
 try:
-    BASE_DIR =DATA_DIR
-    flood_png = os.path.join(BASE_DIR, "flood_extent", "flood_mask.png")
-    flood_tif = os.path.join(BASE_DIR, "flood_extent", "flood_mask.tif")
+    flood_png = output_path("flood_extent", "flood_mask.png")
+    flood_tif = output_path("flood_extent", "flood_mask.tif")
 
     # ✅ Use st.image to handle local paths safely
     col_center = st.columns(3)
     with col_center[1]:  # center column
-        st.image(Image.open(flood_png), caption="Flood Extent Risk", width=500)
-
-    with open(flood_tif, "rb") as tif_file:
-        tif_bytes = tif_file.read()
+        st.image(load_thumbnail(flood_png, max_size=1000), caption="Flood Extent Risk", width=500)
 
     # ✅ Center the download button too
     with col_center[1]:
-        st.download_button(
+        lazy_download_button(
             label="⬇️ Download Flood Extent GeoTIFF",
-            data=tif_bytes,
+            path=flood_tif,
             file_name="flood_mask.tif",
             mime="image/tiff",
             key="download_flood_tif"
@@ -227,30 +304,40 @@ try:
 except Exception as e:
     st.warning(f"Flood extent data not found. {e}")
 
+# 📍 Interactive map (full-resolution tiles, pan & zoom)
+st.markdown("### 🧭 Interactive Map")
+try:
+    tile_server()
+    job_layers = register_job_layers(st.session_state['job_id']) if st.session_state.get('job_id') else []
+    map_layers = job_layers or [name for name in LAYER_FILES if os.path.exists(LAYERS[name]["path"])]
+    if map_layers:
+        components.html(slippy_map_html(map_layers, bounds=layer_bounds(map_layers[0])), height=540)
+    else:
+        st.info("No GeoTIFF outputs to map yet.")
+except Exception as e:
+    st.warning(f"Interactive map unavailable. {e}")
+
 # 📍 2) NDVI Change Detection
 st.markdown("### 🌿 NDVI Change Detection")
 try:
-    ndvi_change_png = os.path.join(DATA_DIR, "flood_extent", "NDVI_change.png")
-    ndvi_stats_png = os.path.join(DATA_DIR, "flood_extent", "ndvi_stats.png")
+    ndvi_change_png = output_path("flood_extent", "NDVI_change.png")
+    ndvi_stats_png = output_path("flood_extent", "ndvi_stats.png")
 
     # 🟢 Use two columns side-by-side
     ndvi_cols = st.columns(2)
 
     with ndvi_cols[0]:
-        st.image(Image.open(ndvi_change_png), caption="NDVI Change Map", width=500)
+        st.image(load_thumbnail(ndvi_change_png, max_size=1000), caption="NDVI Change Map", width=500)
 
     with ndvi_cols[1]:
-        st.image(Image.open(ndvi_stats_png), caption="NDVI Statistics Chart", width=500)
+        st.image(load_thumbnail(ndvi_stats_png, max_size=1000), caption="NDVI Statistics Chart", width=500)
     # ✅ Safe, portable path
-    ndvi_tif_path = os.path.join(DATA_DIR, "flood_extent", "delta_ndvi.tif")
-
-    # ✅ Open and serve file
-    with open(ndvi_tif_path, "rb") as tif_file:
-        tif_bytes = tif_file.read()
+    ndvi_tif_path = output_path("flood_extent", "delta_ndvi.tif")
 
-    st.download_button(
+    # ✅ Serve file (read only when requested)
+    lazy_download_button(
         label="⬇️ Download NDVI Change GeoTIFF",
-        data=tif_bytes,
+        path=ndvi_tif_path,
         file_name="delta_ndvi.tif",
         mime="image/tiff",
         key="download_ndvi_tif"
@@ -264,7 +351,7 @@ except Exception as e:
 st.markdown("---")
 st.markdown("## 🗂️ Flood Risk Workflow (YAML)")
 # Example if your workflow file is in the root
-workflow_txt_path = WORKFLOW_FILE
+workflow_txt_path = workflow_output_path()
 
 try:
     yaml_doc = convert_workflow_txt_to_yaml(workflow_txt_path)
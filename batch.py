@@ -0,0 +1,186 @@
+"""Batch analysis for many AOIs after an event.
+
+    python batch.py districts.csv                      # download + analyze every row, write a summary CSV
+    python batch.py districts.json --no-download       # analyze scenes already in data_dir
+    python batch.py --summary <batch_id>               # (re)write the summary of an earlier batch
+
+Input rows need name (or location), latitude/longitude (or a gazetteer place
+name in location), start_date and end_date. Each AOI becomes an "aoi" job in
+the shared job queue, so batch work and UI requests share the same workers:
+the app's workers run the batch. Without the app running, --workers N starts
+N workers of this batch's own (still within max_concurrent_jobs overall).
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+
+from settings import load_config
+from taskparser import find_location, normalize_date, DEFAULT_TASK
+import jobqueue
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+SUMMARY_DIR = os.path.join(DATA_DIR, "batches")
+
+SUMMARY_COLUMNS = [
+    "name", "latitude", "longitude", "start_date", "end_date", "status",
+    "before_scene", "after_scene", "flooded_percent", "flooded_pixels",
+    "ndvi_gain_percent", "ndvi_loss_percent", "scenes_out_of_range", "flood_mask_tif", "error", "job_id",
+]
+
+
+def load_aois(path):
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    return [normalize_aoi(row) for row in rows]
+
+
+def normalize_aoi(row):
+    name = (row.get("name") or row.get("location") or "").strip()
+    latitude, longitude = row.get("latitude"), row.get("longitude")
+    if latitude in (None, "") or longitude in (None, ""):
+        place = find_location(row.get("location") or name)
+        if not place:
+            raise ValueError(f"AOI '{name}': no coordinates and not in the gazetteer")
+        name = name or place[0]
+        latitude, longitude = place[1], place[2]
+
+    start_date, end_date = normalize_date(row.get("start_date")), normalize_date(row.get("end_date"))
+    if not start_date or not end_date:
+        raise ValueError(f"AOI '{name}': start_date and end_date are required")
+
+    return {
+        "task": row.get("task") or DEFAULT_TASK,
+        "location": name or f"{latitude}, {longitude}",
+        "latitude": float(latitude),
+        "longitude": float(longitude),
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+
+# 📦 Queue one "aoi" job per region under a shared batch id
+def submit_batch(aois, download=True, db_path=jobqueue.JOB_DB):
+    batch_id = f"batch-{uuid.uuid4().hex[:8]}"
+    for aoi in aois:
+        jobqueue.submit_job("aoi", {"aoi": aoi, "download": download}, db_path=db_path, batch_id=batch_id)
+    print(f"📦 Batch {batch_id}: {len(aois)} AOIs queued")
+    return batch_id
+
+
+def batch_progress(batch_id, db_path=jobqueue.JOB_DB):
+    jobs = jobqueue.list_batch_jobs(batch_id, db_path)
+    counts = {}
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return jobs, counts
+
+
+def wait_for_batch(batch_id, db_path=jobqueue.JOB_DB, poll_interval=5.0):
+    while True:
+        jobs, counts = batch_progress(batch_id, db_path)
+        finished = counts.get(jobqueue.DONE, 0) + counts.get(jobqueue.FAILED, 0)
+        print(f"⏳ Batch {batch_id}: {finished}/{len(jobs)} finished {counts}")
+        if finished == len(jobs):
+            return jobs
+        time.sleep(poll_interval)
+
+
+def _scene_date(scenes, role):
+    scene = (scenes or {}).get(role) or {}
+    return (scene.get("acquisition_time") or "")[:10]
+
+
+def summary_rows(jobs):
+    rows = []
+    for job in jobs:
+        aoi = job["payload"]["aoi"]
+        result = job["result"] or {}
+        flood = result.get("flood") or {}
+        ndvi = result.get("ndvi_change") or {}
+        rows.append({
+            "name": aoi["location"],
+            "latitude": aoi["latitude"],
+            "longitude": aoi["longitude"],
+            "start_date": aoi["start_date"],
+            "end_date": aoi["end_date"],
+            "status": job["status"],
+            "before_scene": _scene_date(result.get("scenes"), "before"),
+            "after_scene": _scene_date(result.get("scenes"), "after"),
+            "flooded_percent": flood.get("flooded_percent"),
+            "flooded_pixels": flood.get("flooded_pixels"),
+            "ndvi_gain_percent": ndvi.get("gain_percent"),
+            "ndvi_loss_percent": ndvi.get("loss_percent"),
+            "scenes_out_of_range": result.get("scenes_out_of_range"),
+            "flood_mask_tif": flood.get("flood_mask_tif"),
+            "error": job["error"],
+            "job_id": job["id"],
+        })
+    return rows
+
+
+# 📊 One row per AOI, most flooded first
+def write_summary(batch_id, path=None, db_path=jobqueue.JOB_DB):
+    rows = summary_rows(jobqueue.list_batch_jobs(batch_id, db_path))
+    rows.sort(key=lambda r: -(r["flooded_percent"] or 0))
+    path = path or os.path.join(SUMMARY_DIR, f"{batch_id}.csv")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n📊 Batch {batch_id} summary ({path})")
+    for r in rows:
+        flooded = f"{r['flooded_percent']}%" if r["flooded_percent"] is not None else "-"
+        note = "  ⚠️ scenes outside the dates" if r["scenes_out_of_range"] else ""
+        print(f"  {r['name']:<24} {r['status']:<7} flooded {flooded:>8}  {r['before_scene']} → {r['after_scene']}{note}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch multi-AOI analysis")
+    parser.add_argument("aoi_file", nargs="?", help="CSV or JSON list of AOIs")
+    parser.add_argument("--no-download", action="store_true", help="only analyze scenes already in data_dir")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="start this many workers for the batch's jobs (default: use the app's workers)")
+    parser.add_argument("--summary", metavar="BATCH_ID", help="write the summary of an existing batch")
+    parser.add_argument("--out", help="summary CSV path (default data_dir/batches/<batch_id>.csv)")
+    args = parser.parse_args(argv)
+
+    if args.summary:
+        write_summary(args.summary, args.out)
+        return 0
+    if not args.aoi_file:
+        parser.error("an AOI file is required unless --summary is given")
+
+    batch_id = submit_batch(load_aois(args.aoi_file), download=not args.no_download)
+    stop, workers = multiprocessing.Event(), []
+    if args.workers > 0:
+        workers = jobqueue.start_workers(args.workers, batch_id=batch_id, stop=stop)
+    else:
+        print("👷 Waiting for the app's job workers (pass --workers N to run the batch without the app)")
+    try:
+        jobs = wait_for_batch(batch_id)
+    except KeyboardInterrupt:
+        print(f"🛑 Interrupted: letting running jobs finish, the rest of {batch_id} stays queued")
+        raise
+    finally:
+        jobqueue.stop_workers(workers, stop)
+    write_summary(batch_id, args.out)
+    return 1 if any(job["status"] == jobqueue.FAILED for job in jobs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
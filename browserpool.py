@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+DOWNLOADS_DIR = config["downloads_dir"]
+POOL_SIZE = int(config.get("browser_pool_size", 1))
+MAX_USES = int(config.get("browser_max_uses", 20))
+HEADLESS = bool(config.get("browser_headless", True))
+COOKIE_FILE = os.path.join(DATA_DIR, ".portal_cookies.json")
+LEASE_TIMEOUT = 600  # seconds to wait for a free session
+
+
+def new_driver(headless=HEADLESS, download_dir=DOWNLOADS_DIR):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("--start-maximized")
+    # Headless Chrome only downloads when a target folder is set explicitly
+    options.add_experimental_option("prefs", {
+        "download.default_directory": os.path.abspath(download_dir),
+        "download.prompt_for_download": False,
+    })
+    return webdriver.Chrome(service=Service(), options=options)
+
+
+# 🍪 Cookies shared by every session (and across restarts) so most leases skip the login form
+def save_cookies(driver, path=COOKIE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(driver.get_cookies(), f)
+    os.replace(tmp_path, path)
+
+
+def load_cookies(driver, url, path=COOKIE_FILE):
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "r") as f:
+            cookies = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    driver.get(url)  # cookies can only be set for the page's current domain
+    now = time.time()
+    for cookie in cookies:
+        if cookie.get("expiry") and cookie["expiry"] < now:
+            continue
+        cookie.pop("sameSite", None)
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            pass
+    return True
+
+
+class BrowserSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.logged_in = False
+        self.broken = False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """Logged-in browser sessions leased one request at a time and recycled after max_uses.
+
+    login(driver, username, password) performs the portal login; is_logged_in(driver) checks
+    whether the session (or restored cookies) is still valid.
+    """
+
+    def __init__(self, login, is_logged_in, restore_url, size=POOL_SIZE, max_uses=MAX_USES,
+                 headless=HEADLESS, cookie_file=COOKIE_FILE):
+        self.login = login
+        self.is_logged_in = is_logged_in
+        self.restore_url = restore_url
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.headless = headless
+        self.cookie_file = cookie_file
+        self.idle = []
+        self.created = 0
+        self.condition = threading.Condition()
+
+    def _acquire(self):
+        with self.condition:
+            deadline = time.time() + LEASE_TIMEOUT
+            while not self.idle and self.created >= self.size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("No browser session became free")
+                self.condition.wait(remaining)
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+
+        try:
+            print(f"🌐 Starting {'headless ' if self.headless else ''}browser session...")
+            return BrowserSession(new_driver(self.headless))
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def _release(self, session):
+        session.uses += 1
+        retire = session.broken or session.uses >= self.max_uses
+        if retire:
+            print(f"♻️ Retiring browser session after {session.uses} uses")
+            session.quit()
+        with self.condition:
+            if retire:
+                self.created -= 1
+            else:
+                self.idle.append(session)
+            self.condition.notify()
+
+    def _ensure_login(self, session, username, password):
+        driver = session.driver
+        if session.logged_in and self.is_logged_in(driver):
+            return
+        if load_cookies(driver, self.restore_url, self.cookie_file) and self.is_logged_in(driver):
+            print("🍪 Session restored from saved cookies.")
+        else:
+            self.login(driver, username, password)
+            save_cookies(driver, self.cookie_file)
+        session.logged_in = True
+
+    @contextmanager
+    def lease(self, username, password):
+        """Yield a logged-in driver; a session that raised is discarded instead of reused."""
+        session = self._acquire()
+        try:
+            self._ensure_login(session, username, password)
+            yield session.driver
+        except Exception:
+            session.broken = True
+            raise
+        finally:
+            self._release(session)
+
+    def close(self):
+        with self.condition:
+            sessions, self.idle = self.idle, []
+            self.created -= len(sessions)
+        for session in sessions:
+            session.quit()
@@ -0,0 +1,276 @@
+"""Grounding for the research chat: the few analysis facts relevant to each question.
+
+Snippets are built once per result set from:
+- the results dict (flood / NDVI / suitability numbers, index stats, AOI, preview)
+- zonal stats of the output rasters (3 × 3 zones)
+- scene metadata from the scene index
+- earlier requests in task_log.jsonl
+
+They are kept in a small BM25 keyword index. Each chat turn gets only the top-k
+snippets for its question, within chat_context_tokens.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from settings import load_config
+from llmmchat import estimate_tokens
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+CONTEXT_TOKEN_BUDGET = int(config.get("chat_context_tokens", 384))
+TOP_K = 6
+TASK_LOG = "task_log.jsonl"
+TASK_LOG_ENTRIES = 20
+ZONE_NAMES = [
+    ["north-west", "north", "north-east"],
+    ["west", "centre", "east"],
+    ["south-west", "south", "south-east"],
+]
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "did", "do", "does", "for", "from", "how", "in", "is",
+    "it", "me", "of", "on", "or", "the", "that", "this", "to", "was", "were", "what", "when", "where", "which",
+    "who", "why", "with", "you",
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_CACHED_INDEXES = 8
+
+_indexes = OrderedDict()
+
+
+def tokenize(text):
+    """Lower-case words; snake_case keys also yield their parts, and plurals/-ed/-ing are folded."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9_.]+", text.lower()):
+        parts = [word] + ([p for p in word.split("_") if p] if "_" in word else [])
+        for part in parts:
+            part = part.strip(".")
+            if part in STOPWORDS:
+                continue
+            for suffix in ("ing", "ed", "s"):
+                if len(part) > len(suffix) + 2 and part.endswith(suffix):
+                    part = part[:-len(suffix)]
+                    break
+            if part:
+                tokens.append(part)
+    return tokens
+
+
+def _fmt(value, digits=3):
+    return round(value, digits) if isinstance(value, float) else value
+
+
+# 📄 Snippets from the results dict
+def result_snippets(results):
+    snippets = []
+    task = results.get("task") or {}
+    if task:
+        snippets.append(("task", f"Current request: {task.get('task')} for {task.get('location')} "
+                                 f"({task.get('latitude')}, {task.get('longitude')}), "
+                                 f"{task.get('start_date')} to {task.get('end_date')}."))
+
+    aoi = results.get("aoi")
+    snippets.append(("area", f"Analysis area: bounding box {aoi['bounds']} (lon/lat)." if aoi
+                     else "Analysis area: full scene extent."))
+
+    flood = results.get("flood") or {}
+    if flood:
+        snippets.append(("flood", f"Flood extent: {flood.get('flooded_percent')}% of the area flooded "
+                                  f"({flood.get('flooded_pixels')} flooded pixels, {flood.get('non_flooded_pixels')} "
+                                  f"non-flooded); flooded means NDWI rose by more than 0.2 between the scenes."))
+
+    ndvi = results.get("ndvi_change") or {}
+    if ndvi:
+        text = (f"NDVI change (vegetation): gain {ndvi.get('gain_percent')}%, loss {ndvi.get('loss_percent')}%, "
+                f"neutral {ndvi.get('neutral_percent')}% of pixels (change threshold ±0.1).")
+        delta = ndvi.get("delta_ndvi_stats") or {}
+        if delta.get("mean") is not None:
+            text += f" Mean delta NDVI {_fmt(delta['mean'])}, std {_fmt(delta['std'])}."
+        snippets.append(("ndvi_change", text))
+
+    site = results.get("site_suitability") or {}
+    if site.get("suitable_percent") is not None:
+        snippets.append(("site_suitability", f"Site suitability: {site['suitable_percent']}% of the area suitable "
+                                             f"for building (NDVI > 0.4, NDWI < 0.2 and not flooded)."))
+
+    for role, layers in (results.get("index_stats") or {}).items():
+        for name, summary in layers.items():
+            if summary:
+                snippets.append((f"{role}_{name}", f"{role.title()} scene {name.upper()} statistics: mean "
+                                                   f"{summary['mean']}, std {summary['std']}, "
+                                                   f"range {summary['min']} to {summary['max']}."))
+
+    if results.get("preview_error"):
+        errors = ", ".join(f"{k} {v} pp" for k, v in results["preview_error"].items())
+        snippets.append(("preview", f"The coarse preview differed from the full-resolution result by {errors}."))
+    return snippets
+
+
+def zone_means(path):
+    """Mean of band 1 (decoded) in each of 3 × 3 zones, one zone window in memory at a time."""
+    import rasterio
+    from rasterio.windows import Window
+    from rasterutil import decode
+
+    zones = []
+    with rasterio.open(path) as src:
+        rows = np.array_split(np.arange(src.height), 3)
+        cols = np.array_split(np.arange(src.width), 3)
+        for i, r in enumerate(rows):
+            for j, c in enumerate(cols):
+                if not len(r) or not len(c):
+                    continue
+                block = decode(src.read(1, window=Window(int(c[0]), int(r[0]), len(c), len(r))), src)
+                block = block.astype("float32")
+                if np.isfinite(block).any():
+                    zones.append((ZONE_NAMES[i][j], float(np.nanmean(block))))
+    return zones
+
+
+# 🗺️ Flooded share and mean ΔNDVI per 3 × 3 zone of the output rasters (read once per result set)
+def zonal_snippets(results):
+    snippets = []
+    layers = [
+        ("flood", (results.get("flood") or {}).get("flood_mask_tif"), "flooded", 100, "%"),
+        ("ndvi_change", (results.get("ndvi_change") or {}).get("delta_ndvi_tif"), "mean delta NDVI", 1, ""),
+    ]
+    for name, path, label, scale, unit in layers:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            # + 0.0 turns -0.0 into 0.0
+            zones = [(zone, round(mean * scale, 2 if unit else 3) + 0.0) for zone, mean in zone_means(path)]
+        except Exception as e:
+            print(f"⚠️ Zonal stats skipped for {path}: {e}")
+            continue
+        if zones:
+            ranked = sorted(zones, key=lambda z: -z[1])
+            text = ", ".join(f"{zone} {value}{unit}" for zone, value in ranked)
+            snippets.append((f"zones_{name}", f"Zonal {label} by part of the area (highest first): {text}."))
+    return snippets
+
+
+# 🛰️ Metadata of the before/after scenes from the scene index
+def scene_snippets(results, data_dir=DATA_DIR):
+    from sceneindex import iter_rows, load_index
+
+    scenes = results.get("scenes") or {}
+    if not scenes:
+        return []
+    rows = {row["folder"]: row for row in iter_rows(load_index(data_dir))}
+    snippets = []
+    for role, scene in scenes.items():
+        row = {**scene, **rows.get(scene.get("folder"), {})}
+        fields = [f"acquired {row.get('acquisition_time')}"]
+        for key, label in (("satellite", "satellite"), ("sensor", "sensor"), ("product_id", "product"),
+                           ("cloud_cover", "cloud cover %"), ("sun_elevation", "sun elevation"),
+                           ("path", "path"), ("row", "row")):
+            if row.get(key) is not None:
+                fields.append(f"{label} {row[key]}")
+        snippets.append((f"scene_{role}", f"{role.title()} scene metadata: " + ", ".join(fields) + "."))
+    return snippets
+
+
+# 📚 Earlier requests (newest first)
+def task_log_snippets(path=TASK_LOG, limit=TASK_LOG_ENTRIES):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()[-limit:]
+    snippets, seen = [], set()
+    for line in reversed(lines):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        info = entry.get("info") or {}
+        if not info.get("location") or info.get("location") == "Not specified":
+            continue
+        key = (info.get("task"), info.get("location"), info.get("start_date"), info.get("end_date"))
+        if key in seen:
+            continue
+        seen.add(key)
+        snippets.append((f"history_{len(snippets)}", f"Earlier request on {entry.get('timestamp', '')[:10]}: "
+                                                      f"{info.get('task')} for {info.get('location')}, "
+                                                      f"{info.get('start_date')} to {info.get('end_date')}."))
+    return snippets
+
+
+class SnippetIndex:
+    """BM25 over short fact snippets."""
+
+    def __init__(self, snippets):
+        self.snippets = snippets
+        self.docs = [Counter(tokenize(f"{source} {text}")) for source, text in snippets]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        df = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    def scores(self, query):
+        terms = set(tokenize(query))
+        scores = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_length or 1))
+                    score += self.idf[term] * tf * (BM25_K1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    def search(self, query, k=TOP_K):
+        scored = [(score, i) for i, score in enumerate(self.scores(query)) if score > 0]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.snippets[i] for _, i in scored[:k]]
+
+
+def build_index(results, data_dir=DATA_DIR, task_log=TASK_LOG):
+    snippets = result_snippets(results) + zonal_snippets(results) + scene_snippets(results, data_dir)
+    snippets += task_log_snippets(task_log)
+    return SnippetIndex(snippets)
+
+
+def _index_for(results):
+    """One index per result set (job), rebuilt only when another job's results are shown."""
+    key = results.get("job_id") or json.dumps(results, sort_keys=True, default=str)
+    if key in _indexes:
+        _indexes.move_to_end(key)
+        return _indexes[key]
+    index = build_index(results)
+    _indexes[key] = index
+    while len(_indexes) > MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
+
+
+# 🧩 Top-k facts for this question, within the token budget ("" when there are no results)
+def build_chat_context(question, results, token_budget=CONTEXT_TOKEN_BUDGET, k=TOP_K):
+    if not results:
+        return ""
+    index = _index_for(results)
+    hits = index.search(question, k)
+    if not hits:
+        # Nothing matched: fall back to the headline numbers so the answer stays grounded
+        hits = [s for s in index.snippets if s[0] in ("task", "flood", "ndvi_change")]
+
+    header = "Analysis facts (use these numbers; say so if the answer is not covered):\n"
+    budget = token_budget - estimate_tokens(header)
+    lines = []
+    for source, text in hits:
+        line = f"- {text}\n"
+        cost = estimate_tokens(line)
+        if cost > budget:
+            continue
+        lines.append(line)
+        budget -= cost
+    return header + "".join(lines) if lines else ""
@@ -0,0 +1,206 @@
+"""Headless entry point for cron / batch runs.
+
+    python cli.py ingest                       # extract today's zips, rename, process scenes
+    python cli.py ingest --prompt "..."        # also download via the portal first
+    python cli.py ingest --prompt "..." --dry-run   # only report scenes to fetch / already held
+    python cli.py analyze --prompt "flood in Chennai 1-10 Oct 2024"
+    python cli.py analyze --prompt "..." --preview    # instant coarse estimate, then full resolution
+    python cli.py report --lat 13.08 --lon 80.27 --start "01 October 2024" --end "10 October 2024"
+    python cli.py run --prompt "..." --json    # ingest + analyze + LLM report
+
+Add --profile-imports to print how long each module took to import. With --json,
+stdout carries only the JSON document: progress logs go to stderr.
+Exits nonzero when a stage fails, including analyze/report finding no scene pair or no results.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import sys
+import time
+
+from settings import load_config
+
+# Modules each stage needs, heaviest third-party ones first so their cost is reported on its own
+STAGE_MODULES = {
+    "ingest": ["numpy", "rasterio", "matplotlib.pyplot", "filehandle"],
+    "download": ["ollama", "selenium.webdriver", "user"],
+    "analyze": ["numpy", "rasterio", "matplotlib.pyplot", "rasterutil", "sceneindex", "generation"],
+    "report": ["numpy", "rasterio", "matplotlib.pyplot", "rasterutil", "sceneindex", "outputllm"],
+}
+
+IMPORT_TIMES = {}
+
+
+def timed_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+def load_stage(stage):
+    for name in STAGE_MODULES[stage]:
+        try:
+            timed_import(name)
+        except ImportError as e:
+            # Optional for some runs (e.g. no ollama when the fast parser suffices)
+            print(f"⚠️ Could not import {name}: {e}", file=sys.stderr)
+
+
+def print_import_report():
+    if not IMPORT_TIMES:
+        return
+    print("\n⏱️ Import time per module:", file=sys.stderr)
+    for name, seconds in sorted(IMPORT_TIMES.items(), key=lambda item: -item[1]):
+        print(f"  {name:<22} {seconds * 1000:8.1f} ms", file=sys.stderr)
+    print(f"  {'total':<22} {sum(IMPORT_TIMES.values()) * 1000:8.1f} ms", file=sys.stderr)
+
+
+def task_from_args(args):
+    if args.prompt:
+        from user import extract_task_info
+        return extract_task_info(args.prompt)
+    return {
+        "task": "flood_risk_mapping",
+        "location": None,
+        "latitude": args.lat,
+        "longitude": args.lon,
+        "start_date": args.start,
+        "end_date": args.end,
+    }
+
+
+def aoi_from_args(args, info):
+    from rasterutil import aoi_from_task
+    if args.full_scene:
+        return None
+    if args.buffer_km:
+        info = {**info, "aoi_buffer_km": args.buffer_km}
+    return aoi_from_task(info)
+
+
+def scene_pair_for(config, info):
+    from sceneindex import select_scene_pair_for_task
+    scene_pair = select_scene_pair_for_task(config["data_dir"], info)
+    if not scene_pair:
+        raise RuntimeError(f"No before/after scene pair in {config['data_dir']} for "
+                           f"{info.get('start_date')} → {info.get('end_date')}")
+    if scene_pair["out_of_range"]:
+        print(f"⚠️ Scenes outside the requested dates: {scene_pair['before']['acquisition_time']} → "
+              f"{scene_pair['after']['acquisition_time']} (scenes_out_of_range in the results)", file=sys.stderr)
+    return scene_pair
+
+
+def stage_ingest(args, config):
+    if args.prompt:
+        load_stage("download")
+        from user import process_user_prompt
+        info = process_user_prompt(args.prompt, dry_run=args.dry_run)
+        if not info:
+            raise RuntimeError("Download/ingest failed")
+        return {"task": info, "dry_run": args.dry_run}
+
+    load_stage("ingest")
+    from filehandle import extract_today_zip_files, rename_folders_to_date_format, process_all_scenes
+    extract_today_zip_files(config["downloads_dir"], config["data_dir"])
+    rename_folders_to_date_format(config["data_dir"])
+    process_all_scenes(config["data_dir"])
+    return {"ingested": config["data_dir"]}
+
+
+def stage_analyze(args, config):
+    load_stage("analyze")
+    from generation import analyze
+    from sceneindex import scene_results
+
+    info = task_from_args(args)
+    scene_pair = scene_pair_for(config, info)
+    aoi = aoi_from_args(args, info)
+    preview = None
+    if args.preview:
+        from preview import preview_analysis, preview_error
+        preview = preview_analysis(scene_pair, aoi, output_dir=args.output_dir)
+    results = analyze(config["data_dir"], scene_pair=scene_pair, output_root=args.output_dir, aoi=aoi)
+    if not results or not (results.get("flood") or results.get("ndvi_change")):
+        raise RuntimeError("Analysis produced no flood or NDVI results")
+    results.update(scene_results(scene_pair))
+    if preview:
+        results["preview"] = preview
+        results["preview_error"] = preview_error(preview, results)
+        print(f"⚡ Preview error vs full resolution (percentage points): {results['preview_error']}")
+    results["task"] = info
+    return results
+
+
+def stage_report(args, config):
+    load_stage("report")
+    from outputllm import run_llm_pipeline
+
+    info = task_from_args(args)
+    scene_pair = scene_pair_for(config, info)
+    results = run_llm_pipeline(config["data_dir"], scene_pair=scene_pair, output_dir=args.output_dir,
+                               aoi=aoi_from_args(args, info))
+    results["task"] = info
+    return results
+
+
+def stage_run(args, config):
+    results = stage_ingest(args, config)
+    if args.dry_run:
+        return results
+    results.update(stage_report(args, config))
+    return results
+
+
+STAGES = {
+    "ingest": stage_ingest,
+    "analyze": stage_analyze,
+    "report": stage_report,
+    "run": stage_run,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="GIS Assistant batch runner")
+    parser.add_argument("stage", choices=list(STAGES))
+    parser.add_argument("--prompt", help="natural-language request (location + dates)")
+    parser.add_argument("--lat", type=float)
+    parser.add_argument("--lon", type=float)
+    parser.add_argument("--start", help='start date, e.g. "01 October 2024"')
+    parser.add_argument("--end", help='end date, e.g. "10 October 2024"')
+    parser.add_argument("--buffer-km", type=float, help="AOI half-width around the location (default aoi_buffer_km)")
+    parser.add_argument("--full-scene", action="store_true", help="analyze whole scenes instead of the AOI window")
+    parser.add_argument("--preview", action="store_true", help="analyze: print a coarse 1/8-resolution estimate first")
+    parser.add_argument("--output-dir", help="write outputs here instead of data_dir")
+    parser.add_argument("--dry-run", action="store_true", help="with --prompt: report which scenes would be downloaded")
+    parser.add_argument("--json", action="store_true", help="print results as JSON on stdout")
+    parser.add_argument("--profile-imports", action="store_true", help="report import time per module")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config()
+
+    # --json: stdout is reserved for the JSON document, so stage logs go to stderr
+    logs_to = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    try:
+        with logs_to:
+            results = STAGES[args.stage](args, config)
+    except Exception as e:
+        print(f"❌ Stage '{args.stage}' failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.profile_imports:
+            print_import_report()
+
+    if args.json:
+        print(json.dumps(results, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
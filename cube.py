@@ -0,0 +1,204 @@
+"""Per-AOI time cube: aligned NDWI/NDVI of every acquisition as memory-mapped arrays.
+
+    data_dir/cubes/<aoi_key>/cube.json          grid + one entry per acquisition
+    data_dir/cubes/<aoi_key>/ndwi/<slot>.npy    one (rows × cols) float32 chunk per date
+    data_dir/cubes/<aoi_key>/ndvi/<slot>.npy    (slot: the acquisition time, digits only)
+
+New scenes are appended as they are ingested (update_cube), one writer per cube at a
+time (stage_lock "cube:<aoi_key>"). Any date pair is then compared by slicing the
+memory-mapped chunks, without reopening a GeoTIFF.
+"""
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+CUBE_DIR = os.path.join(DATA_DIR, "cubes")
+TIME_CUBE = bool(config.get("time_cube", True))
+CUBE_INDEXES = ("ndwi", "ndvi")
+CUBE_META = "cube.json"
+
+# stage_lock is held per process: threads of one process also queue here
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def cube_dir(aoi, cubes_dir=CUBE_DIR):
+    from rasterutil import aoi_key
+    return os.path.join(cubes_dir, aoi_key(aoi))
+
+
+def load_cube(aoi, cubes_dir=CUBE_DIR):
+    """cube.json of this AOI, or None when no scene has been added yet."""
+    if not aoi:
+        return None
+    path = os.path.join(cube_dir(aoi, cubes_dir), CUBE_META)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_cube(directory, cube):
+    path = os.path.join(directory, CUBE_META)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cube, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _grid_profile(grid):
+    from affine import Affine
+    from rasterio.crs import CRS
+    return {
+        "height": grid["height"],
+        "width": grid["width"],
+        "transform": Affine(*grid["transform"]),
+        "crs": CRS.from_wkt(grid["crs"]) if grid["crs"] else None,
+    }
+
+
+def _save_chunk(path, array):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(array, dtype="float32"))
+    os.replace(tmp_path, path)
+
+
+def slot_name(acquisition_time):
+    """Chunk name of one acquisition: stable, so re-adding a date rewrites its own chunk and no other."""
+    return re.sub(r"[^0-9]", "", acquisition_time)
+
+
+def _cube_lock(aoi):
+    from rasterutil import aoi_key
+    key = aoi_key(aoi)
+    with _thread_locks_guard:
+        return key, _thread_locks.setdefault(key, threading.Lock())
+
+
+# 🧊 Append one acquisition: its index products resampled onto the cube grid (first scene defines the grid)
+def add_scene(aoi, row, cube=None, cubes_dir=CUBE_DIR, db_path=None):
+    """cube (a caller's copy) is ignored: cube.json is re-read under the cube lock so no writer is lost."""
+    from jobqueue import JOB_DB, stage_lock
+
+    key, thread_lock = _cube_lock(aoi)
+    with thread_lock, stage_lock(f"cube:{key}", db_path or JOB_DB, poll_interval=0.1):
+        return _add_scene(aoi, row, cubes_dir)
+
+
+def _add_scene(aoi, row, cubes_dir):
+    from generation import scene_products
+    from rasterutil import read_aligned, read_band
+
+    directory = cube_dir(aoi, cubes_dir)
+    cube = load_cube(aoi, cubes_dir) or {"aoi": aoi, "grid": None, "dates": {}}
+    if row["acquisition_time"] in cube["dates"]:
+        return cube  # another worker added it while we waited
+    ndwi_path, ndvi_path = scene_products(row["folder"], aoi)
+    if not ndwi_path or not ndvi_path:
+        print(f"⚠️ Cube: no NDWI/NDVI for {row['folder']}, skipped")
+        return cube
+
+    paths = {"ndwi": ndwi_path, "ndvi": ndvi_path}
+    layers = {}
+    if cube["grid"] is None:
+        layers["ndwi"], profile = read_band(ndwi_path)
+        cube["grid"] = {
+            "height": profile["height"],
+            "width": profile["width"],
+            "transform": list(profile["transform"])[:6],
+            "crs": profile["crs"].to_wkt() if profile.get("crs") else None,
+        }
+    profile = _grid_profile(cube["grid"])
+    for name in CUBE_INDEXES:
+        if name not in layers:
+            layers[name] = read_aligned(paths[name], profile)
+
+    slot = slot_name(row["acquisition_time"])
+    for name in CUBE_INDEXES:
+        _save_chunk(os.path.join(directory, name, f"{slot}.npy"), layers[name])
+    cube["dates"][row["acquisition_time"]] = {"slot": slot, "folder": row["folder"]}
+    _save_cube(directory, cube)
+    print(f"🧊 Cube {os.path.basename(directory)}: added {row['acquisition_time']} ({len(cube['dates'])} dates)")
+    return cube
+
+
+def update_cube(data_dir=DATA_DIR, aoi=None, cubes_dir=CUBE_DIR):
+    """Add every indexed scene over the AOI that the cube does not hold yet; returns the cube (None without an AOI)."""
+    from sceneindex import build_scene_index, iter_rows, scene_covers
+
+    if not aoi:
+        return None
+    west, south, east, north = aoi["bounds"]
+    cube = load_cube(aoi, cubes_dir)
+    held = set(cube["dates"]) if cube else set()
+
+    for row in iter_rows(build_scene_index(data_dir)):
+        if not row["acquisition_time"] or row["acquisition_time"] in held:
+            continue
+        if not scene_covers(row, (south + north) / 2, (west + east) / 2):
+            continue
+        try:
+            cube = add_scene(aoi, row, cube, cubes_dir)
+            held.add(row["acquisition_time"])
+        except Exception as e:
+            print(f"⚠️ Cube: could not add {row['folder']}: {e}")
+    return cube
+
+
+def cube_dates(aoi, cubes_dir=CUBE_DIR):
+    cube = load_cube(aoi, cubes_dir)
+    return sorted(cube["dates"]) if cube else []
+
+
+@lru_cache(maxsize=64)
+def _open_chunk(path, mtime):
+    return np.load(path, mmap_mode="r")
+
+
+def cube_layer(aoi, name, acquisition_time, cubes_dir=CUBE_DIR):
+    """Read-only memory map of one index on one date (no copy until it is computed with)."""
+    cube = load_cube(aoi, cubes_dir)
+    if not cube or acquisition_time not in cube["dates"]:
+        raise KeyError(f"{acquisition_time} is not in the cube")
+    path = os.path.join(cube_dir(aoi, cubes_dir), name, f"{cube['dates'][acquisition_time]['slot']}.npy")
+    return _open_chunk(path, os.path.getmtime(path))
+
+
+# 🔁 Flood mask and ΔNDVI for any two dates of the cube
+def compare_dates(aoi, before, after, cubes_dir=CUBE_DIR):
+    from preview import FLOOD_THRESHOLD
+    from ndvi_change import change_labels
+    from rasterutil import array_stats
+
+    delta_ndwi = cube_layer(aoi, "ndwi", after, cubes_dir) - cube_layer(aoi, "ndwi", before, cubes_dir)
+    delta_ndvi = cube_layer(aoi, "ndvi", after, cubes_dir) - cube_layer(aoi, "ndvi", before, cubes_dir)
+
+    flood_mask = (delta_ndwi > FLOOD_THRESHOLD).astype(np.uint8)
+    flood_stats = array_stats(flood_mask, valid=np.isfinite(delta_ndwi), class_names=["non_flooded", "flooded"],
+                              hist_range=None)
+    ndvi_stats = array_stats(delta_ndvi, labels=change_labels(delta_ndvi), class_names=["loss", "neutral", "gain"],
+                             hist_range=(-2.0, 2.0))
+
+    valid, changed = flood_stats["valid_pixels"], ndvi_stats["valid_pixels"]
+    return {
+        "before": before,
+        "after": after,
+        "flood_mask": flood_mask,
+        "delta_ndvi": delta_ndvi,
+        "flooded_percent": round(flood_stats["classes"]["flooded"] / valid * 100, 2) if valid else 0.0,
+        "gain_percent": round(ndvi_stats["classes"]["gain"] / changed * 100, 2) if changed else 0.0,
+        "loss_percent": round(ndvi_stats["classes"]["loss"] / changed * 100, 2) if changed else 0.0,
+        "flood_stats": flood_stats,
+        "delta_ndvi_stats": ndvi_stats,
+    }
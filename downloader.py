@@ -0,0 +1,207 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+DOWNLOAD_WORKERS = int(config.get("download_workers", 4))
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 5
+TIMEOUT = (10, 120)  # connect, read (seconds)
+URL_PATTERN = re.compile(r"""(https?://[^'"\s)]+|/[^'"\s)]+\.zip[^'"\s)]*)""")
+
+
+class DownloadError(Exception):
+    pass
+
+
+# Finished downloads are renamed into place under this lock, so concurrent ones never take the same name
+_rename_lock = threading.Lock()
+
+
+# 🍪 Reuse the logged-in browser's cookies over a pooled HTTP session
+def session_from_driver(driver, pool_size=DOWNLOAD_WORKERS):
+    session = requests.Session()
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    try:
+        session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent;")
+    except Exception:
+        pass
+    return pooled_session(session, pool_size)
+
+
+def pooled_session(session=None, pool_size=DOWNLOAD_WORKERS):
+    session = session or requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def collect_cart_downloads(driver):
+    """Product URLs behind the cart's download buttons (href, data-* or onclick), skipping already-downloaded rows."""
+    from selenium.webdriver.common.by import By
+
+    items = []
+    rows = driver.find_elements(By.CSS_SELECTOR, "#cartBody > tr")
+    for index, row in enumerate(rows):
+        for button in row.find_elements(By.XPATH, ".//*[@id='downloadId' or contains(@class, 'btn-success')]"):
+            title = (button.get_attribute("title") or "").lower()
+            if "already downloaded" in title:
+                continue
+            for attribute in ("href", "data-url", "data-href", "onclick"):
+                value = button.get_attribute(attribute) or ""
+                match = URL_PATTERN.search(value)
+                if match:
+                    items.append({"url": urljoin(driver.current_url, match.group(1)), "row": index})
+                    break
+            break
+    return items
+
+
+def _filename_from_response(response, url):
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', disposition)
+    if match:
+        return os.path.basename(unquote(match.group(1)))
+    return os.path.basename(unquote(urlparse(url).path)) or "download.bin"
+
+
+def _verify(path, expected_size=None, expected_sha256=None):
+    size = os.path.getsize(path)
+    if expected_size is not None and size < int(expected_size):
+        raise DownloadError(f"incomplete: {size} of {expected_size} bytes")
+    if expected_size is not None and size != int(expected_size):
+        raise DownloadError(f"size mismatch: {size} != {expected_size}")
+    if expected_sha256:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        if sha.hexdigest() != expected_sha256.lower():
+            raise DownloadError("sha256 mismatch")
+    if path.lower().endswith(".zip") and not zipfile.is_zipfile(path):
+        raise DownloadError("not a valid zip archive")
+
+
+def _same_content(a, b):
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        return all(x == y for x, y in zip(iter(lambda: fa.read(CHUNK_SIZE), b""), iter(lambda: fb.read(CHUNK_SIZE), b"")))
+
+
+def _place(part_path, target_dir, name):
+    """Move a finished .part to target_dir/name; another file of that name gets name_1, name_2, ... instead.
+
+    An identical file already there is kept and the .part dropped.
+    """
+    stem, ext = os.path.splitext(name)
+    with _rename_lock:
+        for n in range(1000):
+            target = os.path.join(target_dir, f"{stem}_{n}{ext}" if n else name)
+            if not os.path.exists(target):
+                os.replace(part_path, target)
+                if n:
+                    print(f"⚠️ {name} already exists with other content; saved as {os.path.basename(target)}")
+                return target
+            if _same_content(part_path, target):
+                os.remove(part_path)
+                return target
+    raise DownloadError(f"no free file name for {name} in {target_dir}")
+
+
+# ⬇️ One file with Range-based resume from <name>.part, size/checksum checks and retries
+def download_file(session, url, target_dir=DATA_DIR, filename=None, expected_size=None,
+                  expected_sha256=None, retries=MAX_RETRIES):
+    """retries is the number of attempts (at least one is always made)."""
+    os.makedirs(target_dir, exist_ok=True)
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    part_path = os.path.join(target_dir, f".{key}.part")
+    attempts = max(1, retries)
+    error = None
+
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing left to fetch: the .part file is already complete
+                    total = offset
+                    name = filename or _filename_from_response(response, url)
+                else:
+                    response.raise_for_status()
+                    name = filename or _filename_from_response(response, url)
+                    if offset and response.status_code != 206:
+                        offset = 0  # server ignored the Range header; start over
+                    length = response.headers.get("Content-Length")
+                    total = offset + int(length) if length is not None else None
+
+                    with open(part_path, "ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+
+            if total is not None and os.path.getsize(part_path) < total:
+                raise DownloadError(f"incomplete: {os.path.getsize(part_path)} of {total} bytes")
+            _verify(part_path, expected_size, expected_sha256)
+
+            target = _place(part_path, target_dir, name)
+            print(f"✅ Downloaded {os.path.basename(target)} ({os.path.getsize(target) / 1e6:.1f} MB)")
+            return target
+
+        except DownloadError as e:
+            if "incomplete" not in str(e) and os.path.exists(part_path):
+                os.remove(part_path)  # corrupt, not just short: don't resume from it
+            error = e
+        except (requests.RequestException, OSError) as e:
+            error = e
+
+        if attempt == attempts:
+            break
+        wait = min(2 ** attempt, 30)
+        print(f"⚠️ {url} attempt {attempt}/{attempts} failed ({error}); retrying in {wait}s")
+        time.sleep(wait)
+
+    raise DownloadError(f"giving up on {url}: {error}")
+
+
+def download_all(session, items, target_dir=DATA_DIR, workers=DOWNLOAD_WORKERS):
+    """Fetch items ({"url", optional "filename"/"size"/"sha256"}) concurrently; returns (paths, failures)."""
+    paths, failures = [], []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(
+                download_file, session, item["url"], target_dir,
+                item.get("filename"), item.get("size"), item.get("sha256")
+            ): item
+            for item in items
+        }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                print(f"❌ Download failed for {item['url']}: {e}")
+                failures.append({**item, "error": str(e)})
+    return paths, failures
+
+
+if __name__ == "__main__":
+    import sys
+    downloaded, failed = download_all(pooled_session(), [{"url": u} for u in sys.argv[1:]])
+    sys.exit(1 if failed else 0)
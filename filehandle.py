@@ -2,9 +2,9 @@ import os
 import re
 import zipfile
 from datetime import datetime, date
-import rasterio
 import numpy as np
-import matplotlib.pyplot as plt
+from sensors import SENSORS, SceneBands, detect_sensor, sensor_for_files
+# rasterio and matplotlib are imported where used: extraction/renaming don't need them
 
 # === UTILS ===
 month_map = {
@@ -14,18 +14,18 @@ month_map = {
 }
 
 def normalize(array):
-    return (array - np.min(array)) / (np.max(array) - np.min(array) + 1e-5)
+    # nan-aware so pixels outside an AOI polygon (NaN) don't blank the whole image
+    return (array - np.nanmin(array)) / (np.nanmax(array) - np.nanmin(array) + 1e-5)
 
 def save_tif(output_path, array, profile):
-    profile.update(dtype='float32', count=1)
-    with rasterio.open(output_path, 'w', **profile) as dst:
-        dst.write(array, 1)
+    # float32, or scaled int16 when index_encoding: int16 (decoded transparently by rasterutil readers)
+    from rasterutil import write_index
+    write_index(output_path, array, profile)
 
-def load_band(path):
-    with rasterio.open(path) as src:
-        data = src.read(1).astype('float32')
-        profile = src.profile
-    return data, profile
+def load_band(path, aoi=None):
+    # Windowed read when an AOI is given: only the pixels around the requested location
+    from rasterutil import read_band
+    return read_band(path, aoi)
 
 def compute_ndvi(nir, red):
     return (nir - red) / (nir + red + 1e-5)
@@ -38,9 +38,26 @@ def compute_mndwi(green, swir):
 
 def generate_composite(r, g, b):
     rgb = np.stack([normalize(r), normalize(g), normalize(b)], axis=-1)
-    return np.clip(rgb, 0, 1)
+    return np.nan_to_num(np.clip(rgb, 0, 1))
 
 # === STAGE 1: Extract ZIP Files ===
+def extract_zip_file(zip_file, target_dir):
+    filename = os.path.basename(zip_file)
+    print(f"🧩 Extracting: {filename}")
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            extract_to = os.path.join(target_dir, os.path.splitext(filename)[0])
+            os.makedirs(extract_to, exist_ok=True)
+            zip_ref.extractall(extract_to)
+            # Lets storage.py evict the extracted bands and re-extract them later
+            from storage import write_source_marker
+            write_source_marker(extract_to, zip_file)
+            print(f"✅ Extracted to: {extract_to}\n")
+            return extract_to
+    except Exception as e:
+        print(f"❌ Failed to extract {filename}: {e}")
+        return None
+
 def extract_today_zip_files(downloads_dir, target_dir):
     os.makedirs(target_dir, exist_ok=True)
     zip_files = []
@@ -59,85 +76,154 @@ def extract_today_zip_files(downloads_dir, target_dir):
 
     print(f"📦 Found {len(zip_files)} zip files downloaded today.\n")
     for zip_file, created_time in zip_files:
-        filename = os.path.basename(zip_file)
-        print(f"🧩 Extracting: {filename}")
-        try:
-            with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                extract_to = os.path.join(target_dir, os.path.splitext(filename)[0])
-                os.makedirs(extract_to, exist_ok=True)
-                zip_ref.extractall(extract_to)
-                print(f"✅ Extracted to: {extract_to}\n")
-        except Exception as e:
-            print(f"❌ Failed to extract {filename}: {e}")
+        extract_zip_file(zip_file, target_dir)
 
 # === STAGE 2: Rename Folders Based on Date ===
+def rename_folder_to_date_format(target_dir, folder):
+    match = re.search(r"([A-Z]{3})(\d{4})(\d{6})", folder)
+    if not match:
+        print(f"⚠️ Skipped (no timestamp pattern found): {folder}")
+        return None
+
+    month_str = match.group(1)
+    year = int(match.group(2))
+    month = month_map.get(month_str.upper(), 1)
+    new_name = f"{year:04d}-{month:02d}-01"
+    src_path = os.path.join(target_dir, folder)
+    dst_path = os.path.join(target_dir, new_name)
+
+    counter = 1
+    while os.path.exists(dst_path):
+        dst_path = os.path.join(target_dir, f"{new_name}_{counter}")
+        counter += 1
+
+    os.rename(src_path, dst_path)
+    print(f"✅ Renamed: {folder} → {os.path.basename(dst_path)}")
+    return dst_path
+
 def rename_folders_to_date_format(target_dir):
     folders = [f for f in os.listdir(target_dir) if os.path.isdir(os.path.join(target_dir, f))]
     for folder in folders:
-        match = re.search(r"([A-Z]{3})(\d{4})(\d{6})", folder)
-        if match:
-            month_str = match.group(1)
-            year = int(match.group(2))
-            month = month_map.get(month_str.upper(), 1)
-            new_name = f"{year:04d}-{month:02d}-01"
-            src_path = os.path.join(target_dir, folder)
-            dst_path = os.path.join(target_dir, new_name)
-
-            counter = 1
-            while os.path.exists(dst_path):
-                dst_path = os.path.join(target_dir, f"{new_name}_{counter}")
-                counter += 1
-
-            os.rename(src_path, dst_path)
-            print(f"✅ Renamed: {folder} → {os.path.basename(dst_path)}")
-        else:
-            print(f"⚠️ Skipped (no timestamp pattern found): {folder}")
+        rename_folder_to_date_format(target_dir, folder)
 
 # === STAGE 3: Process Scene ===
-def process_scene(scene_path):
-    try:
-        print(f"🔍 Processing: {scene_path}")
-        b2_path = os.path.join(scene_path, "BAND2.tif")
-        b3_path = os.path.join(scene_path, "BAND3.tif")
-        b4_path = os.path.join(scene_path, "BAND4.tif")
-        b5_path = os.path.join(scene_path, "BAND5.tif")
+# Product graph: each product names its inputs (band roles from sensors.SENSORS, or other products).
+# Only the products a task needs are computed, and only their bands are read.
+PRODUCTS = {
+    "rgb_composite": {"inputs": ["red", "green", "green"], "png": "RGB_composite.png"},
+    "false_color": {"inputs": ["nir", "red", "green"], "png": "False_color_composite.png"},
+    "ndvi": {"inputs": ["nir", "red"], "compute": compute_ndvi, "tif": "NDVI.tif", "png": "NDVI.png", "cmap": "RdYlGn"},
+    "ndwi": {"inputs": ["green", "nir"], "compute": compute_ndwi, "tif": "NDWI.tif", "png": "NDWI.png", "cmap": "Blues"},
+    "mndwi": {"inputs": ["green", "swir"], "compute": compute_mndwi, "tif": "MNDWI.tif", "png": "MNDWI.png", "cmap": "Blues"},
+}
+ALL_PRODUCTS = list(PRODUCTS)
+
+# analyze() runs flood (NDWI), NDVI change (NDVI) and site suitability (NDVI + NDWI) for every task
+TASK_PRODUCTS = {
+    "flood_risk_mapping": ["ndwi", "ndvi"],
+    "ndvi_change_detection": ["ndvi", "ndwi"],
+    "site_suitability": ["ndvi", "ndwi"],
+}
+
+
+def task_products(task):
+    return TASK_PRODUCTS.get(task, ALL_PRODUCTS)
+
 
-        if not all(os.path.exists(p) for p in [b2_path, b3_path, b4_path, b5_path]):
-            print(f"❌ Skipping {scene_path} (Missing one or more band files)")
+def resolve_products(products):
+    """Requested products plus their product dependencies, dependencies first."""
+    order = []
+
+    def visit(name):
+        if name in order:
             return
+        for dep in PRODUCTS[name]["inputs"]:
+            if dep in PRODUCTS:
+                visit(dep)
+        order.append(name)
 
-        b2, profile = load_band(b2_path)
-        b3, _ = load_band(b3_path)
-        b4, _ = load_band(b4_path)
-        b5, _ = load_band(b5_path)
+    for name in products:
+        visit(name)
+    return order
 
-        output_dir = os.path.join(scene_path, "outputs")
-        os.makedirs(output_dir, exist_ok=True)
 
-        rgb_image = generate_composite(b3, b2, b2)
-        plt.imsave(os.path.join(output_dir, "RGB_composite.png"), rgb_image)
+def product_path(output_dir, name):
+    spec = PRODUCTS[name]
+    return os.path.join(output_dir, spec.get("tif") or spec["png"])
+
 
-        false_color = generate_composite(b4, b3, b2)
-        plt.imsave(os.path.join(output_dir, "False_color_composite.png"), false_color)
+def scene_output_dir(scene_path, aoi=None):
+    output_dir = os.path.join(scene_path, "outputs")
+    if aoi:
+        # Clipped products live next to (never instead of) the full-scene ones
+        from rasterutil import aoi_key
+        output_dir = os.path.join(output_dir, aoi_key(aoi))
+    return output_dir
 
-        ndvi = compute_ndvi(b4, b3)
-        save_tif(os.path.join(output_dir, "NDVI.tif"), ndvi, profile)
-        plt.imsave(os.path.join(output_dir, "NDVI.png"), ndvi, cmap='RdYlGn')
 
-        ndwi = compute_ndwi(b2, b4)
-        save_tif(os.path.join(output_dir, "NDWI.tif"), ndwi, profile)
-        plt.imsave(os.path.join(output_dir, "NDWI.png"), ndwi, cmap='Blues')
+def process_scene(scene_path, aoi=None, products=None):
+    import matplotlib.pyplot as plt
+
+    try:
+        print(f"🔍 Processing: {scene_path}")
+        output_dir = scene_output_dir(scene_path, aoi)
+        wanted = [p for p in resolve_products(products or ALL_PRODUCTS)
+                  if not os.path.exists(product_path(output_dir, p))]
+        if not wanted:
+            print(f"✅ Up to date: {scene_path}\n")
+            return output_dir
+
+        sensor = detect_sensor(scene_path)
+        if not sensor:
+            print(f"❌ Skipping {scene_path} (no known sensor metadata or band files)")
+            return
+
+        roles = sorted({r for p in wanted for r in PRODUCTS[p]["inputs"] if r not in PRODUCTS})
+        bands = SceneBands(scene_path, sensor, aoi)
+        if bands.missing(roles):
+            # Bands evicted by the storage budget come back from the source zip
+            from storage import restore_scene
+            restore_scene(scene_path)
+        if bands.missing(roles):
+            print(f"❌ Skipping {scene_path} (Missing {', '.join(bands.missing(roles))} band for {SENSORS[sensor]['name']})")
+            return
 
-        mndwi = compute_mndwi(b2, b5)
-        save_tif(os.path.join(output_dir, "MNDWI.tif"), mndwi, profile)
-        plt.imsave(os.path.join(output_dir, "MNDWI.png"), mndwi, cmap='Blues')
+        os.makedirs(output_dir, exist_ok=True)
 
-        print(f"✅ Done: {scene_path}\n")
+        # Bands are read when the first product needs them and dropped after the last one has used them
+        data = {}
+        for i, name in enumerate(wanted):
+            spec = PRODUCTS[name]
+            inputs = [data[r] if r in PRODUCTS else bands[r] for r in spec["inputs"]]
+            if "compute" in spec:
+                data[name] = spec["compute"](*inputs)
+                save_tif(os.path.join(output_dir, spec["tif"]), data[name], bands.profile)
+                plt.imsave(os.path.join(output_dir, spec["png"]), data[name], cmap=spec["cmap"])
+            else:
+                plt.imsave(os.path.join(output_dir, spec["png"]), generate_composite(*inputs))
+            del inputs
+            still_needed = {r for p in wanted[i + 1:] for r in PRODUCTS[p]["inputs"]}
+            for role in bands.loaded():
+                if role not in still_needed:
+                    bands.release(role)
+
+        print(f"✅ Done: {scene_path} ({', '.join(wanted)}; read {', '.join(bands.read_roles)} "
+              f"from {SENSORS[sensor]['name']})\n")
+        return output_dir
 
     except Exception as e:
         print(f"⚠️ Error in {scene_path}: {e}")
 
-def process_all_scenes(base_dir):
+
+# 🧩 One product of one scene, computed on first request
+def ensure_product(scene_path, name, aoi=None):
+    output_dir = scene_output_dir(scene_path, aoi)
+    path = product_path(output_dir, name)
+    if not os.path.exists(path):
+        process_scene(scene_path, aoi, products=[name])
+    return path if os.path.exists(path) else None
+
+def process_all_scenes(base_dir, aoi=None, products=None):
     for root, dirs, files in os.walk(base_dir):
-        if any(f.startswith("BAND2") for f in files):
-            process_scene(root)
+        if sensor_for_files(files):
+            process_scene(root, aoi, products)
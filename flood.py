@@ -3,23 +3,16 @@ from rasterio.enums import Resampling
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from rasterutil import array_stats, read_aligned, read_band, write_mask
 
 def generate_flood_extent(ndwi_2024_path, ndwi_2025_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
 
     # Load base raster (2024)
-    with rasterio.open(ndwi_2024_path) as src1:
-        ndwi_1 = src1.read(1)
-        profile = src1.profile
-        ref_shape = ndwi_1.shape
+    ndwi_1, profile = read_band(ndwi_2024_path)
 
-    # Load and resample the 2025 raster to match 2024
-    with rasterio.open(ndwi_2025_path) as src2:
-        ndwi_2 = src2.read(
-            1,
-            out_shape=ref_shape,
-            resampling=Resampling.bilinear
-        )
+    # Load the 2025 raster over the 2024 grid's extent (works for AOI-clipped windows too)
+    ndwi_2 = read_aligned(ndwi_2025_path, profile, Resampling.bilinear)
 
     # Compute NDWI difference
     delta_ndwi = ndwi_2 - ndwi_1
@@ -27,11 +20,13 @@ def generate_flood_extent(ndwi_2024_path, ndwi_2025_path, output_dir):
     # Threshold to create flood mask
     flood_mask = (delta_ndwi > 0.2).astype(np.uint8)
 
-    # Save flood mask as GeoTIFF
-    profile.update(dtype='uint8', count=1)
+    # Class counts over valid pixels (NaN outside an AOI polygon), gathered in the write pass
+    stats = array_stats(flood_mask, valid=np.isfinite(delta_ndwi), class_names=["non_flooded", "flooded"],
+                        hist_range=None)
+
+    # Save flood mask as GeoTIFF (+ flood_mask.tif.stats.json)
     output_tif = os.path.join(output_dir, "flood_mask.tif")
-    with rasterio.open(output_tif, 'w', **profile) as dst:
-        dst.write(flood_mask, 1)
+    write_mask(output_tif, flood_mask, profile, stats)
 
     # Save PNG visual (spatial map)
     output_png = os.path.join(output_dir, "flood_mask.png")
@@ -41,10 +36,10 @@ def generate_flood_extent(ndwi_2024_path, ndwi_2025_path, output_dir):
     plt.savefig(output_png, bbox_inches='tight', dpi=300)
     plt.close()
 
-    # Compute summary statistics
-    total_pixels = flood_mask.size
-    flooded_pixels = int(np.sum(flood_mask))
-    non_flooded_pixels = int(total_pixels - flooded_pixels)
+    # Summary statistics straight from the class counts
+    flooded_pixels = stats["classes"]["flooded"]
+    non_flooded_pixels = stats["classes"]["non_flooded"]
+    total_pixels = stats["valid_pixels"] or flood_mask.size
 
     flooded_percent = round((flooded_pixels / total_pixels) * 100, 2)
     non_flooded_percent = round(100 - flooded_percent, 2)
@@ -69,5 +64,6 @@ def generate_flood_extent(ndwi_2024_path, ndwi_2025_path, output_dir):
         "non_flooded_percent": non_flooded_percent,
         "flood_mask_tif": output_tif,
         "flood_map_png": output_png,
-        "flood_stats_png": stats_png
+        "flood_stats_png": stats_png,
+        "flood_mask_stats": stats
     }
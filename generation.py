@@ -14,28 +14,72 @@ def find_file_recursive(folder, filename_substring):
     matches = glob.glob(os.path.join(folder, '**', f'*{filename_substring}*'), recursive=True)
     return matches[0] if matches else None
 
-def analyze(data_root_path: str):
+def find_scene_output(folder, filename, subdir=None):
+    """Exact-name product of a scene: inside outputs/<subdir> for an AOI, else outside any aoi_* folder."""
+    from rasterutil import AOI_DIR_PREFIX
+
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        parent = os.path.basename(root)
+        in_aoi_dir = parent.startswith(AOI_DIR_PREFIX)
+        if filename in files and (parent == subdir if subdir else not in_aoi_dir):
+            return os.path.join(root, filename)
+    return None
+
+def scene_products(date_folder, aoi=None):
+    """(NDWI, NDVI) paths of a scene, computed on first use (from band windows when an AOI is given)."""
+    from filehandle import process_scene
+    from storage import is_scene_folder
+
+    key = None
+    if aoi:
+        from rasterutil import aoi_key
+        key = aoi_key(aoi)
+
+    ndwi_path = find_scene_output(date_folder, "NDWI.tif", key)
+    ndvi_path = find_scene_output(date_folder, "NDVI.tif", key)
+    if not ndwi_path or not ndvi_path:
+        for root, dirs, files in os.walk(date_folder):
+            if is_scene_folder(files):
+                process_scene(root, aoi, products=["ndwi", "ndvi"])
+        ndwi_path = find_scene_output(date_folder, "NDWI.tif", key)
+        ndvi_path = find_scene_output(date_folder, "NDVI.tif", key)
+    return ndwi_path, ndvi_path
+
+def analyze(data_root_path: str, scene_pair=None, output_root=None, aoi=None):
     data_root = Path(data_root_path)
-    output_dir = data_root / "flood_extent"
-    site_suitability_output = data_root / "site_suitability_outputs"
+    # Outputs go to a job workspace when given, else the shared data_dir folders
+    output_base = Path(output_root) if output_root else data_root
+    output_dir = output_base / "flood_extent"
+    site_suitability_output = output_base / "site_suitability_outputs"
 
     results = {
         "flood": None,
         "ndvi_change": None,
-        "site_suitability": None
+        "site_suitability": None,
+        "aoi": aoi
     }
 
-    # Step 1: Scan and collect valid folders
+    # Step 1: Scan and collect valid folders (only the indexed pair when one was selected)
+    if scene_pair:
+        candidate_folders = [Path(scene_pair["before"]["folder"]), Path(scene_pair["after"]["folder"])]
+    else:
+        candidate_folders = list(data_root.iterdir())
+
     valid_folders = []
-    for date_folder in data_root.iterdir():
+    for date_folder in candidate_folders:
         if not date_folder.is_dir():
             continue
         date = parse_date(date_folder.name)
+        if scene_pair:
+            # Order by real acquisition time rather than the folder name
+            role = "before" if date_folder == candidate_folders[0] else "after"
+            date = datetime.fromisoformat(scene_pair[role]["acquisition_time"])
         if not date:
             continue
 
-        ndwi_path = find_file_recursive(str(date_folder), "NDWI.tif")
-        ndvi_path = find_file_recursive(str(date_folder), "NDVI.tif")
+        # With an AOI (see rasterutil.aoi_from_task) only the window around the location is read
+        ndwi_path, ndvi_path = scene_products(str(date_folder), aoi)
 
         valid_folders.append({
             "date": date,
@@ -77,6 +121,13 @@ def analyze(data_root_path: str):
 
     results["flood"] = flood_stats
 
+    # Index statistics of both scenes from the stats written with each product (no pixel reads)
+    from rasterutil import read_stats, stats_summary
+    results["index_stats"] = {
+        role: {name: stats_summary(read_stats(folder[name])) for name in ("ndwi", "ndvi")}
+        for role, folder in (("before", start), ("after", end))
+    }
+
     # Step 4: NDVI change detection
     import ndvi_change
     importlib.reload(ndvi_change)
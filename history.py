@@ -0,0 +1,247 @@
+"""Indexed history of completed runs, so repeated AOI/date requests reuse earlier work.
+
+Every finished job records its kind, task, AOI bounds, date range, before/after scenes and
+whether it searched the portal (request_history in the job database). A new request is
+matched against it:
+
+- AOI and dates covered by earlier runs that downloaded → no portal download
+- dates only partly covered → only the uncovered part of the range is downloaded
+- same job kind, task, AOI and before/after scenes → the earlier results are reused as-is
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+from settings import load_config
+from jobqueue import JOB_DB, DONE, _db, _now
+
+# ✅ Load config
+config = load_config()
+
+REQUEST_REUSE = bool(config.get("request_reuse", True))
+ISO_DATE = "%Y-%m-%d"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_history (
+    job_id        TEXT PRIMARY KEY,
+    kind          TEXT,
+    task          TEXT,
+    location      TEXT,
+    west          REAL NOT NULL,
+    south         REAL NOT NULL,
+    east          REAL NOT NULL,
+    north         REAL NOT NULL,
+    start_date    TEXT NOT NULL,
+    end_date      TEXT NOT NULL,
+    aoi_key       TEXT,
+    before_folder TEXT,
+    after_folder  TEXT,
+    downloaded    INTEGER NOT NULL DEFAULT 0,
+    completed_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS request_history_dates ON request_history (downloaded, start_date, end_date);
+CREATE INDEX IF NOT EXISTS request_history_bounds ON request_history (west, south, east, north);
+CREATE INDEX IF NOT EXISTS request_history_runs ON request_history (kind, task, aoi_key, before_folder, after_folder);
+"""
+
+_initialized = set()
+
+
+def init_history(db_path=JOB_DB):
+    """Create the table; on first use, index the runs already finished in the jobs table."""
+    if db_path in _initialized:
+        return
+    from jobqueue import init_db
+    init_db(db_path)
+    with _db(db_path) as conn:
+        # Under the write lock, so only the process that creates (or rebuilds) the table backfills it
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(request_history)")}
+        if columns and "downloaded" not in columns:
+            # Built before kind/downloaded were recorded: rebuild it from the jobs table
+            conn.execute("DROP TABLE request_history")
+        for statement in filter(str.strip, SCHEMA.split(";")):
+            conn.execute(statement)
+        done = [] if "downloaded" in columns else conn.execute(
+            "SELECT id, kind, payload, result, updated_at FROM jobs WHERE status = ? AND result IS NOT NULL", (DONE,)
+        ).fetchall()
+        conn.execute("COMMIT")
+    _initialized.add(db_path)
+
+    backfilled = 0
+    for row in done:
+        try:
+            results, payload = json.loads(row["result"]), json.loads(row["payload"])
+        except ValueError:
+            continue
+        # Runs from before the flag: workflows always downloaded, AOI jobs unless submitted with download off
+        results.setdefault("downloaded", row["kind"] == "workflow" or bool(payload.get("download", True)))
+        backfilled += record_run(row["id"], results, row["kind"], db_path, row["updated_at"])
+    if backfilled:
+        print(f"📚 Request history: indexed {backfilled} earlier runs")
+
+
+def iso_date(value):
+    """Any task date phrasing → YYYY-MM-DD (sortable in SQL); None if unparseable."""
+    from taskparser import normalize_date, DATE_FORMAT
+    value = normalize_date(value)
+    return datetime.strptime(value, DATE_FORMAT).strftime(ISO_DATE) if value else None
+
+
+def request_bounds(info, aoi):
+    """AOI bounds, or the requested point for full-scene runs."""
+    if aoi:
+        return [float(v) for v in aoi["bounds"]]
+    if info.get("latitude") is None or info.get("longitude") is None:
+        return None
+    lat, lon = float(info["latitude"]), float(info["longitude"])
+    return [lon, lat, lon, lat]
+
+
+# 📝 Index one completed run (called by the job worker after finish_job)
+def record_run(job_id, results, kind=None, db_path=JOB_DB, completed_at=None):
+    """Returns 1 when the run was indexed, 0 when it lacks a task, dates or location.
+
+    Its AOI/dates only count as fetched when results["downloaded"] is set (the job searched the portal).
+    """
+    init_history(db_path)
+    from rasterutil import aoi_key
+
+    results = results or {}
+    info = results.get("task") or {}
+    aoi = results.get("aoi")
+    bounds = request_bounds(info, aoi)
+    start, end = iso_date(info.get("start_date")), iso_date(info.get("end_date"))
+    if not bounds or not start or not end:
+        return 0
+
+    scenes = results.get("scenes") or {}
+    with _db(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO request_history (job_id, kind, task, location, west, south, east, north, "
+            "start_date, end_date, aoi_key, before_folder, after_folder, downloaded, completed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, info.get("task"), info.get("location"), *bounds, start, end, aoi_key(aoi),
+             (scenes.get("before") or {}).get("folder"), (scenes.get("after") or {}).get("folder"),
+             int(bool(results.get("downloaded"))), completed_at or _now())
+        )
+    return 1
+
+
+def covering_runs(bounds, start, end, db_path=JOB_DB):
+    """Earlier downloading runs whose area contains these bounds and whose dates overlap start..end (ISO dates)."""
+    init_history(db_path)
+    west, south, east, north = bounds
+    with _db(db_path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM request_history WHERE downloaded = 1 AND west <= ? AND south <= ? AND east >= ? "
+            "AND north >= ? AND start_date <= ? AND end_date >= ? ORDER BY completed_at DESC",
+            (west, south, east, north, end, start)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def missing_ranges(start, end, runs):
+    """Parts of start..end (ISO dates, inclusive) not searched by any of the runs.
+
+    A run only covers dates up to the day it completed: the portal may have newer scenes since.
+    """
+    covered = []
+    for run in runs:
+        run_end = min(run["end_date"], run["completed_at"][:10])
+        if run["start_date"] <= run_end:
+            covered.append((run["start_date"], run_end))
+
+    day = timedelta(days=1)
+    gaps, cursor = [], datetime.strptime(start, ISO_DATE)
+    stop = datetime.strptime(end, ISO_DATE)
+    for run_start, run_end in sorted(covered):
+        run_start, run_end = datetime.strptime(run_start, ISO_DATE), datetime.strptime(run_end, ISO_DATE)
+        if run_start > cursor:
+            gaps.append((cursor, min(run_start - day, stop)))
+        cursor = max(cursor, run_end + day)
+        if cursor > stop:
+            break
+    if cursor <= stop:
+        gaps.append((cursor, stop))
+    return [(a.strftime(ISO_DATE), b.strftime(ISO_DATE)) for a, b in gaps if a <= b]
+
+
+# 🧭 What still has to be downloaded for this request: the task info (dates narrowed to the gap) or None
+def plan_download(info, db_path=JOB_DB):
+    from rasterutil import aoi_from_task
+    from taskparser import DATE_FORMAT
+
+    bounds = request_bounds(info, aoi_from_task(info))
+    start, end = iso_date(info.get("start_date")), iso_date(info.get("end_date"))
+    if not bounds or not start or not end:
+        return info
+
+    runs = covering_runs(bounds, start, end, db_path)
+    gaps = missing_ranges(start, end, runs)
+    if not gaps:
+        print(f"♻️ {info.get('location')} {start} → {end} already fetched by run {runs[0]['job_id']}, skipping download")
+        return None
+    if gaps == [(start, end)]:
+        return info
+
+    # One portal search over the uncovered span (gaps between covered ranges are searched together)
+    gap_start, gap_end = gaps[0][0], gaps[-1][1]
+    print(f"♻️ {info.get('location')}: {len(runs)} earlier runs cover part of {start} → {end}, "
+          f"downloading only {gap_start} → {gap_end}")
+    return {
+        **info,
+        "start_date": datetime.strptime(gap_start, ISO_DATE).strftime(DATE_FORMAT),
+        "end_date": datetime.strptime(gap_end, ISO_DATE).strftime(DATE_FORMAT),
+    }
+
+
+def _artifacts_present(job_id):
+    from workspace import load_manifest
+    manifest = load_manifest(job_id)
+    return manifest is not None and all(os.path.exists(a["path"]) for a in manifest["artifacts"].values())
+
+
+def find_reusable_run(kind, info, aoi, scene_pair, db_path=JOB_DB):
+    """Latest completed job of this kind, task, AOI and before/after scenes, with its outputs on disk.
+
+    The kind must match: an "aoi" batch job has no LLM report for a "workflow" job to reuse.
+    """
+    init_history(db_path)
+    from jobqueue import get_job
+    from rasterutil import aoi_key
+
+    if not scene_pair:
+        return None
+    key = aoi_key(aoi)
+    bounds = request_bounds(info, aoi)
+    with _db(db_path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM request_history WHERE kind = ? AND task IS ? AND aoi_key IS ? AND before_folder = ? "
+            "AND after_folder = ? ORDER BY completed_at DESC",
+            (kind, info.get("task"), key, scene_pair["before"]["folder"], scene_pair["after"]["folder"])
+        ).fetchall()
+    for row in rows:
+        # Full-scene runs have no AOI key: the requested point must match too
+        if not key and [row["west"], row["south"], row["east"], row["north"]] != bounds:
+            continue
+        job = get_job(row["job_id"], db_path)
+        if job and job["kind"] == kind and job["status"] == DONE and job["result"] and _artifacts_present(row["job_id"]):
+            return job
+    return None
+
+
+# ♻️ Results of an identical earlier run, re-issued under this job (its stored blobs are shared, not copied)
+def reuse_results(job_id, kind, info, aoi, scene_pair, db_path=JOB_DB):
+    from workspace import link_workspace
+
+    source = find_reusable_run(kind, info, aoi, scene_pair, db_path)
+    if not source:
+        return None
+    link_workspace(job_id, source["id"])
+    results = dict(source["result"])
+    results["task"] = info
+    results["job_id"] = job_id
+    results["reused_from"] = source["id"]
+    print(f"♻️ Same task, AOI and scenes as run {source['id']}: reusing its results")
+    return results
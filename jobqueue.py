@@ -0,0 +1,467 @@
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+JOB_DB = config.get("job_db", "./jobs.sqlite")
+MAX_CONCURRENT_JOBS = int(config.get("max_concurrent_jobs", 2))
+JOB_MEMORY_MB = int(config.get("job_memory_mb", 1536))
+POLL_INTERVAL = 1.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    stage       TEXT,
+    progress    REAL DEFAULT 0,
+    message     TEXT,
+    result      TEXT,
+    error       TEXT,
+    worker_pid  INTEGER,
+    created_at  TEXT NOT NULL,
+    updated_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS locks (
+    name        TEXT PRIMARY KEY,
+    holder_pid  INTEGER NOT NULL,
+    acquired_at TEXT NOT NULL
+);
+"""
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def _connect(db_path=JOB_DB):
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+@contextmanager
+def _db(db_path=JOB_DB):
+    conn = _connect(db_path)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def init_db(db_path=JOB_DB):
+    with _db(db_path) as conn:
+        conn.executescript(SCHEMA)
+        # Under the write lock: workers starting together must not both add the column
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "batch_id" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id)")
+        conn.execute("COMMIT")
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+# 📨 Queue a job and return its id immediately
+def submit_job(kind, payload, db_path=JOB_DB, batch_id=None):
+    init_db(db_path)
+    job_id = uuid.uuid4().hex[:12]
+    now = _now()
+    with _db(db_path) as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, payload, status, stage, progress, batch_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), QUEUED, QUEUED, batch_id, now, now)
+        )
+    print(f"📨 Job {job_id} queued ({kind})")
+    return job_id
+
+
+def get_job(job_id, db_path=JOB_DB):
+    init_db(db_path)
+    with _db(db_path) as conn:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def list_jobs(limit=50, db_path=JOB_DB):
+    init_db(db_path)
+    with _db(db_path) as conn:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_job(r) for r in rows]
+
+
+def list_batch_jobs(batch_id, db_path=JOB_DB):
+    init_db(db_path)
+    with _db(db_path) as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at", (batch_id,)).fetchall()
+    return [_row_to_job(r) for r in rows]
+
+
+# Fair share: the queued job whose group (its batch, or the job itself) has the fewest running jobs,
+# oldest first, so a large batch never starves single UI requests or other batches
+FAIR_NEXT_JOB = """
+SELECT j.* FROM jobs j
+LEFT JOIN (
+    SELECT COALESCE(batch_id, id) AS grp, COUNT(*) AS running FROM jobs WHERE status = :running GROUP BY grp
+) r ON r.grp = COALESCE(j.batch_id, j.id)
+WHERE j.status = :queued AND (:batch_id IS NULL OR j.batch_id = :batch_id)
+ORDER BY COALESCE(r.running, 0), j.created_at
+LIMIT 1
+"""
+
+
+def claim_next_job(db_path=JOB_DB, batch_id=None, max_running=MAX_CONCURRENT_JOBS):
+    """Next fair-share job (only this batch's when batch_id is given), or None.
+
+    None too while max_running jobs already run, counted across every worker pool on this database.
+    """
+    conn = _connect(db_path)
+    try:
+        # BEGIN IMMEDIATE takes the write lock, so two workers can't claim the same row
+        conn.execute("BEGIN IMMEDIATE")
+        running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+        row = None if running >= max_running else conn.execute(
+            FAIR_NEXT_JOB, {"running": RUNNING, "queued": QUEUED, "batch_id": batch_id}
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, worker_pid = ?, updated_at = ? WHERE id = ?",
+            (RUNNING, "starting", os.getpid(), _now(), row["id"])
+        )
+        conn.execute("COMMIT")
+        job = _row_to_job(row)
+        job["status"] = RUNNING
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def report_progress(job_id, stage, progress, message="", db_path=JOB_DB):
+    with _db(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET stage = ?, progress = ?, message = ?, updated_at = ? WHERE id = ?",
+            (stage, float(progress), message, _now(), job_id)
+        )
+    print(f"⏳ Job {job_id}: {stage} ({int(progress * 100)}%) {message}")
+
+
+def report_partial_result(job_id, result, db_path=JOB_DB):
+    """Interim result (e.g. a low-resolution preview) visible to pollers while the job keeps running."""
+    with _db(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET result = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(result, default=str), _now(), job_id)
+        )
+
+
+def finish_job(job_id, result, db_path=JOB_DB):
+    with _db(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, progress = 1, result = ?, updated_at = ? WHERE id = ?",
+            (DONE, DONE, json.dumps(result, default=str), _now(), job_id)
+        )
+
+
+def fail_job(job_id, error, db_path=JOB_DB):
+    with _db(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, error = ?, updated_at = ? WHERE id = ?",
+            (FAILED, FAILED, error, _now(), job_id)
+        )
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume it is still alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def requeue_orphaned_jobs(db_path=JOB_DB):
+    """Put jobs whose worker process died back in the queue."""
+    init_db(db_path)
+    with _db(db_path) as conn:
+        rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        for row in rows:
+            if not _pid_alive(row["worker_pid"]):
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = ?, progress = 0, worker_pid = NULL, updated_at = ? WHERE id = ?",
+                    (QUEUED, QUEUED, _now(), row["id"])
+                )
+                print(f"♻️ Requeued orphaned job {row['id']}")
+
+
+def running_job_count(db_path=JOB_DB):
+    with _db(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+
+
+def memory_available_mb():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().available / (1024 * 1024)
+
+
+def admit_job(db_path=JOB_DB, required_mb=JOB_MEMORY_MB):
+    """Only claim another job when roughly job_memory_mb of RAM is free (always when nothing is running)."""
+    available = memory_available_mb()
+    if available is None or available >= required_mb:
+        return True
+    return running_job_count(db_path) == 0
+
+
+# 🔒 Cross-process mutex in the job database (stale holders are taken over)
+@contextmanager
+def stage_lock(name, db_path=JOB_DB, poll_interval=POLL_INTERVAL):
+    init_db(db_path)
+    pid = os.getpid()
+    waited = False
+    while True:
+        with _db(db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT holder_pid FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is None or row["holder_pid"] == pid or not _pid_alive(row["holder_pid"]):
+                conn.execute(
+                    "INSERT OR REPLACE INTO locks (name, holder_pid, acquired_at) VALUES (?, ?, ?)",
+                    (name, pid, _now())
+                )
+                conn.execute("COMMIT")
+                break
+            conn.execute("COMMIT")
+        if not waited:
+            print(f"⏸️ Worker {pid} waiting for the {name} stage")
+            waited = True
+        time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        with _db(db_path) as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND holder_pid = ?", (name, pid))
+
+
+# ⚡ Coarse first pass: approximate numbers + preview maps are published before the full run
+def publish_preview(job_id, scene_pair, aoi, work_dir, info, db_path=JOB_DB):
+    if not scene_pair:
+        return None
+    try:
+        from preview import preview_analysis
+        preview = preview_analysis(scene_pair, aoi, output_dir=work_dir)
+    except Exception as e:
+        print(f"⚠️ Preview skipped: {e}")
+        return None
+    report_partial_result(job_id, {"preview": preview, "task": info}, db_path=db_path)
+    report_progress(job_id, "refining", 0.65, "preview ready, computing full resolution", db_path=db_path)
+    return preview
+
+
+def attach_preview(results, preview):
+    if preview:
+        from preview import preview_error
+        results["preview"] = preview
+        results["preview_error"] = preview_error(preview, results)
+
+
+# 🌊 Full GIS workflow as a job: parse → download/ingest → analysis → LLM report
+def run_workflow_job(job_id, payload, db_path=JOB_DB):
+    from user import process_user_prompt, fetch_task_scenes
+    from sceneindex import select_scene_pair_for_task
+    from outputllm import run_llm_pipeline
+    from rasterutil import aoi_from_task
+    from history import REQUEST_REUSE, reuse_results
+    from workspace import create_workspace, commit_workspace, rewrite_artifact_paths
+
+    data_dir = config["data_dir"]
+    work_dir = create_workspace(job_id)
+
+    def progress(stage, fraction, message=""):
+        report_progress(job_id, stage, fraction, message, db_path=db_path)
+
+    # One portal account and one downloads folder: ingest stages run one at a time across workers
+    with stage_lock("ingest", db_path):
+        info = process_user_prompt(payload["prompt"], progress=progress, download=False)
+        if not info:
+            raise RuntimeError("Could not process the request prompt")
+        downloaded = fetch_task_scenes(info, progress=progress, db_path=db_path)
+
+    progress("scene_selection", 0.6)
+    scene_pair = select_scene_pair_for_task(data_dir, info)
+    # A fallback to scenes outside the requested dates does not cover them (a later run searches again)
+    downloaded = downloaded and bool(scene_pair) and not scene_pair["out_of_range"]
+    aoi = aoi_from_task(info)
+    reused = reuse_results(job_id, "workflow", info, aoi, scene_pair, db_path) if REQUEST_REUSE else None
+    if reused:
+        reused["downloaded"] = downloaded
+        return reused
+    preview = publish_preview(job_id, scene_pair, aoi, work_dir, info, db_path)
+
+    results = run_llm_pipeline(data_dir, scene_pair=scene_pair, progress=progress, output_dir=work_dir, aoi=aoi)
+    attach_preview(results, preview)
+
+    progress("storing", 0.95)
+    commit_workspace(job_id)
+    results = rewrite_artifact_paths(results, job_id)
+    results["task"] = info
+    results["job_id"] = job_id
+    results["downloaded"] = downloaded
+    return results
+
+
+# 🗺️ One AOI of a batch: download/ingest (optional) → scene selection → analysis, no LLM report
+def run_aoi_job(job_id, payload, db_path=JOB_DB):
+    from sceneindex import select_scene_pair_for_task, scene_results
+    from generation import analyze
+    from rasterutil import aoi_from_task
+    from history import REQUEST_REUSE, reuse_results
+    from workspace import create_workspace, commit_workspace, rewrite_artifact_paths
+
+    data_dir = config["data_dir"]
+    info = payload["aoi"]
+    work_dir = create_workspace(job_id)
+
+    def progress(stage, fraction, message=""):
+        report_progress(job_id, stage, fraction, message, db_path=db_path)
+
+    # Only runs that searched the portal count as having fetched their AOI/dates (see history.record_run)
+    downloaded = False
+    if payload.get("download", True):
+        from user import fetch_task_scenes
+        progress("waiting_for_ingest", 0.05)
+        with stage_lock("ingest", db_path):
+            downloaded = fetch_task_scenes(info, progress=progress, db_path=db_path)
+
+    progress("scene_selection", 0.6)
+    scene_pair = select_scene_pair_for_task(data_dir, info)
+    if not scene_pair:
+        raise RuntimeError(f"No before/after scene pair covers {info.get('location') or 'this AOI'}")
+    downloaded = downloaded and not scene_pair["out_of_range"]
+
+    aoi = aoi_from_task(info)
+    reused = reuse_results(job_id, "aoi", info, aoi, scene_pair, db_path) if REQUEST_REUSE else None
+    if reused:
+        reused["downloaded"] = downloaded
+        return reused
+    preview = publish_preview(job_id, scene_pair, aoi, work_dir, info, db_path)
+
+    progress("analysis", 0.7)
+    results = analyze(data_dir, scene_pair=scene_pair, output_root=work_dir, aoi=aoi)
+    attach_preview(results, preview)
+
+    progress("storing", 0.95)
+    commit_workspace(job_id)
+    results = rewrite_artifact_paths(results, job_id)
+    results.update(scene_results(scene_pair))
+    results["task"] = info
+    results["job_id"] = job_id
+    results["downloaded"] = downloaded
+    return results
+
+
+JOB_HANDLERS = {
+    "workflow": run_workflow_job,
+    "aoi": run_aoi_job,
+}
+
+
+def worker_main(db_path=JOB_DB, poll_interval=POLL_INTERVAL, batch_id=None, stop=None):
+    """Claim and run jobs until stop (a multiprocessing.Event) is set; a running job is always finished first."""
+    from history import record_run
+    init_db(db_path)
+    if stop is not None:
+        # The owner shuts this worker down through stop: Ctrl+C in its terminal must not abort a job midway
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f"👷 Job worker {os.getpid()} started" + (f" for {batch_id}" if batch_id else ""))
+    while stop is None or not stop.is_set():
+        if not admit_job(db_path):
+            time.sleep(poll_interval)
+            continue
+        job = claim_next_job(db_path, batch_id=batch_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"🚀 Worker {os.getpid()} running job {job['id']} ({job['kind']})")
+        try:
+            handler = JOB_HANDLERS[job["kind"]]
+            result = handler(job["id"], job["payload"], db_path=db_path)
+            finish_job(job["id"], result, db_path=db_path)
+            print(f"✅ Job {job['id']} done")
+            try:
+                record_run(job["id"], result, kind=job["kind"], db_path=db_path)
+            except Exception as e:
+                print(f"⚠️ Job {job['id']} not added to the request history: {e}")
+        except Exception as e:
+            traceback.print_exc()
+            fail_job(job["id"], f"{type(e).__name__}: {e}", db_path=db_path)
+            print(f"❌ Job {job['id']} failed: {e}")
+    print(f"👋 Job worker {os.getpid()} stopped")
+
+
+# 👷 One worker process per concurrency slot (batch_id: only that batch's jobs; stop: see stop_workers)
+def start_workers(count=MAX_CONCURRENT_JOBS, db_path=JOB_DB, batch_id=None, stop=None):
+    init_db(db_path)
+    requeue_orphaned_jobs(db_path)
+    workers = []
+    for _ in range(count):
+        process = multiprocessing.Process(
+            target=worker_main, args=(db_path, POLL_INTERVAL, batch_id, stop), daemon=True
+        )
+        process.start()
+        workers.append(process)
+    return workers
+
+
+# 🛑 Let workers started with this stop event finish their current job, then exit
+def stop_workers(workers, stop):
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    for worker in start_workers():
+        worker.join()
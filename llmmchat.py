@@ -1,4 +1,7 @@
 import subprocess
+import re
+
+from llmqueue import run_scheduled, PRIORITY_CHAT
 
 SYSTEM_PROMPT = """
 You are a geospatial reasoning expert.
@@ -16,24 +19,141 @@ Always stay in this domain context.
 Do not produce extra explanations unless asked.
 """
 
+MODEL = "llama3:8b"
+
+# Token budgets (approximate, ~4 characters per token)
+CHAT_TOKEN_BUDGET = 2048      # max prompt size when the KV context can't be reused
+SUMMARY_TOKEN_BUDGET = 256    # share of the budget kept for the rolling summary
+MAX_CONTEXT_TOKENS = 6144     # drop the reused KV context before llama3's 8k window overflows
+TURN_SUMMARY_CHARS = 160
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _first_sentence(text, limit=TURN_SUMMARY_CHARS):
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit - 3] + "..."
+
+
+def summarize_turn(user_message, assistant_message):
+    return f"Q: {_first_sentence(user_message)} A: {_first_sentence(assistant_message)}"
+
+
+# 🧮 Build the turn window that fits CHAT_TOKEN_BUDGET: newest turns verbatim, older ones summarized
+def build_window(user_message, conversation_history, system_prompt=SYSTEM_PROMPT):
+    tail = f"User: {user_message}\nAssistant:"
+    budget = CHAT_TOKEN_BUDGET - estimate_tokens(system_prompt) - estimate_tokens(tail)
+
+    recent = []
+    for turn in reversed(conversation_history):
+        text = f"User: {turn['user']}\nAssistant: {turn['assistant']}\n"
+        cost = estimate_tokens(text)
+        if cost > budget - SUMMARY_TOKEN_BUDGET and recent:
+            break
+        recent.insert(0, text)
+        budget -= cost
+
+    older = conversation_history[:len(conversation_history) - len(recent)]
+    summary_lines = []
+    summary_budget = min(SUMMARY_TOKEN_BUDGET, max(budget, 0))
+    for turn in reversed(older):
+        line = turn.get("summary") or summarize_turn(turn["user"], turn["assistant"])
+        cost = estimate_tokens(line)
+        if cost > summary_budget:
+            break
+        summary_lines.insert(0, line)
+        summary_budget -= cost
+
+    window = ""
+    if summary_lines:
+        window += "Summary of earlier conversation:\n" + "\n".join(summary_lines) + "\n\n"
+    window += "".join(recent)
+    window += tail
+    return window
+
+
+def build_prompt(user_message, conversation_history, system_prompt=SYSTEM_PROMPT):
+    return system_prompt + "\n" + build_window(user_message, conversation_history, system_prompt)
+
+
+def _run_ollama_cli(prompt):
+    def generate():
+        process = subprocess.run(
+            ["ollama", "run", MODEL],
+            input=prompt.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return process.stdout.decode("utf-8").strip()
+
+    return run_scheduled({"api": "cli", "model": MODEL, "prompt": prompt}, generate, PRIORITY_CHAT)
+
+
+# ♻️ Continue from the KV context Ollama returned for the previous turn
+def _run_ollama_with_context(prompt, context, system_prompt):
+    try:
+        import ollama
+    except ImportError:
+        return None, None
+
+    try:
+        kwargs = {"model": MODEL, "prompt": prompt}
+        if context:
+            kwargs["context"] = context
+        else:
+            kwargs["system"] = system_prompt
+        def generate():
+            result = ollama.generate(**kwargs)
+            return {"response": result["response"], "context": list(result.get("context") or [])}
+
+        # Chat turns go ahead of queued workflow reports on the shared model
+        response = run_scheduled({"api": "generate", **kwargs}, generate, PRIORITY_CHAT)
+        return response["response"].strip(), response.get("context")
+    except Exception as e:
+        print(f"⚠️ Ollama context reuse failed, falling back to windowed prompt: {e}")
+        return None, None
+
+
 # This function handles one LLM turn:
-def run_llm_chat(user_message, conversation_history):
-    # Build the prompt with system context and previous turns
-    prompt = SYSTEM_PROMPT + "\n"
+# facts: retrieved analysis snippets for this question (chatcontext.build_chat_context), sent in this turn's
+# user message only; the history keeps the bare question. results_key identifies the analysis the facts were
+# retrieved from (e.g. its job id). The reused context is continued while it is unchanged, whatever facts each
+# question retrieves; results from another analysis start a fresh context from the budgeted window.
+def run_llm_chat(user_message, conversation_history, system_prompt=SYSTEM_PROMPT, facts="", results_key=None):
+    message = f"{facts}\nQuestion: {user_message}" if facts else user_message
+    last_turn = conversation_history[-1] if conversation_history else {}
+    last_context = last_turn.get("context")
+    if last_context and last_turn.get("results_key") != results_key:
+        last_context = None
+    if last_context and len(last_context) + estimate_tokens(message) > MAX_CONTEXT_TOKENS:
+        last_context = None
 
-    for turn in conversation_history:
-        prompt += f"User: {turn['user']}\nAssistant: {turn['assistant']}\n"
+    if last_context:
+        # Earlier turns already live in the reused context: only this turn's facts and question are sent
+        output, context = _run_ollama_with_context(message, last_context, system_prompt)
+    else:
+        # Fresh (or reset) context: prime it with the budgeted window + summary
+        window = build_window(message, conversation_history, system_prompt)
+        output, context = _run_ollama_with_context(window, None, system_prompt)
 
-    prompt += f"User: {user_message}\nAssistant:"
+    if output is None:
+        output = _run_ollama_cli(build_prompt(message, conversation_history, system_prompt))
+        context = None
 
-    # Call Ollama
-    process = subprocess.run(
-        ["ollama", "run", "llama3:8b"],
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
+    # Keep only the newest context (and the results it belongs to) so session state stays small
+    for turn in conversation_history:
+        turn.pop("context", None)
+        turn.pop("results_key", None)
 
-    output = process.stdout.decode("utf-8").strip()
-    conversation_history.append({"user": user_message, "assistant": output})
+    conversation_history.append({
+        "user": user_message,
+        "assistant": output,
+        "summary": summarize_turn(user_message, output),
+        "context": context,
+        "results_key": results_key,
+    })
     return output, conversation_history
@@ -0,0 +1,313 @@
+"""One queue in front of the local llama3 for every process (Streamlit sessions and job workers).
+
+Requests wait in the job database ordered by priority, then arrival. At most
+llm_max_concurrency generations run at once. A request whose prompt is already
+queued or running is not sent again: it waits for that generation's result.
+
+Each request's owner (process + thread) keeps a heartbeat on its row while it waits
+or generates. Rows whose owner exited or stopped beating (a Streamlit script stop,
+a killed worker) are failed by the next caller, so the queue never stalls.
+
+    from llmqueue import run_scheduled, PRIORITY_CHAT
+    output = run_scheduled({"model": MODEL, "prompt": prompt}, lambda: generate(prompt), PRIORITY_CHAT)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from settings import load_config
+from jobqueue import JOB_DB, _db, _now, _pid_alive
+
+# ✅ Load config
+config = load_config()
+
+LLM_MAX_CONCURRENCY = int(config.get("llm_max_concurrency", 1))
+LLM_QUEUE_TIMEOUT = float(config.get("llm_queue_timeout_s", 600))  # max wait for a slot or a shared result
+POLL_INTERVAL = 0.1
+HEARTBEAT_INTERVAL = 2.0
+STALE_AFTER = timedelta(seconds=30)  # a live owner beats every HEARTBEAT_INTERVAL
+METRICS_WINDOW = timedelta(hours=1)
+KEEP_FINISHED = timedelta(days=1)
+
+# Lower runs first: someone is waiting on a chat answer, workflow reports are batch work
+PRIORITY_CHAT = 0
+PRIORITY_TASK_PARSE = 1
+PRIORITY_WORKFLOW = 2
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_requests (
+    id           TEXT PRIMARY KEY,
+    request_key  TEXT NOT NULL,
+    priority     INTEGER NOT NULL,
+    status       TEXT NOT NULL,
+    owner_pid    INTEGER NOT NULL,
+    owner_thread INTEGER,
+    heartbeat_at TEXT,
+    waiters      INTEGER DEFAULT 0,
+    result       TEXT,
+    error        TEXT,
+    enqueued_at  TEXT NOT NULL,
+    started_at   TEXT,
+    finished_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS llm_requests_queue ON llm_requests (status, priority, enqueued_at);
+CREATE INDEX IF NOT EXISTS llm_requests_key ON llm_requests (request_key, status);
+"""
+
+_initialized = set()
+
+
+def init_llm_queue(db_path=JOB_DB):
+    if db_path in _initialized:
+        return
+    with _db(db_path) as conn:
+        conn.executescript(SCHEMA)
+        # Under the write lock: processes upgrading an older table together must not both add a column
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(llm_requests)")}
+        for column, kind in (("owner_thread", "INTEGER"), ("heartbeat_at", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE llm_requests ADD COLUMN {column} {kind}")
+        conn.execute("COMMIT")
+    _initialized.add(db_path)
+
+
+def request_key(request):
+    """Identical model + prompt (+ system/context) → identical key."""
+    text = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _enqueue(key, priority, db_path):
+    """(request id, coalesced): joins an identical queued/running request instead of adding one."""
+    with _db(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM llm_requests WHERE request_key = ? AND status IN (?, ?) ORDER BY enqueued_at LIMIT 1",
+            (key, QUEUED, RUNNING)
+        ).fetchone()
+        if row:
+            # A chat joining a queued workflow request pulls it forward
+            conn.execute(
+                "UPDATE llm_requests SET waiters = waiters + 1, priority = MIN(priority, ?) WHERE id = ?",
+                (priority, row["id"])
+            )
+            conn.execute("COMMIT")
+            return row["id"], True
+
+        request_id = uuid.uuid4().hex[:12]
+        now = _now()
+        conn.execute(
+            "INSERT INTO llm_requests (id, request_key, priority, status, owner_pid, owner_thread, heartbeat_at, "
+            "enqueued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (request_id, key, priority, QUEUED, os.getpid(), threading.get_ident(), now, now)
+        )
+        conn.execute(
+            "DELETE FROM llm_requests WHERE status IN (?, ?) AND finished_at < ?",
+            (DONE, FAILED, (datetime.now() - KEEP_FINISHED).isoformat())
+        )
+        conn.execute("COMMIT")
+        return request_id, False
+
+
+def _fail_orphans(conn):
+    """Requests whose owner exited or stopped beating never finish: fail them so the queue keeps moving."""
+    stale = (datetime.now() - STALE_AFTER).isoformat()
+    rows = conn.execute(
+        "SELECT id, owner_pid, heartbeat_at FROM llm_requests WHERE status IN (?, ?)", (QUEUED, RUNNING)
+    ).fetchall()
+    for row in rows:
+        if not _pid_alive(row["owner_pid"]):
+            error = "owner process exited"
+        elif (row["heartbeat_at"] or "") < stale:
+            error = "owner stopped responding"
+        else:
+            continue
+        conn.execute(
+            "UPDATE llm_requests SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED, error, _now(), row["id"])
+        )
+
+
+def fail_orphans(db_path=JOB_DB):
+    init_llm_queue(db_path)
+    with _db(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _fail_orphans(conn)
+        conn.execute("COMMIT")
+
+
+def _heartbeat(request_id, db_path):
+    with _db(db_path) as conn:
+        conn.execute("UPDATE llm_requests SET heartbeat_at = ? WHERE id = ?", (_now(), request_id))
+
+
+class _Heartbeat:
+    """Keeps the row of a running generation fresh from a side thread."""
+
+    def __init__(self, request_id, db_path, interval=HEARTBEAT_INTERVAL):
+        self.request_id = request_id
+        self.db_path = db_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                _heartbeat(self.request_id, self.db_path)
+            except Exception as e:
+                print(f"⚠️ LLM heartbeat for {self.request_id} failed: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _try_start(request_id, max_concurrency, db_path):
+    """Start this request when it heads the queue and a generation slot is free."""
+    with _db(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # Waiting counts as alive: refresh our own heartbeat before judging the others
+        conn.execute("UPDATE llm_requests SET heartbeat_at = ? WHERE id = ?", (_now(), request_id))
+        _fail_orphans(conn)
+        running = conn.execute("SELECT COUNT(*) FROM llm_requests WHERE status = ?", (RUNNING,)).fetchone()[0]
+        head = conn.execute(
+            "SELECT id FROM llm_requests WHERE status = ? ORDER BY priority, enqueued_at LIMIT 1", (QUEUED,)
+        ).fetchone()
+        started = running < max_concurrency and head is not None and head["id"] == request_id
+        if started:
+            conn.execute("UPDATE llm_requests SET status = ?, started_at = ? WHERE id = ?",
+                         (RUNNING, _now(), request_id))
+        conn.execute("COMMIT")
+        return started
+
+
+def _finish(request_id, result=None, error=None, db_path=JOB_DB):
+    """Record the outcome; a row another caller already failed (as orphaned) is left alone."""
+    with _db(db_path) as conn:
+        conn.execute(
+            "UPDATE llm_requests SET status = ?, result = ?, error = ?, finished_at = ? "
+            "WHERE id = ? AND status IN (?, ?)",
+            (FAILED if error else DONE, json.dumps(result), error, _now(), request_id, QUEUED, RUNNING)
+        )
+
+
+def _wait_for_result(request_id, db_path, poll_interval, timeout):
+    """(ok, result or error) of a shared request; fails its row too if its owner is gone."""
+    deadline = time.monotonic() + timeout
+    next_check = time.monotonic() + HEARTBEAT_INTERVAL
+    while True:
+        with _db(db_path) as conn:
+            row = conn.execute("SELECT status, result, error FROM llm_requests WHERE id = ?", (request_id,)).fetchone()
+        if row is None or row["status"] == FAILED:
+            return False, row["error"] if row else "request disappeared"
+        if row["status"] == DONE:
+            return True, json.loads(row["result"])
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"LLM request {request_id} did not finish within {timeout:g}s")
+        if time.monotonic() >= next_check:
+            fail_orphans(db_path)
+            next_check = time.monotonic() + HEARTBEAT_INTERVAL
+        time.sleep(poll_interval)
+
+
+# 🧠 Queue one generation: coalesce with an identical one in flight, else wait for a slot and run it here
+def run_scheduled(request, generate, priority=PRIORITY_WORKFLOW, db_path=JOB_DB,
+                  max_concurrency=LLM_MAX_CONCURRENCY, poll_interval=POLL_INTERVAL, timeout=LLM_QUEUE_TIMEOUT):
+    """request identifies the generation (model, prompt, ...); generate() produces a JSON-serializable result.
+
+    Raises TimeoutError when no slot (or shared result) comes within timeout seconds.
+    """
+    init_llm_queue(db_path)
+    key = request_key(request)
+    request_id, coalesced = _enqueue(key, priority, db_path)
+
+    if coalesced:
+        print(f"🔗 Identical LLM request {request_id} already in flight, sharing its result")
+        ok, value = _wait_for_result(request_id, db_path, poll_interval, timeout)
+        if ok:
+            return value
+        # The shared generation failed or its owner died: run our own
+        print(f"⚠️ Shared LLM request failed ({value}), retrying on its own")
+        request_id, _ = _enqueue(f"{key}:{uuid.uuid4().hex}", priority, db_path)
+
+    # Whatever ends this call (result, exception, KeyboardInterrupt, script stop), the row is closed
+    error, result = "interrupted", None
+    try:
+        deadline = time.monotonic() + timeout
+        waited = False
+        while not _try_start(request_id, max(1, max_concurrency), db_path):
+            if time.monotonic() >= deadline:
+                error = "timed out waiting for a slot"
+                raise TimeoutError(f"LLM request {request_id} got no slot within {timeout:g}s")
+            if not waited:
+                print(f"⏳ LLM request {request_id} queued (priority {priority})")
+                waited = True
+            time.sleep(poll_interval)
+
+        try:
+            with _Heartbeat(request_id, db_path):
+                result = generate()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        error = None
+        return result
+    finally:
+        _finish(request_id, result=result, error=error, db_path=db_path)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+# 📈 Queue depth now, and wait times / coalescing over the last hour
+def llm_metrics(db_path=JOB_DB):
+    init_llm_queue(db_path)
+    since = (datetime.now() - METRICS_WINDOW).isoformat()
+    with _db(db_path) as conn:
+        queued = conn.execute(
+            "SELECT priority, COUNT(*) AS n, MIN(enqueued_at) AS oldest FROM llm_requests WHERE status = ? "
+            "GROUP BY priority", (QUEUED,)
+        ).fetchall()
+        running = conn.execute("SELECT COUNT(*) FROM llm_requests WHERE status = ?", (RUNNING,)).fetchone()[0]
+        recent = conn.execute(
+            "SELECT enqueued_at, started_at, finished_at, waiters, status FROM llm_requests "
+            "WHERE started_at IS NOT NULL AND enqueued_at >= ?", (since,)
+        ).fetchall()
+
+    def seconds(start, end):
+        return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+    waits = [seconds(r["enqueued_at"], r["started_at"]) for r in recent]
+    runs = [seconds(r["started_at"], r["finished_at"]) for r in recent if r["finished_at"]]
+    oldest = min((r["oldest"] for r in queued), default=None)
+    return {
+        "queue_depth": sum(r["n"] for r in queued),
+        "queued_by_priority": {r["priority"]: r["n"] for r in queued},
+        "oldest_queued_s": round(seconds(oldest, _now()), 1) if oldest else 0.0,
+        "running": running,
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "completed_last_hour": sum(1 for r in recent if r["status"] == DONE),
+        "coalesced_last_hour": sum(r["waiters"] or 0 for r in recent),
+        "wait_s_avg": round(sum(waits) / len(waits), 2) if waits else None,
+        "wait_s_p95": round(_percentile(waits, 0.95), 2) if waits else None,
+        "generation_s_avg": round(sum(runs) / len(runs), 2) if runs else None,
+    }
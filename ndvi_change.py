@@ -3,32 +3,33 @@ from rasterio.enums import Resampling
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from rasterutil import array_stats, read_aligned, read_band, write_index
+
+def change_labels(delta_ndvi, threshold=0.1):
+    """0 loss, 1 neutral, 2 gain per pixel."""
+    labels = np.ones(delta_ndvi.shape, dtype=np.uint8)
+    labels[delta_ndvi > threshold] = 2
+    labels[delta_ndvi < -threshold] = 0
+    return labels
 
 def generate_ndvi_change(ndvi_2024_path, ndvi_2025_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
 
     # Open 2024 NDVI
-    with rasterio.open(ndvi_2024_path) as src1:
-        ndvi_1 = src1.read(1)
-        profile = src1.profile
-        shape = ndvi_1.shape
+    ndvi_1, profile = read_band(ndvi_2024_path)
 
-    # Open 2025 NDVI
-    with rasterio.open(ndvi_2025_path) as src2:
-        ndvi_2 = src2.read(
-            1,
-            out_shape=shape,
-            resampling=Resampling.bilinear
-        )
+    # Open 2025 NDVI over the 2024 grid's extent
+    ndvi_2 = read_aligned(ndvi_2025_path, profile, Resampling.bilinear)
 
     # NDVI difference
     delta_ndvi = ndvi_2 - ndvi_1
 
-    # Save delta NDVI GeoTIFF
-    profile.update(dtype='float32', count=1)
+    # Change classes (0 loss, 1 neutral, 2 gain) counted in one pass alongside the histogram
+    stats = array_stats(delta_ndvi, labels=change_labels(delta_ndvi), class_names=["loss", "neutral", "gain"], hist_range=(-2.0, 2.0))
+
+    # Save delta NDVI GeoTIFF (+ delta_ndvi.tif.stats.json)
     output_tif = os.path.join(output_dir, "delta_ndvi.tif")
-    with rasterio.open(output_tif, 'w', **profile) as dst:
-        dst.write(delta_ndvi.astype(np.float32), 1)
+    write_index(output_tif, delta_ndvi, profile, stats=stats)
 
     # Save PNG visualization
     output_png = os.path.join(output_dir, "NDVI_change.png")
@@ -40,14 +41,14 @@ def generate_ndvi_change(ndvi_2024_path, ndvi_2025_path, output_dir):
     plt.close()
 
     # Categorize NDVI change
-    gain = np.sum(delta_ndvi > 0.1)
-    loss = np.sum(delta_ndvi < -0.1)
-    neutral = np.sum((delta_ndvi >= -0.1) & (delta_ndvi <= 0.1))
+    gain = stats["classes"]["gain"]
+    loss = stats["classes"]["loss"]
+    neutral = stats["classes"]["neutral"]
     total = gain + loss + neutral
 
-    gain_pct = round((gain / total) * 100, 2)
-    loss_pct = round((loss / total) * 100, 2)
-    neutral_pct = round((neutral / total) * 100, 2)
+    gain_pct = round((gain / total) * 100, 2) if total else 0.0
+    loss_pct = round((loss / total) * 100, 2) if total else 0.0
+    neutral_pct = round((neutral / total) * 100, 2) if total else 0.0
 
     # Save bar chart
     stats_png = os.path.join(output_dir, "ndvi_stats.png")
@@ -69,5 +70,6 @@ def generate_ndvi_change(ndvi_2024_path, ndvi_2025_path, output_dir):
         "neutral_percent": neutral_pct,
         "delta_ndvi_tif": output_tif,
         "delta_ndvi_png": output_png,
-        "ndvi_stats_chart": stats_png
+        "ndvi_stats_chart": stats_png,
+        "delta_ndvi_stats": stats
     }
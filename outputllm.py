@@ -1,34 +1,31 @@
 import subprocess
 import os
-import glob
 from generation import analyze  # ✅ Replace with your actual pipeline module
+from sceneindex import build_scene_index, select_scene_pair, scene_results
+from rasterutil import stats_summary
+from llmqueue import run_scheduled, PRIORITY_WORKFLOW
 
-def run_llm_pipeline(base_data_path):
+def run_llm_pipeline(base_data_path, scene_pair=None, progress=None, output_dir=None, aoi=None):
+    progress = progress or (lambda stage, fraction, message="": None)
 
+    # --- Step 0: Pick the before/after scenes from the metadata index ---
+    if scene_pair is None:
+        scene_pair = select_scene_pair(build_scene_index(base_data_path))
 
-    import os
+    if not scene_pair:
+        raise ValueError(f"No scene pair with metadata found in {base_data_path}")
 
-    # --- Step 0: Automatically get first and last folder ---
-    all_folders = [
-        name for name in os.listdir(base_data_path)
-        if os.path.isdir(os.path.join(base_data_path, name))
-    ]
+    before, after = scene_pair["before"], scene_pair["after"]
+    folder_start = before["folder"]
+    folder_end = after["folder"]
 
-    # Sort folders (assuming folder names like "YYYY-MM-DD")
-    all_folders.sort()
-
-    if not all_folders:
-        raise ValueError(f"No folders found in {base_data_path}")
-
-    folder_start = os.path.join(base_data_path, all_folders[0])
-    folder_end = os.path.join(base_data_path, all_folders[-3])
-
-    print(f"📁 Auto-selected start folder: {folder_start}")
-    print(f"📁 Auto-selected end folder:   {folder_end}")
+    print(f"📁 Auto-selected start folder: {folder_start} ({before['acquisition_time']})")
+    print(f"📁 Auto-selected end folder:   {folder_end} ({after['acquisition_time']})")
 
 
     # --- Step 1: Run the analysis and extract flood & NDVI stats ---
-    analysis_result = analyze(base_data_path)
+    progress("analysis", 0.65)
+    analysis_result = analyze(base_data_path, scene_pair=scene_pair, output_root=output_dir, aoi=aoi)
 
     flood_stats = {
         'flooded_pixels': 0,
@@ -51,35 +48,25 @@ def run_llm_pipeline(base_data_path):
         if analysis_result.get("ndvi_change"):
             ndvi_stats.update(analysis_result["ndvi_change"])
 
-    # --- Step 2: Helpers ---
-    def find_meta_file(folder):
-        meta_files = glob.glob(os.path.join(folder, '**', '*.meta*'), recursive=True)
-        if not meta_files:
-            raise FileNotFoundError(f"No .meta files found in {folder}")
-        return meta_files[0]
-
-    def extract_times(filepath):
-        start, end = None, None
-        with open(filepath, 'r') as f:
-            for line in f:
-                if "ProductSceneStartTime" in line or "SceneStartTime" in line:
-                    if not start:
-                        start = line.split("=")[-1].strip()
-                elif "ProductSceneEndTime" in line or "SceneEndTime" in line:
-                    if not end:
-                        end = line.split("=")[-1].strip()
-        return start, end
-
-    start_meta_file = find_meta_file(folder_start)
-    end_meta_file = find_meta_file(folder_end)
-
-    print(f"✅ Found start metadata file: {start_meta_file}")
-    print(f"✅ Found end metadata file: {end_meta_file}")
-
-    scene1_start, scene1_end = extract_times(start_meta_file)
-    scene2_start, scene2_end = extract_times(end_meta_file)
+    # --- Step 2: Scene times straight from the index (no .meta re-read) ---
+    print(f"✅ Found start metadata file: {before['meta_path']}")
+    print(f"✅ Found end metadata file: {after['meta_path']}")
+
+    scene1_start, scene1_end = before["scene_start"], before["scene_end"]
+    scene2_start, scene2_end = after["scene_start"], after["scene_end"]
 
     # --- Step 3: Build LLM prompt ---
+    area = f"bounding box {aoi['bounds']} (lon/lat)" if aoi else "full scene extent"
+    index_lines = []
+    for role, layers in ((analysis_result or {}).get("index_stats") or {}).items():
+        for name, summary in layers.items():
+            if summary:
+                index_lines.append(f"  {role}_{name}: mean {summary['mean']}, std {summary['std']}, "
+                                   f"min {summary['min']}, max {summary['max']}")
+    delta_summary = stats_summary(ndvi_stats.get("delta_ndvi_stats"))
+    if delta_summary:
+        index_lines.append(f"  delta_ndvi: mean {delta_summary['mean']}, std {delta_summary['std']}")
+    index_block = "\n".join(index_lines) or "  (not available)"
     prompt = f"""
 You are a geospatial reasoning expert.
 
@@ -89,6 +76,7 @@ scene1_start_time: "{scene1_start}"
 scene1_end_time:   "{scene1_end}"
 scene2_start_time: "{scene2_start}"
 scene2_end_time:   "{scene2_end}"
+analysis_area:     "{area}"
 
 Flood classification stats:
   flooded_pixels: {flood_stats['flooded_pixels']}
@@ -104,6 +92,9 @@ NDVI change stats:
   neutral_pixels: {ndvi_stats['neutral_pixels']}
   neutral_percent: {ndvi_stats['neutral_percent']}
 
+Spectral index statistics:
+{index_block}
+
 Tasks:
 1. Calculate the duration of each scene and compare.
 2. Explain if flood and NDVI loss are correlated.
@@ -121,15 +112,20 @@ Do not include extra explanation. Output ONLY valid YAML or JSON ready for savin
 """
 
     # --- Step 4: Run Ollama ---
+    progress("report", 0.85)
     print("\n🚀 Running llama3:8b with Ollama...")
-    process = subprocess.run(
-        ["ollama", "run", "llama3:8b"],
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
 
-    output = process.stdout.decode("utf-8").strip()
+    def generate():
+        process = subprocess.run(
+            ["ollama", "run", "llama3:8b"],
+            input=prompt.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return process.stdout.decode("utf-8").strip()
+
+    # Batch priority: interactive chat turns are served first on the shared model
+    output = run_scheduled({"api": "cli", "model": "llama3:8b", "prompt": prompt}, generate, PRIORITY_WORKFLOW)
 
     # --- Step 5: Save output ---
     if output.startswith("{"):
@@ -139,7 +135,15 @@ Do not include extra explanation. Output ONLY valid YAML or JSON ready for savin
     else:
         output_file = "flood_workflow.txt"
 
+    if output_dir:
+        output_file = os.path.join(output_dir, output_file)
+
     with open(output_file, "w", encoding="utf-8") as f:
         f.write(output)
 
     print(f"\n📥 LLaMA 3 output saved to: {output_file}")
+
+    results = dict(analysis_result or {})
+    results["workflow_file"] = output_file
+    results.update(scene_results(scene_pair))
+    return results
@@ -0,0 +1,201 @@
+"""Concurrent portal searches with async Playwright.
+
+One browser, one logged-in storage state, and a separate browser context per
+AOI/date-range query, so a batch of regions is searched in parallel:
+
+    python portalsearch.py queries.json            # [{"latitude", "longitude", "start_date", "end_date"}, ...]
+    python portalsearch.py queries.json --cart     # also add scenes not yet in data_dir to the cart
+"""
+import asyncio
+import json
+import os
+import sys
+
+from settings import load_config, portal_credentials
+from sceneindex import describe_search_result, held_scene_keys, is_scene_held
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+SEARCH_CONCURRENCY = int(config.get("search_concurrency", 4))
+HEADLESS = bool(config.get("browser_headless", True))
+STATE_FILE = os.path.join(DATA_DIR, ".portal_state.json")
+
+LOGIN_URL = "https://bhoonidhi.nrsc.gov.in/bhoonidhi/login.html"
+INDEX_URL = "https://bhoonidhi.nrsc.gov.in/bhoonidhi/index.html"
+TIMEOUT_MS = 30000
+POPUP_TIMEOUT_MS = 5000
+
+OPEN_DATA_CHECKBOX = (
+    "xpath=//input[@type='checkbox' and contains(@class, 'tw-control')]"
+    "/following-sibling::text()[contains(., 'OpenData_DirectDownload')]/preceding-sibling::input"
+)
+LISS3_CHECKBOX = "input[type='checkbox'][value='ResourceSat-2_LISS3_L2']"
+ADD_TO_CART = "xpath=.//button[@id='cartId' and @value='add' and contains(@style, '#337AB7')]"
+
+
+async def dismiss_popup(page, timeout=POPUP_TIMEOUT_MS):
+    try:
+        await page.locator("button.bootbox-accept").first.click(timeout=timeout)
+        await page.locator(".bootbox").first.wait_for(state="hidden", timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+
+# 🔐 Same sequence as webscrap.portal_login, with event-based waits instead of sleeps
+async def login(browser, username, password, state_file=STATE_FILE):
+    context = await browser.new_context()
+    page = await context.new_page()
+    page.set_default_timeout(TIMEOUT_MS)
+    try:
+        await page.goto(LOGIN_URL)
+        await page.fill("#login", username)
+        await page.fill("#password", password)
+        await page.click("button.btn.sbtn")
+
+        await page.click("input.chk[value='AC02']")
+        await page.click("#buttonFeedBackClass")
+        if await dismiss_popup(page):
+            try:
+                await page.select_option("#SUB_AC02", "Forest cover and type mapping_AC02#05", timeout=POPUP_TIMEOUT_MS)
+                await page.click("#buttonFeedBackClass")
+            except Exception as e:
+                print("⚠️ Skipping secondary popup or dropdown:", e)
+
+        await page.click("xpath=//button[contains(text(), 'HOME')]")
+        await page.wait_for_url("**/bhoonidhi/index.html*")
+        await dismiss_popup(page)
+
+        state = await context.storage_state(path=state_file)
+        print("🔐 Logged in; session state saved.")
+        return state
+    finally:
+        await context.close()
+
+
+async def is_logged_in(browser, state):
+    context = await browser.new_context(storage_state=state)
+    try:
+        page = await context.new_page()
+        await page.goto(INDEX_URL, wait_until="networkidle", timeout=TIMEOUT_MS)
+        return "login.html" not in page.url
+    except Exception:
+        return False
+    finally:
+        await context.close()
+
+
+async def session_state(browser, username, password, state_file=STATE_FILE):
+    """Saved storage state when it is still valid, otherwise a fresh login."""
+    if os.path.exists(state_file) and await is_logged_in(browser, state_file):
+        print("🍪 Reusing saved portal session.")
+        return state_file
+    return await login(browser, username, password, state_file)
+
+
+async def read_result_rows(page):
+    headers = [h.strip() for h in await page.locator("#resTBody").locator("xpath=../thead//th").all_inner_texts()]
+    rows = []
+    for index, row in enumerate(await page.locator("#resTBody > tr").all()):
+        cells = [c.strip() for c in await row.locator("td").all_inner_texts()]
+        named = {(headers[i] if i < len(headers) and headers[i] else f"col{i}"): text for i, text in enumerate(cells)}
+        extra = " ".join(filter(None, [await row.get_attribute("title"), await row.get_attribute("data-id")]))
+        text = f"{await row.inner_text()} {extra}"
+        rows.append({"index": index, "cells": named, "text": text, "scene": describe_search_result(named, text),
+                     "locator": row})
+    return rows
+
+
+# 🔎 One AOI/date-range query in its own browser context
+async def search_aoi(browser, state, query, held=None, cart_lock=None):
+    context = await browser.new_context(storage_state=state)
+    page = await context.new_page()
+    page.set_default_timeout(TIMEOUT_MS)
+    label = query.get("name") or f"{query['latitude']},{query['longitude']}"
+    try:
+        await page.goto(INDEX_URL)
+        await dismiss_popup(page)
+
+        await page.click("#locPanelLink")
+        await page.fill("#LatDeci", str(query["latitude"]))
+        await page.fill("#LngDeci", str(query["longitude"]))
+        await page.click("#MapLoc")
+
+        await page.wait_for_selector("#sdate", state="attached")
+        await page.evaluate(
+            "([s, e]) => { document.getElementById('sdate').value = s; document.getElementById('edate').value = e; }",
+            [query["start_date"], query["end_date"]],
+        )
+
+        await page.locator(OPEN_DATA_CHECKBOX).first.dispatch_event("click")
+        await page.locator(LISS3_CHECKBOX).dispatch_event("click")
+        await page.click("#getProdButton")
+        await page.click("xpath=//a[contains(text(), 'Search-Results')]")
+        # Results arrive asynchronously: wait for the first row rather than sleeping
+        try:
+            await page.wait_for_selector("#resTBody > tr", state="attached")
+        except Exception:
+            print(f"⚠️ {label}: no search results")
+
+        rows = await read_result_rows(page)
+        for row in rows:
+            row["held"] = bool(held and is_scene_held(row["scene"], held))
+        print(f"📦 {label}: {len(rows)} scenes ({sum(r['held'] for r in rows)} already held)")
+
+        if cart_lock is not None:
+            # The cart belongs to the account, not the context: add rows one query at a time
+            async with cart_lock:
+                for row in rows:
+                    if row["held"]:
+                        continue
+                    try:
+                        await row["locator"].locator(ADD_TO_CART).dispatch_event("click")
+                        row["added_to_cart"] = True
+                    except Exception as e:
+                        print(f"⚠️ {label} row {row['index']}: Add to Cart failed - {e}")
+
+        return {"query": query, "rows": [{k: v for k, v in r.items() if k != "locator"} for r in rows]}
+    except Exception as e:
+        print(f"❌ {label}: search failed - {e}")
+        return {"query": query, "rows": [], "error": str(e)}
+    finally:
+        await context.close()
+
+
+async def search_many(queries, username, password, concurrency=SEARCH_CONCURRENCY, add_to_cart=False,
+                      data_dir=DATA_DIR, headless=HEADLESS):
+    from playwright.async_api import async_playwright
+
+    held = held_scene_keys(data_dir)
+    cart_lock = asyncio.Lock() if add_to_cart else None
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        try:
+            state = await session_state(browser, username, password)
+
+            async def limited(query):
+                async with semaphore:
+                    return await search_aoi(browser, state, query, held, cart_lock)
+
+            return await asyncio.gather(*(limited(q) for q in queries))
+        finally:
+            await browser.close()
+
+
+# 🌍 Synchronous entry point: list of {"latitude", "longitude", "start_date", "end_date"[, "name"]}
+# Without username/password the portal credentials come from the environment or config (settings.portal_credentials)
+def search_regions(queries, username=None, password=None, **kwargs):
+    if not username or not password:
+        username, password = portal_credentials()
+    return asyncio.run(search_many(list(queries), username, password, **kwargs))
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "r") as f:
+        region_queries = json.load(f)
+    results = search_regions(region_queries, add_to_cart="--cart" in sys.argv[2:])
+    print(json.dumps(results, indent=2, default=str))
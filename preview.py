@@ -0,0 +1,126 @@
+import os
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from settings import load_config
+from rasterutil import read_band, read_aligned, aoi_key
+from filehandle import compute_ndvi, compute_ndwi
+from storage import is_scene_folder, restore_scene
+from sensors import SceneBands, detect_sensor
+
+# ✅ Load config
+config = load_config()
+
+PREVIEW_DECIMATION = int(config.get("preview_decimation", 8))
+FLOOD_THRESHOLD = 0.2       # same ΔNDWI threshold as flood.generate_flood_extent
+NDVI_CHANGE_THRESHOLD = 0.1  # same ΔNDVI threshold as ndvi_change.generate_ndvi_change
+
+
+def _scene_folder(folder):
+    """The folder holding the band files inside an (extracted, renamed) scene folder."""
+    for root, dirs, files in os.walk(folder):
+        if is_scene_folder(files):
+            restore_scene(root)
+            return root
+    return None
+
+
+def _read(path, aoi, decimation, ref_profile):
+    if ref_profile is None:
+        return read_band(path, aoi, decimation=decimation)
+    return read_aligned(path, ref_profile), ref_profile
+
+
+def index_layers(folder, aoi=None, decimation=PREVIEW_DECIMATION, ref_profile=None):
+    """(NDWI, NDVI, profile) on a coarse grid: existing index products when present, else from bands."""
+    from generation import find_scene_output
+
+    key = aoi_key(aoi)
+    ndwi_path = find_scene_output(folder, "NDWI.tif", key)
+    ndvi_path = find_scene_output(folder, "NDVI.tif", key)
+    if ndwi_path and ndvi_path:
+        # AOI products are already clipped, so no window is needed
+        clip = None if key else aoi
+        ndwi, profile = _read(ndwi_path, clip, decimation, ref_profile)
+        ndvi, _ = _read(ndvi_path, clip, decimation, profile)
+        return ndwi, ndvi, profile
+
+    scene = _scene_folder(folder)
+    sensor = detect_sensor(scene) if scene else None
+    if not sensor:
+        raise FileNotFoundError(f"No bands found in {folder}")
+    bands = SceneBands(scene, sensor, aoi, decimation, ref_profile)
+    ndwi = compute_ndwi(bands["green"], bands["nir"])
+    return ndwi, compute_ndvi(bands["nir"], bands["red"]), bands.profile
+
+
+def _percent(count, total):
+    return round(count / total * 100, 2) if total else 0.0
+
+
+def _save_png(path, array, cmap, title, **kwargs):
+    plt.imshow(array, cmap=cmap, **kwargs)
+    plt.title(title)
+    plt.axis("off")
+    plt.savefig(path, bbox_inches="tight", dpi=100)
+    plt.close()
+
+
+# ⚡ Approximate flood / NDVI-change numbers from 1/decimation resolution, in a second or two
+def preview_analysis(scene_pair, aoi=None, decimation=PREVIEW_DECIMATION, output_dir=None):
+    started = time.perf_counter()
+    before, after = scene_pair["before"]["folder"], scene_pair["after"]["folder"]
+
+    ndwi_1, ndvi_1, profile = index_layers(before, aoi, decimation)
+    ndwi_2, ndvi_2, _ = index_layers(after, aoi, decimation, ref_profile=profile)
+
+    delta_ndwi = ndwi_2 - ndwi_1
+    delta_ndvi = ndvi_2 - ndvi_1
+    valid = np.isfinite(delta_ndwi)
+    total = int(np.count_nonzero(valid))
+    flooded = int(np.count_nonzero(delta_ndwi > FLOOD_THRESHOLD))
+    gain = int(np.count_nonzero(delta_ndvi > NDVI_CHANGE_THRESHOLD))
+    loss = int(np.count_nonzero(delta_ndvi < -NDVI_CHANGE_THRESHOLD))
+    neutral = int(np.count_nonzero(np.abs(delta_ndvi) <= NDVI_CHANGE_THRESHOLD))
+    changed = gain + loss + neutral
+
+    preview = {
+        "decimation": decimation,
+        "grid": [profile["height"], profile["width"]],
+        "flood": {
+            "flooded_percent": _percent(flooded, total),
+            "non_flooded_percent": round(100 - _percent(flooded, total), 2),
+        },
+        "ndvi_change": {
+            "gain_percent": _percent(gain, changed),
+            "loss_percent": _percent(loss, changed),
+            "neutral_percent": _percent(neutral, changed),
+        },
+    }
+
+    if output_dir:
+        preview_dir = os.path.join(output_dir, "preview")
+        os.makedirs(preview_dir, exist_ok=True)
+        preview["flood_map_png"] = os.path.join(preview_dir, "flood_mask_preview.png")
+        _save_png(preview["flood_map_png"], (delta_ndwi > FLOOD_THRESHOLD).astype(np.uint8), "Blues",
+                  "Flood Extent (preview)")
+        preview["ndvi_change_png"] = os.path.join(preview_dir, "NDVI_change_preview.png")
+        _save_png(preview["ndvi_change_png"], delta_ndvi, "RdYlGn", "NDVI Change (preview)", vmin=-1, vmax=1)
+
+    preview["elapsed_s"] = round(time.perf_counter() - started, 2)
+    print(f"⚡ Preview (1/{decimation} resolution, {preview['elapsed_s']}s): "
+          f"flooded ≈ {preview['flood']['flooded_percent']}%, NDVI loss ≈ {preview['ndvi_change']['loss_percent']}%")
+    return preview
+
+
+def preview_error(preview, results):
+    """Absolute difference (percentage points) between the preview and the full-resolution numbers."""
+    error = {}
+    for section, keys in (("flood", ["flooded_percent"]), ("ndvi_change", ["gain_percent", "loss_percent"])):
+        full = (results or {}).get(section) or {}
+        for key in keys:
+            if full.get(key) is not None:
+                error[key] = round(abs(float(full[key]) - preview[section][key]), 2)
+    return error
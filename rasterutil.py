@@ -0,0 +1,316 @@
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.transform import array_bounds
+from rasterio.warp import reproject, transform_bounds, transform_geom
+from rasterio.windows import Window, from_bounds
+
+from settings import load_config
+from storage import touch_access
+
+# ✅ Load config
+config = load_config()
+
+AOI_MODE = bool(config.get("aoi_mode", True))
+AOI_BUFFER_KM = float(config.get("aoi_buffer_km", 10))
+KM_PER_DEGREE = 111.32
+AOI_DIR_PREFIX = "aoi_"
+
+# Index rasters (NDVI, NDWI, MNDWI, ΔNDVI) as float32, or int16 with scale/offset in the GeoTIFF
+INDEX_ENCODING = config.get("index_encoding", "float32")
+INDEX_SCALE = 1e-4
+INDEX_NODATA = -32768
+# Internal overviews in every index raster: decimated reads (preview, low-zoom tiles) decode these levels
+INDEX_OVERVIEW_FACTORS = [2, 4, 8, 16, 32]
+INDEX_OVERVIEW_MIN_SIZE = 64  # no level smaller than this many pixels on the long side
+
+# Statistics written next to every output raster (<name>.tif.stats.json + tags inside the file)
+STATS_SUFFIX = ".stats.json"
+STATS_TAG = "STATS_JSON"
+HISTOGRAM_BINS = 20
+INDEX_RANGE = (-1.0, 1.0)
+
+
+# 📐 Bounding box (and optional polygon) around the task location, in lon/lat
+def aoi_from_task(info, buffer_km=AOI_BUFFER_KM, enabled=AOI_MODE):
+    """info may carry "aoi_polygon" ([[lon, lat], ...]) or "aoi_buffer_km"; returns None for full scenes."""
+    info = info or {}
+    if not enabled:
+        return None
+
+    polygon = info.get("aoi_polygon")
+    if polygon:
+        lons = [p[0] for p in polygon]
+        lats = [p[1] for p in polygon]
+        return {"bounds": [min(lons), min(lats), max(lons), max(lats)], "polygon": [list(p) for p in polygon]}
+
+    if info.get("latitude") is None or info.get("longitude") is None:
+        return None
+    lat, lon = float(info["latitude"]), float(info["longitude"])
+    buffer_km = float(info.get("aoi_buffer_km") or buffer_km)
+    dlat = buffer_km / KM_PER_DEGREE
+    dlon = buffer_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return {"bounds": [lon - dlon, lat - dlat, lon + dlon, lat + dlat], "polygon": None}
+
+
+def aoi_key(aoi):
+    """Stable folder name for outputs clipped to this AOI."""
+    if not aoi:
+        return None
+    text = repr([round(v, 5) for v in aoi["bounds"]]) + repr(aoi.get("polygon"))
+    return AOI_DIR_PREFIX + hashlib.sha1(text.encode("utf-8")).hexdigest()[:10]
+
+
+def aoi_window(src, aoi):
+    """Pixel window of src covering the AOI, clipped to the raster; None when they don't overlap."""
+    west, south, east, north = transform_bounds("EPSG:4326", src.crs, *aoi["bounds"], densify_pts=21)
+    window = from_bounds(west, south, east, north, src.transform)
+    window = window.round_offsets(op="floor").round_lengths(op="ceil")
+    full = Window(0, 0, src.width, src.height)
+    try:
+        window = window.intersection(full)
+    except Exception:
+        return None
+    if window.width < 1 or window.height < 1:
+        return None
+    return window
+
+
+def windowed_profile(src, window):
+    profile = src.profile.copy()
+    profile.update(
+        width=int(window.width),
+        height=int(window.height),
+        transform=src.window_transform(window),
+    )
+    # Block sizes of the full scene may not fit a small window
+    for key in ("blockxsize", "blockysize", "tiled"):
+        profile.pop(key, None)
+    return profile
+
+
+def polygon_mask(profile, crs, aoi):
+    """True for pixels outside the AOI polygon (None when the AOI is just a box)."""
+    if not aoi or not aoi.get("polygon"):
+        return None
+    ring = aoi["polygon"] + ([aoi["polygon"][0]] if aoi["polygon"][0] != aoi["polygon"][-1] else [])
+    geometry = transform_geom("EPSG:4326", crs, {"type": "Polygon", "coordinates": [ring]})
+    return geometry_mask([geometry], out_shape=(profile["height"], profile["width"]),
+                         transform=profile["transform"])
+
+
+# 📊 min/max/mean/std, histogram and class counts of the valid pixels, computed once at write time
+def array_stats(array, valid=None, labels=None, class_names=None, hist_range=INDEX_RANGE, bins=HISTOGRAM_BINS):
+    """labels (default: the array itself) holds class indices into class_names; hist_range=None skips the histogram."""
+    if valid is None:
+        valid = np.isfinite(array) if np.issubdtype(array.dtype, np.floating) else np.ones(array.shape, dtype=bool)
+    values = array[valid]
+
+    stats = {"valid_pixels": int(values.size), "total_pixels": int(array.size)}
+    if values.size:
+        stats.update(
+            min=float(values.min()),
+            max=float(values.max()),
+            mean=float(values.mean(dtype="float64")),
+            std=float(values.std(dtype="float64")),
+        )
+    else:
+        stats.update(min=None, max=None, mean=None, std=None)
+
+    if hist_range is not None:
+        counts, edges = np.histogram(values, bins=bins, range=hist_range)
+        stats["histogram"] = {"edges": [round(float(e), 6) for e in edges], "counts": counts.tolist()}
+
+    if class_names:
+        labels = array if labels is None else labels
+        counts = np.bincount(labels[valid].astype(np.intp).ravel(), minlength=len(class_names))
+        stats["classes"] = {name: int(counts[i]) for i, name in enumerate(class_names)}
+    return stats
+
+
+def stats_path(path):
+    return f"{path}{STATS_SUFFIX}"
+
+
+def write_stats(path, stats, dst=None):
+    """JSON sidecar next to the raster; with an open dataset also GDAL STATISTICS_* tags and a copy inside the file."""
+    if dst is not None:
+        if stats["valid_pixels"] and not is_scaled(dst):
+            dst.update_tags(
+                1,
+                STATISTICS_MINIMUM=stats["min"],
+                STATISTICS_MAXIMUM=stats["max"],
+                STATISTICS_MEAN=stats["mean"],
+                STATISTICS_STDDEV=stats["std"],
+                STATISTICS_VALID_PERCENT=round(stats["valid_pixels"] / stats["total_pixels"] * 100, 4),
+            )
+        # Travels with the file when it is moved into the blob store without its sidecar
+        dst.update_tags(**{STATS_TAG: json.dumps(stats)})
+
+    sidecar = stats_path(path)
+    tmp_path = f"{sidecar}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_path, sidecar)
+    return sidecar
+
+
+def read_stats(path):
+    """Stats of an output raster without touching its pixels (sidecar, else the header tag); None if absent."""
+    if not path:
+        return None
+    sidecar = stats_path(path)
+    if os.path.exists(sidecar):
+        with open(sidecar, "r") as f:
+            return json.load(f)
+    if not os.path.exists(path):
+        return None
+    with rasterio.open(path) as src:
+        text = src.tags().get(STATS_TAG)
+    return json.loads(text) if text else None
+
+
+def stats_summary(stats, digits=4):
+    """The scalar part of a stats dict (no histogram/classes), rounded for prompts and tables."""
+    if not stats:
+        return None
+    return {k: (round(stats[k], digits) if stats.get(k) is not None else None) for k in ("min", "max", "mean", "std")}
+
+
+def build_index_overviews(dst):
+    """Average overviews (nodata/NaN skipped) down to INDEX_OVERVIEW_MIN_SIZE pixels, inside the open file."""
+    size = max(dst.width, dst.height)
+    factors = [f for f in INDEX_OVERVIEW_FACTORS if size // f >= INDEX_OVERVIEW_MIN_SIZE]
+    if factors:
+        dst.build_overviews(factors, Resampling.average)
+
+
+# 💾 Write a spectral index; "int16" stores round(value / 1e-4) with scale/offset + nodata in the file
+def write_index(path, array, profile, encoding=None, stats=None):
+    encoding = encoding or INDEX_ENCODING
+    stats = stats or array_stats(array)
+    profile = dict(profile)
+    # The grid may come from a JPEG2000 band (Sentinel-2): outputs are always GeoTIFF
+    profile.update(driver="GTiff", count=1)
+    if encoding != "int16":
+        profile.update(dtype="float32")
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(array.astype("float32"), 1)
+            build_index_overviews(dst)
+            write_stats(path, stats, dst)
+        return path
+
+    valid = np.isfinite(array)
+    quantized = np.full(array.shape, INDEX_NODATA, dtype="int16")
+    quantized[valid] = np.clip(np.round(array[valid] / INDEX_SCALE), -32767, 32767)
+    profile.update(dtype="int16", nodata=INDEX_NODATA)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(quantized, 1)
+        build_index_overviews(dst)
+        dst.scales = (INDEX_SCALE,)
+        dst.offsets = (0.0,)
+        dst.update_tags(1, ENCODING="scaled_int16")
+        write_stats(path, stats, dst)
+    return path
+
+
+# 💾 Write a uint8 class raster (flood mask, suitability) with its class counts
+def write_mask(path, mask, profile, stats=None):
+    stats = stats or array_stats(mask, hist_range=None)
+    profile = dict(profile)
+    profile.update(driver="GTiff", dtype="uint8", count=1)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(mask.astype(np.uint8), 1)
+        write_stats(path, stats, dst)
+    return path
+
+
+def is_scaled(src, band=1):
+    return src.scales[band - 1] != 1 or src.offsets[band - 1] != 0
+
+
+def decode(data, src, band=1, nodata=None):
+    """Physical values of a band read from src (float32, NaN for nodata when scaled)."""
+    if not is_scaled(src, band):
+        return data
+    nodata = src.nodata if nodata is None else nodata
+    values = data.astype("float32")
+    if nodata is not None:
+        values[data == nodata] = np.nan
+    return values * np.float32(src.scales[band - 1]) + np.float32(src.offsets[band - 1])
+
+
+def decoded_profile(src, profile=None):
+    """Profile for writing outputs derived from src: scaled inputs behave like plain float32 rasters."""
+    profile = dict(profile or src.profile)
+    if is_scaled(src):
+        profile.update(dtype="float32", nodata=None)
+    return profile
+
+
+def decimated_shape(height, width, decimation):
+    return max(1, math.ceil(height / decimation)), max(1, math.ceil(width / decimation))
+
+
+# 🔍 Read band 1 (decoded), only the AOI window when one is given; decimation > 1 reads a
+# coarser grid (served from overviews when the file has them)
+def read_band(path, aoi=None, dtype="float32", decimation=1):
+    touch_access(path)
+    with rasterio.open(path) as src:
+        window = Window(0, 0, src.width, src.height)
+        if aoi is not None:
+            window = aoi_window(src, aoi)
+            if window is None:
+                raise ValueError(f"AOI {aoi['bounds']} does not overlap {path}")
+        profile = windowed_profile(src, window) if aoi is not None else src.profile.copy()
+
+        read_kwargs = {"window": window} if aoi is not None else {}
+        if decimation > 1:
+            height, width = decimated_shape(int(window.height), int(window.width), decimation)
+            read_kwargs.update(out_shape=(height, width), resampling=Resampling.average)
+            profile.update(
+                height=height,
+                width=width,
+                transform=profile["transform"] * Affine.scale(window.width / width, window.height / height),
+            )
+            for key in ("blockxsize", "blockysize", "tiled"):
+                profile.pop(key, None)
+
+        data = decode(src.read(1, **read_kwargs), src).astype(dtype)
+        profile = decoded_profile(src, profile)
+        outside = polygon_mask(profile, src.crs, aoi)
+        if outside is not None and np.issubdtype(data.dtype, np.floating):
+            data[outside] = np.nan
+        return data, profile
+
+
+def read_aligned(path, ref_profile, resampling=Resampling.bilinear):
+    """Read band 1 of path (decoded, float32) on the reference grid: resampled to its shape, reprojected
+    when path is in another CRS.
+
+    Pixels outside path's footprint (and its nodata pixels) are NaN, so they drop out of np.isfinite counts.
+    """
+    height, width = ref_profile["height"], ref_profile["width"]
+    bounds = array_bounds(height, width, ref_profile["transform"])
+    touch_access(path)
+    with rasterio.open(path) as src:
+        if ref_profile.get("crs") and src.crs and src.crs != ref_profile["crs"]:
+            # Another CRS: a window can't line the pixels up, so warp onto the reference grid
+            warped = np.full((height, width), np.nan, dtype="float32")
+            reproject(rasterio.band(src, 1), warped, src_nodata=src.nodata, dst_transform=ref_profile["transform"],
+                      dst_crs=ref_profile["crs"], dst_nodata=np.nan, resampling=resampling)
+            return decode(warped, src).astype("float32")
+        window = from_bounds(*bounds, src.transform)
+        data = src.read(1, window=window, out_shape=(height, width), resampling=resampling,
+                        boundless=True, masked=True)
+        fill = src.nodata if src.nodata is not None else 0
+        values = decode(data.filled(fill), src).astype("float32")
+        values[np.ma.getmaskarray(data)] = np.nan
+        return values
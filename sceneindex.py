@@ -0,0 +1,395 @@
+import os
+import glob
+import json
+import re
+import threading
+from datetime import datetime
+
+from taskparser import normalize_date, DATE_FORMAT
+from watcher import LEDGER_NAME
+
+INDEX_FILE = "scene_index.json"
+# LISS-3 .meta / BAND_META.txt, Landsat *_MTL.txt, Sentinel-2 MTD_MSIL*.xml
+META_PATTERNS = ["*.meta*", "BAND_META.txt", "*_META.txt", "*_MTL.txt", "MTD_MSIL*.xml"]
+# data_dir folders that hold derived outputs, never scenes
+NON_SCENE_DIRS = {"flood_extent", "site_suitability_outputs", "jobs", "blobs", "tile_cache", "batches", "cubes"}
+
+# Typed column → candidate .meta keys (first one present wins)
+FIELD_ALIASES = {
+    "product_id": ["ProductID", "OTSProductID", "ProductId", "LANDSAT_PRODUCT_ID", "PRODUCT_URI"],
+    "satellite": ["SatID", "Satellite", "SatelliteID", "SPACECRAFT_ID", "SPACECRAFT_NAME"],
+    "sensor": ["Sensor", "SensorID", "SENSOR_ID"],
+    "path": ["Path", "PathNo", "WRS_PATH"],
+    "row": ["Row", "RowNo", "WRS_ROW"],
+    "date_of_pass": ["DateOfPass", "DateofPass", "DATE_ACQUIRED"],
+    "scene_start": ["ProductSceneStartTime", "SceneStartTime", "PRODUCT_START_TIME"],
+    "scene_end": ["ProductSceneEndTime", "SceneEndTime", "PRODUCT_STOP_TIME"],
+    "sun_elevation": ["SunElevationAtCenter", "SunElevation", "SunElevationAngle", "SUN_ELEVATION"],
+    "sun_azimuth": ["SunAzimuthAtCenter", "SunAzimuth", "SunAzimuthAngle", "SUN_AZIMUTH"],
+    "cloud_cover": ["CloudPercent", "CloudCover", "CloudCoverage", "Cloud_Cover", "CLOUD_COVER",
+                    "Cloud_Coverage_Assessment"],
+    "center_lat": ["SceneCenterLat", "ProdCenterLat"],
+    "center_lon": ["SceneCenterLon", "ProdCenterLon"],
+}
+FLOAT_FIELDS = {"sun_elevation", "sun_azimuth", "cloud_cover", "center_lat", "center_lon"}
+INT_FIELDS = {"path", "row"}
+FOOTPRINT_CORNERS = ["UL", "UR", "LR", "LL"]
+
+COLUMNS = [
+    "folder", "meta_path", "meta_mtime", "acquisition_time",
+    *FIELD_ALIASES.keys(), "footprint", "fields",
+]
+
+TIME_FORMATS = [
+    "%d-%b-%Y %H:%M:%S.%f", "%d-%b-%Y %H:%M:%S", "%d-%b-%Y",
+    "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d",
+]
+
+
+def parse_time(value):
+    if not value:
+        return None
+    value = value.strip().rstrip("Z")
+    # Trim sub-microsecond digits, e.g. "05:07:18.1234567"
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value)
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.title() if "%b" in fmt else value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _to_number(value, cast):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _xml_fields(filepath):
+    """Leaf elements of a Sentinel-2 MTD_MSIL*.xml as {tag: text} (first occurrence wins)."""
+    import xml.etree.ElementTree as ET
+
+    fields = {}
+    for element in ET.parse(filepath).getroot().iter():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if len(element) == 0 and element.text and element.text.strip() and tag not in fields:
+            fields[tag] = element.text.strip()
+    return fields
+
+
+def _ext_pos_footprint(value):
+    """Sentinel-2 EXT_POS_LIST ("lat lon lat lon ...") → [[lon, lat], ...]."""
+    numbers = [_to_number(v, float) for v in (value or "").split()]
+    if len(numbers) < 6 or None in numbers:
+        return None
+    return [[numbers[i + 1], numbers[i]] for i in range(0, len(numbers) - 1, 2)]
+
+
+# 📄 Parse every "key = value" line of a .meta / MTL file (or the fields of an MTD .xml) once
+def parse_meta_file(filepath):
+    fields = {}
+    if filepath.lower().endswith(".xml"):
+        fields = _xml_fields(filepath)
+    else:
+        with open(filepath, "r", errors="ignore") as f:
+            for line in f:
+                if "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                key = key.strip()
+                if key and key not in fields:
+                    # MTL values are quoted
+                    fields[key] = value.strip().strip('"')
+
+    record = {}
+    for column, aliases in FIELD_ALIASES.items():
+        value = next((fields[a] for a in aliases if a in fields), None)
+        if column in FLOAT_FIELDS:
+            value = _to_number(value, float)
+        elif column in INT_FIELDS:
+            value = _to_number(value, int)
+        record[column] = value
+
+    footprint = []
+    for corner in FOOTPRINT_CORNERS:
+        lat = _to_number(fields.get(f"Prod{corner}Lat", fields.get(f"CORNER_{corner}_LAT_PRODUCT")), float)
+        lon = _to_number(fields.get(f"Prod{corner}Lon", fields.get(f"CORNER_{corner}_LON_PRODUCT")), float)
+        if lat is not None and lon is not None:
+            footprint.append([lon, lat])
+    record["footprint"] = footprint if len(footprint) == 4 else _ext_pos_footprint(fields.get("EXT_POS_LIST"))
+
+    acquired = parse_time(record["scene_start"]) or parse_time(record["date_of_pass"])
+    record["acquisition_time"] = acquired.isoformat() if acquired else None
+    record["fields"] = fields
+    return record
+
+
+def find_meta_files(folder):
+    found = set()
+    for pattern in META_PATTERNS:
+        found.update(glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+    return sorted(found)
+
+
+def _empty_table():
+    return {column: [] for column in COLUMNS}
+
+
+def load_index(data_dir):
+    path = os.path.join(data_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return _empty_table()
+    try:
+        with open(path, "r") as f:
+            table = json.load(f)
+        if set(table) != set(COLUMNS):
+            return _empty_table()
+        return table
+    except (OSError, ValueError):
+        return _empty_table()
+
+
+def save_index(data_dir, table):
+    path = os.path.join(data_dir, INDEX_FILE)
+    # Unique per process and thread: concurrent rebuilds each write their own file, the last replace wins
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f)
+    os.replace(tmp_path, path)
+
+
+def iter_rows(table):
+    for i in range(len(table["folder"])):
+        yield {column: table[column][i] for column in COLUMNS}
+
+
+# 🗂️ Build/refresh the columnar scene table; only new or modified .meta files are parsed
+def build_scene_index(data_dir):
+    if not os.path.isdir(data_dir):
+        return _empty_table()
+    cached = {row["meta_path"]: row for row in iter_rows(load_index(data_dir))}
+    table = _empty_table()
+    parsed = 0
+
+    for name in sorted(os.listdir(data_dir)):
+        folder = os.path.join(data_dir, name)
+        if name in NON_SCENE_DIRS or not os.path.isdir(folder):
+            continue
+        for meta_path in find_meta_files(folder):
+            mtime = os.path.getmtime(meta_path)
+            row = cached.get(meta_path)
+            if not row or row["meta_mtime"] != mtime:
+                row = parse_meta_file(meta_path)
+                row.update(folder=folder, meta_path=meta_path, meta_mtime=mtime)
+                parsed += 1
+            for column in COLUMNS:
+                table[column].append(row[column])
+
+    if parsed or len(table["folder"]) != len(cached):
+        save_index(data_dir, table)
+        print(f"🗂️ Scene index updated: {len(table['folder'])} scenes ({parsed} parsed)")
+    return table
+
+
+def _point_in_polygon(lon, lat, polygon):
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def scene_covers(row, latitude, longitude):
+    """True when the scene footprint contains the point (or the footprint is unknown)."""
+    if latitude is None or longitude is None or not row["footprint"]:
+        return True
+    return _point_in_polygon(float(longitude), float(latitude), row["footprint"])
+
+
+def _quality_key(row):
+    # Lower cloud cover first, then higher sun elevation
+    cloud = row["cloud_cover"] if row["cloud_cover"] is not None else 100.0
+    sun = row["sun_elevation"] if row["sun_elevation"] is not None else 0.0
+    return (cloud, -sun)
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    normalized = normalize_date(value)
+    return datetime.strptime(normalized, DATE_FORMAT) if normalized else None
+
+
+# 🎯 Pick the best before/after scenes covering the AOI within the date range
+def select_scene_pair(table, latitude=None, longitude=None, start_date=None, end_date=None):
+    """{"before", "after", "out_of_range"}, or None with fewer than two scenes over the AOI.
+
+    out_of_range is True when fewer than two scenes fall within the dates and the pair was taken
+    from every scene over the AOI instead; callers report it with the results (scene_results).
+    """
+    start = _as_datetime(start_date)
+    end = _as_datetime(end_date)
+    if end is not None:
+        end = end.replace(hour=23, minute=59, second=59)
+
+    candidates = []
+    for row in iter_rows(table):
+        if not row["acquisition_time"]:
+            continue
+        if not scene_covers(row, latitude, longitude):
+            continue
+        row["acquired"] = datetime.fromisoformat(row["acquisition_time"])
+        candidates.append(row)
+
+    in_range = [
+        r for r in candidates
+        if (start is None or r["acquired"] >= start) and (end is None or r["acquired"] <= end)
+    ]
+    out_of_range = len({r["folder"] for r in in_range}) < 2
+    if out_of_range:
+        # Not enough scenes inside the window: fall back to every scene over the AOI (flagged)
+        in_range = candidates
+    if len({r["folder"] for r in in_range}) < 2:
+        return None
+
+    by_day = {}
+    for r in in_range:
+        by_day.setdefault(r["acquired"].date(), []).append(r)
+    days = sorted(by_day)
+
+    before = min(by_day[days[0]], key=_quality_key)
+    after_pool = [r for r in by_day[days[-1]] if r["folder"] != before["folder"]]
+    if not after_pool:
+        after_pool = [r for d in reversed(days[1:]) for r in by_day[d] if r["folder"] != before["folder"]][:1]
+    after = min(after_pool, key=_quality_key)
+
+    if out_of_range:
+        print(f"⚠️ Fewer than two scenes between {start_date} and {end_date}: comparing "
+              f"{before['acquisition_time']} → {after['acquisition_time']} instead")
+    return {"before": before, "after": after, "out_of_range": out_of_range}
+
+
+def scene_results(scene_pair):
+    """The results entries describing a selected pair: "scenes" (before/after identifiers) and "scenes_out_of_range"."""
+    return {
+        "scenes": {
+            role: {key: scene_pair[role].get(key) for key in ("folder", "acquisition_time", "cloud_cover", "product_id")}
+            for role in ("before", "after")
+        },
+        "scenes_out_of_range": bool(scene_pair.get("out_of_range")),
+    }
+
+
+def select_scene_pair_for_task(data_dir, info):
+    info = info or {}
+    table = build_scene_index(data_dir)
+    return select_scene_pair(
+        table,
+        latitude=info.get("latitude"),
+        longitude=info.get("longitude"),
+        start_date=info.get("start_date"),
+        end_date=info.get("end_date"),
+    )
+
+
+# === Skip scenes already held locally (used before adding search results to the cart) ===
+PRODUCT_ID_PATTERN = re.compile(r"\bR2[A-Z0-9_]{10,}\b", re.IGNORECASE)
+DATE_PATTERN = re.compile(r"\b\d{1,2}[-/ ][A-Za-z]{3}[-/ ]\d{4}\b|\b\d{4}-\d{2}-\d{2}\b")
+SIZE_PATTERN = re.compile(r"([\d.]+)\s*(KB|MB|GB)\b", re.IGNORECASE)
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def normalize_product_id(value):
+    if not value:
+        return None
+    name = os.path.basename(str(value).strip())
+    if name.lower().endswith(".zip"):
+        name = name[:-4]
+    return name.upper() or None
+
+
+def held_scene_keys(data_dir):
+    """Product IDs (from .meta files and ingested archive names) and (date, path, row) of local scenes."""
+    product_ids, passes = set(), set()
+    for row in iter_rows(build_scene_index(data_dir)):
+        if row["product_id"]:
+            product_ids.add(normalize_product_id(row["product_id"]))
+        if row["acquisition_time"] and row["path"] is not None and row["row"] is not None:
+            passes.add((row["acquisition_time"][:10], row["path"], row["row"]))
+
+    ledger_path = os.path.join(data_dir, LEDGER_NAME)
+    if os.path.exists(ledger_path):
+        try:
+            with open(ledger_path, "r") as f:
+                # Failed archives are in the ledger too (see watcher.IngestLedger): they are not held
+                product_ids.update(normalize_product_id(name) for name, entry in json.load(f).items() if "scene" in entry)
+        except (OSError, ValueError):
+            pass
+    return {"product_ids": product_ids, "passes": passes}
+
+
+def _cell(cells, *keywords):
+    for header, value in cells.items():
+        if any(k in header.lower() for k in keywords):
+            return value
+    return None
+
+
+def describe_search_result(cells, text=""):
+    """Scene identifiers of one portal search-result row (cells: column header → cell text)."""
+    text = " ".join([text, *cells.values()])
+
+    product_id = _cell(cells, "product", "scene id", "name")
+    match = PRODUCT_ID_PATTERN.search(product_id or "") or PRODUCT_ID_PATTERN.search(text)
+    date_text = _cell(cells, "date")
+    date_match = DATE_PATTERN.search(date_text or "") or DATE_PATTERN.search(text)
+    acquired = parse_time(date_match.group(0).replace("/", "-").replace(" ", "-")) if date_match else None
+    size_match = SIZE_PATTERN.search(_cell(cells, "size") or "") or SIZE_PATTERN.search(text)
+
+    path, row = _cell(cells, "path"), _cell(cells, "row")
+    if path and "/" in path:
+        # Single "Path/Row" column, e.g. "101/64"
+        path, row = path.split("/", 1)
+
+    return {
+        "product_id": normalize_product_id(match.group(0)) if match else None,
+        "date": acquired.date().isoformat() if acquired else None,
+        "path": _to_number(path, int),
+        "row": _to_number(row, int),
+        "size_bytes": int(float(size_match.group(1)) * SIZE_UNITS[size_match.group(2).upper()]) if size_match else None,
+    }
+
+
+def is_scene_held(scene, held):
+    if scene["product_id"] and scene["product_id"] in held["product_ids"]:
+        return True
+    key = (scene["date"], scene["path"], scene["row"])
+    return None not in key and key in held["passes"]
+
+
+# 🧮 Split search results into scenes to request and scenes already on disk
+def plan_scene_requests(results, data_dir):
+    held = held_scene_keys(data_dir)
+    wanted, skipped = [], []
+    for result in results:
+        scene = describe_search_result(result.get("cells", {}), result.get("text", ""))
+        (skipped if is_scene_held(scene, held) else wanted).append({**result, "scene": scene})
+    return wanted, skipped
+
+
+def report_scene_plan(wanted, skipped):
+    saved = sum(r["scene"]["size_bytes"] or 0 for r in skipped)
+    unknown = sum(1 for r in skipped if r["scene"]["size_bytes"] is None)
+    print(f"📋 {len(wanted)} scenes to request, {len(skipped)} already held locally")
+    for r in skipped:
+        scene = r["scene"]
+        print(f"   ⏩ {scene['product_id'] or '?'} {scene['date'] or ''} path/row {scene['path']}/{scene['row']}")
+    note = f" (+{unknown} of unknown size)" if unknown else ""
+    print(f"💾 Skipping held scenes saves {saved / 1e9:.2f} GB{note}")
+    return saved
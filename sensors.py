@@ -0,0 +1,177 @@
+"""Sensor profiles: where each band role (green, red, nir, swir) lives in a scene, and how to scale it.
+
+A scene folder is matched to a profile by its metadata file (BAND_META.txt, *_MTL.txt,
+MTD_MSIL*.xml) or, failing that, by its band file names. Products then ask for roles,
+not file names, so LISS-3, Sentinel-2 and Landsat scenes go through the same code:
+
+    bands = SceneBands(folder, detect_sensor(folder), aoi)
+    ndvi = compute_ndvi(bands["nir"], bands["red"])   # only nir and red are read
+
+Values are scaled to reflectance where the product defines it (scale, offset); nodata
+pixels become NaN. LISS-3 bands stay raw DNs, as they always have been here.
+"""
+import fnmatch
+import glob
+import json
+import os
+
+import numpy as np
+
+SENSORS = {
+    "sentinel2": {
+        "name": "Sentinel-2 MSI",
+        "markers": ["MTD_MSIL*.xml"],
+        # L2A (one folder per resolution, finest first), then L1C
+        "bands": {
+            "green": ["GRANULE/*/IMG_DATA/R10m/*_B03_10m.jp2", "GRANULE/*/IMG_DATA/*_B03.jp2", "*_B03*.jp2", "*_B03.tif"],
+            "red": ["GRANULE/*/IMG_DATA/R10m/*_B04_10m.jp2", "GRANULE/*/IMG_DATA/*_B04.jp2", "*_B04*.jp2", "*_B04.tif"],
+            "nir": ["GRANULE/*/IMG_DATA/R10m/*_B08_10m.jp2", "GRANULE/*/IMG_DATA/*_B08.jp2", "*_B08*.jp2", "*_B08.tif"],
+            "swir": ["GRANULE/*/IMG_DATA/R20m/*_B11_20m.jp2", "GRANULE/*/IMG_DATA/*_B11.jp2", "*_B11*.jp2", "*_B11.tif"],
+        },
+        "scale": 1e-4,
+        "offset": 0.0,
+        "nodata": 0,
+    },
+    "landsat": {
+        "name": "Landsat 8/9 OLI",
+        "markers": ["*_MTL.txt", "*_SR_B3.TIF"],
+        # Collection 2 Level-2 surface reflectance
+        "bands": {
+            "green": ["*_SR_B3.TIF"],
+            "red": ["*_SR_B4.TIF"],
+            "nir": ["*_SR_B5.TIF"],
+            "swir": ["*_SR_B6.TIF"],
+        },
+        "scale": 2.75e-5,
+        "offset": -0.2,
+        "nodata": 0,
+    },
+    "liss3": {
+        "name": "Resourcesat LISS-III",
+        "markers": ["BAND2*", "BAND_META.txt"],
+        "bands": {
+            "green": ["BAND2.tif"],
+            "red": ["BAND3.tif"],
+            "nir": ["BAND4.tif"],
+            "swir": ["BAND5.tif"],
+        },
+        "scale": None,
+        "offset": None,
+        "nodata": None,
+    },
+}
+
+
+def sensor_for_files(files):
+    """Profile name whose metadata/band markers appear among these file names, else None."""
+    for name, sensor in SENSORS.items():
+        if any(fnmatch.fnmatch(f, marker) for f in files for marker in sensor["markers"]):
+            return name
+    return None
+
+
+def detect_sensor(folder):
+    """Sensor profile name of a scene folder (also when its bands were evicted), None if unknown."""
+    from storage import EVICTED_MARKER
+
+    try:
+        files = os.listdir(folder)
+    except OSError:
+        return None
+    name = sensor_for_files(files)
+    if name is None and EVICTED_MARKER in files:
+        try:
+            with open(os.path.join(folder, EVICTED_MARKER), "r") as f:
+                name = sensor_for_files([os.path.basename(p) for p in json.load(f)["files"]])
+        except (OSError, ValueError, KeyError):
+            pass
+    return name
+
+
+def band_path(folder, sensor, role):
+    """First file matching the role's patterns, or None."""
+    for pattern in SENSORS[sensor]["bands"].get(role, []):
+        matches = sorted(glob.glob(os.path.join(folder, pattern)))
+        if matches:
+            return matches[0]
+    return None
+
+
+def scene_band_paths(folder, sensor=None):
+    """Every existing band file (and its overview) of the scene, for eviction."""
+    sensor = sensor or detect_sensor(folder)
+    if not sensor:
+        return []
+    paths = set()
+    for role in SENSORS[sensor]["bands"]:
+        path = band_path(folder, sensor, role)
+        if path:
+            paths.update(p for p in (path, path + ".ovr") if os.path.exists(p))
+    return sorted(paths)
+
+
+class SceneBands:
+    """Lazy band handles of one scene: a role is read on first access and kept until released.
+
+    The first band read defines the grid (AOI window, decimation); bands at another
+    resolution are resampled onto it. ref_profile fixes the grid up front instead.
+    """
+
+    def __init__(self, folder, sensor, aoi=None, decimation=1, ref_profile=None):
+        self.folder = folder
+        self.sensor = sensor
+        self.spec = SENSORS[sensor]
+        self.aoi = aoi
+        self.decimation = decimation
+        self.profile = ref_profile
+        self._grid = None  # (crs, transform, width, height) of the first band file read
+        self._loaded = {}
+        self.read_roles = []
+
+    def path(self, role):
+        return band_path(self.folder, self.sensor, role)
+
+    def missing(self, roles):
+        return [role for role in roles if not self.path(role)]
+
+    def _source_grid(self, path):
+        import rasterio
+        with rasterio.open(path) as src:
+            return src.crs, src.transform, src.width, src.height
+
+    def _read(self, path):
+        from rasterutil import read_band, read_aligned, polygon_mask
+
+        if self.profile is None:
+            data, self.profile = read_band(path, self.aoi, decimation=self.decimation)
+            self._grid = self._source_grid(path)
+        elif self._grid is not None and self._source_grid(path) == self._grid:
+            # Same pixel grid as the first band: the same window read, no resampling
+            data, _ = read_band(path, self.aoi, decimation=self.decimation)
+        else:
+            data = read_aligned(path, self.profile).astype("float32")
+            outside = polygon_mask(self.profile, self.profile.get("crs"), self.aoi)
+            if outside is not None:
+                data[outside] = np.nan
+        return data
+
+    def __getitem__(self, role):
+        if role not in self._loaded:
+            path = self.path(role)
+            if not path:
+                raise FileNotFoundError(f"No {role} band for {self.spec['name']} in {self.folder}")
+            data = self._read(path)
+            spec = self.spec
+            if spec["nodata"] is not None:
+                data = np.where(data == spec["nodata"], np.nan, data).astype("float32")
+            if spec["scale"] is not None:
+                data = data * np.float32(spec["scale"]) + np.float32(spec["offset"] or 0.0)
+            self._loaded[role] = data
+            self.read_roles.append(role)
+        return self._loaded[role]
+
+    def loaded(self):
+        return list(self._loaded)
+
+    def release(self, role):
+        self._loaded.pop(role, None)
@@ -0,0 +1,27 @@
+import os
+from functools import lru_cache
+
+import yaml
+
+# Override with GIS_ASSIST_CONFIG=/path/to/config.yaml (e.g. for cron runs outside the repo)
+CONFIG_FILE = os.environ.get("GIS_ASSIST_CONFIG", "config.yaml")
+
+
+# ✅ Load config once per process, shared by every module
+@lru_cache(maxsize=None)
+def load_config(path=CONFIG_FILE):
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+# 🔑 Bhoonidhi portal login: BHOONIDHI_USERNAME / BHOONIDHI_PASSWORD, else portal_username / portal_password in config
+def portal_credentials():
+    config = load_config()
+    username = os.environ.get("BHOONIDHI_USERNAME") or config.get("portal_username")
+    password = os.environ.get("BHOONIDHI_PASSWORD") or config.get("portal_password")
+    if not username or not password:
+        raise RuntimeError(
+            "Bhoonidhi portal credentials missing: set BHOONIDHI_USERNAME and BHOONIDHI_PASSWORD "
+            "(or portal_username / portal_password in config.yaml)"
+        )
+    return username, password
@@ -3,6 +3,7 @@ from rasterio.enums import Resampling
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from rasterutil import array_stats, read_aligned, read_band, write_mask
 
 def generate_site_suitability(ndvi_path, ndwi_path, flood_mask_path, output_dir):
     """
@@ -17,18 +18,14 @@ def generate_site_suitability(ndvi_path, ndwi_path, flood_mask_path, output_dir)
     os.makedirs(output_dir, exist_ok=True)
 
     # Read NDVI
-    with rasterio.open(ndvi_path) as src:
-        ndvi = src.read(1)
-        profile = src.profile
-        shape = ndvi.shape
+    ndvi, profile = read_band(ndvi_path)
 
     # Read NDWI
-    with rasterio.open(ndwi_path) as src:
-        ndwi = src.read(1, out_shape=shape, resampling=Resampling.bilinear)
+    ndwi = read_aligned(ndwi_path, profile, Resampling.bilinear)
 
     # Read flood mask
-    with rasterio.open(flood_mask_path) as src:
-        flood_mask = src.read(1, out_shape=shape, resampling=Resampling.nearest).astype(bool)
+    # NaN (outside the mask's footprint) is not "flooded"; those pixels are invalid below anyway
+    flood_mask = read_aligned(flood_mask_path, profile, Resampling.nearest) == 1
 
     # Apply suitability conditions
     suitability = (
@@ -37,11 +34,11 @@ def generate_site_suitability(ndvi_path, ndwi_path, flood_mask_path, output_dir)
         (~flood_mask)
     )
 
-    # Save GeoTIFF
-    profile.update(dtype='uint8', count=1)
+    # Save GeoTIFF (+ suitable / unsuitable counts in site_suitability.tif.stats.json)
+    stats = array_stats(suitability.astype(np.uint8), valid=np.isfinite(ndvi) & np.isfinite(ndwi),
+                        class_names=["unsuitable", "suitable"], hist_range=None)
     tif_path = os.path.join(output_dir, "site_suitability.tif")
-    with rasterio.open(tif_path, 'w', **profile) as dst:
-        dst.write(suitability.astype(np.uint8), 1)
+    write_mask(tif_path, suitability, profile, stats)
 
     # Save PNG
     plt.imshow(suitability, cmap="gray")
@@ -51,4 +48,17 @@ def generate_site_suitability(ndvi_path, ndwi_path, flood_mask_path, output_dir)
     plt.savefig(png_path, bbox_inches='tight', dpi=300)
     plt.close()
 
+    valid = stats["valid_pixels"]
+    suitable_percent = round(stats["classes"]["suitable"] / valid * 100, 2) if valid else 0.0
     print("✅ Site suitability map saved to:", tif_path, "and", png_path)
+    print(f"📊 Suitable: {stats['classes']['suitable']} pixels ({suitable_percent}%)")
+
+    return {
+        "status": "complete",
+        "path": str(output_dir),
+        "suitable_pixels": stats["classes"]["suitable"],
+        "suitable_percent": suitable_percent,
+        "site_suitability_tif": tif_path,
+        "site_suitability_png": png_path,
+        "site_suitability_stats": stats
+    }
@@ -0,0 +1,321 @@
+"""Disk budget for data_dir: per-scene / per-product sizes, last access, LRU eviction.
+
+    python storage.py                      # usage report + reclaimable space
+    python storage.py --enforce            # evict down to storage_budget_gb
+    python storage.py --enforce --budget-gb 50
+
+Cached map tiles are evicted first: tiles of a superseded raster version, then the least
+recently served. Derived products (NDVI.tif + .png + sidecars, composites) go next: they are
+recomputed on demand. Extracted band files go last, and only when the source zip
+is still on disk: the scene folder and its metadata stay, and the bands are re-extracted
+the next time the scene is processed.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zipfile
+
+from settings import load_config
+from sensors import scene_band_paths, sensor_for_files
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+STORAGE_BUDGET_GB = float(config.get("storage_budget_gb") or 0)  # 0 = no budget
+MIN_IDLE_MINUTES = float(config.get("storage_min_idle_minutes", 30))
+
+SOURCE_MARKER = ".source_archive"  # written by extract_zip_file: which zip a folder came from
+EVICTED_MARKER = ".evicted.json"   # band files removed from a scene folder, restorable from the zip
+# Files that belong to a product besides its .tif / .png
+PRODUCT_SIDECARS = (".stats.json", ".ovr", ".aux.xml")
+# data_dir folders managed elsewhere (job blobs, tile cache, cubes, batch summaries)
+MANAGED_DIRS = {"flood_extent", "site_suitability_outputs", "jobs", "blobs", "tile_cache", "batches", "cubes"}
+# Rendered tiles (tileserver.TileCache): tile_cache/<layer>/<source mtime>/z/x/y.png, re-rendered on demand
+TILE_CACHE_DIR = "tile_cache"
+# Eviction order by kind: cheapest to regenerate first
+EVICTION_RANK = {"tiles": 0, "derived": 1, "raw": 2}
+GB = 1024 ** 3
+
+
+# 🕒 Explicit access time: works on relatime/noatime mounts and costs one utime() call
+def touch_access(path):
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def is_scene_folder(files):
+    """A folder with a known sensor's metadata or band files, or one whose bands were evicted."""
+    return sensor_for_files(files) is not None or EVICTED_MARKER in files
+
+
+def write_source_marker(extract_dir, zip_path):
+    with open(os.path.join(extract_dir, SOURCE_MARKER), "w") as f:
+        f.write(os.path.abspath(zip_path))
+
+
+def source_archive(scene_folder, data_dir=DATA_DIR):
+    """(extraction root, zip path) of a scene folder, or (None, None) when unknown."""
+    folder = os.path.abspath(scene_folder)
+    stop = os.path.dirname(os.path.abspath(data_dir))
+    while folder and folder != stop and folder != os.path.dirname(folder):
+        marker = os.path.join(folder, SOURCE_MARKER)
+        if os.path.exists(marker):
+            with open(marker, "r") as f:
+                return folder, f.read().strip()
+        folder = os.path.dirname(folder)
+    return None, None
+
+
+def _files_info(paths):
+    size, last_access = 0, 0.0
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        size += st.st_size
+        last_access = max(last_access, st.st_atime, st.st_mtime)
+    return size, last_access
+
+
+def _product_units(scene, outputs_dir):
+    from filehandle import PRODUCTS
+
+    units = []
+    for name, spec in PRODUCTS.items():
+        files = []
+        for key in ("tif", "png"):
+            if spec.get(key):
+                path = os.path.join(outputs_dir, spec[key])
+                files += [path] + [path + suffix for suffix in PRODUCT_SIDECARS]
+        files = [p for p in files if os.path.exists(p)]
+        if files:
+            size, last_access = _files_info(files)
+            units.append({"kind": "derived", "scene": scene, "product": name, "files": files,
+                          "bytes": size, "last_access": last_access, "restorable": True})
+    return units
+
+
+def _raw_unit(scene, data_dir):
+    bands = scene_band_paths(scene)
+    if not bands:
+        return None
+    size, last_access = _files_info(bands)
+    _, archive = source_archive(scene, data_dir)
+    return {"kind": "raw", "scene": scene, "product": None, "files": bands, "bytes": size,
+            "last_access": last_access, "archive": archive,
+            "restorable": bool(archive and os.path.exists(archive))}
+
+
+def _tile_units(data_dir):
+    """One unit per stale layer version (never served again) and one per tile of each layer's current version."""
+    cache_dir = os.path.join(data_dir, TILE_CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        return []
+    units = []
+    for layer in sorted(os.listdir(cache_dir)):
+        layer_dir = os.path.join(cache_dir, layer)
+        if not os.path.isdir(layer_dir):
+            continue
+        versions = sorted((v for v in os.listdir(layer_dir) if v.isdigit()), key=int)
+        for version in versions:
+            version_dir = os.path.join(layer_dir, version)
+            files = [os.path.join(root, name) for root, _, names in os.walk(version_dir) for name in names]
+            if version != versions[-1]:
+                size, last_access = _files_info(files)
+                units.append({"kind": "tiles", "scene": None, "product": layer, "files": files, "dir": version_dir,
+                              "bytes": size, "last_access": last_access, "restorable": True, "stale": True})
+                continue
+            for path in files:
+                size, last_access = _files_info([path])
+                units.append({"kind": "tiles", "scene": None, "product": layer, "files": [path],
+                              "bytes": size, "last_access": last_access, "restorable": True})
+    return units
+
+
+# 📋 Every evictable unit: cached tiles, one per derived product (per outputs folder) and one per scene's bands
+def storage_units(data_dir=DATA_DIR):
+    units = _tile_units(data_dir)
+    for name in sorted(os.listdir(data_dir)):
+        top = os.path.join(data_dir, name)
+        if name in MANAGED_DIRS or not os.path.isdir(top):
+            continue
+        for root, dirs, files in os.walk(top):
+            if not is_scene_folder(files):
+                continue
+            outputs = os.path.join(root, "outputs")
+            for outputs_dir, _, _ in os.walk(outputs):
+                units += _product_units(root, outputs_dir)
+            raw = _raw_unit(root, data_dir)
+            if raw:
+                units.append(raw)
+    return units
+
+
+def dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def storage_usage(data_dir=DATA_DIR, units=None):
+    units = storage_units(data_dir) if units is None else units
+    usage = {"total": dir_size(data_dir), "tiles": 0, "derived": 0, "raw": 0, "archives": 0, "managed": 0}
+    for unit in units:
+        usage[unit["kind"]] += unit["bytes"]
+    for name in os.listdir(data_dir):
+        path = os.path.join(data_dir, name)
+        if name == TILE_CACHE_DIR:
+            continue  # counted as "tiles" units (the only managed folder that is evicted)
+        if name in MANAGED_DIRS and os.path.isdir(path):
+            usage["managed"] += dir_size(path)
+        elif name.lower().endswith(".zip"):
+            usage["archives"] += os.path.getsize(path)
+    counted = sum(usage[key] for key in ("tiles", "derived", "raw", "archives", "managed"))
+    usage["other"] = max(0, usage["total"] - counted)
+    return usage
+
+
+def human_size(nbytes):
+    return f"{nbytes / GB:.2f} GB" if nbytes >= GB / 10 else f"{nbytes / 1024 ** 2:.1f} MB"
+
+
+def eviction_order(units, now=None, min_idle_minutes=MIN_IDLE_MINUTES):
+    """Restorable units idle for min_idle_minutes (stale tiles at once): tiles, derived products, then raw bands.
+
+    Stale tile versions come before current tiles; within a kind, least recently used first.
+    """
+    now = now or time.time()
+    idle = [u for u in units
+            if u["restorable"] and (u.get("stale") or now - u["last_access"] >= min_idle_minutes * 60)]
+    return sorted(idle, key=lambda u: (EVICTION_RANK[u["kind"]], not u.get("stale"), u["last_access"]))
+
+
+def evict(unit):
+    if unit["kind"] == "raw":
+        marker = os.path.join(unit["scene"], EVICTED_MARKER)
+        with open(marker, "w") as f:
+            # Paths relative to the scene folder (Sentinel-2 bands sit in GRANULE/ subfolders)
+            files = [os.path.relpath(p, unit["scene"]).replace(os.sep, "/") for p in unit["files"]]
+            json.dump({"archive": unit["archive"], "files": files,
+                       "evicted_at": time.time()}, f, indent=2)
+    for path in unit["files"]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if unit.get("dir"):
+        shutil.rmtree(unit["dir"], ignore_errors=True)
+    return unit["bytes"]
+
+
+# 📊 What is using the disk and how much could be freed
+def storage_report(data_dir=DATA_DIR, budget_gb=STORAGE_BUDGET_GB):
+    units = storage_units(data_dir)
+    usage = storage_usage(data_dir, units)
+    candidates = eviction_order(units)
+    usage["reclaimable"] = sum(u["bytes"] for u in candidates)
+    usage["reclaimable_derived"] = sum(u["bytes"] for u in candidates if u["kind"] == "derived")
+    usage["reclaimable_tiles"] = sum(u["bytes"] for u in candidates if u["kind"] == "tiles")
+    usage["unrestorable_raw"] = sum(u["bytes"] for u in units if u["kind"] == "raw" and not u["restorable"])
+
+    print(f"💽 {data_dir}: {human_size(usage['total'])}"
+          + (f" of {budget_gb:g} GB budget" if budget_gb else " (no budget set)"))
+    for key, label in (("raw", "Extracted bands"), ("derived", "Derived products"), ("tiles", "Tile cache"),
+                       ("archives", "Zip archives"), ("managed", "Jobs/cubes"), ("other", "Other")):
+        print(f"  {label:<18} {human_size(usage[key]):>10}")
+    print(f"  ♻️ Reclaimable      {human_size(usage['reclaimable']):>10} "
+          f"({human_size(usage['reclaimable_derived'])} derived, {human_size(usage['reclaimable_tiles'])} tiles)")
+    if usage["unrestorable_raw"]:
+        print(f"  ⚠️ {human_size(usage['unrestorable_raw'])} of bands have no source zip on disk and are never evicted")
+    return usage
+
+
+# 🧹 Evict least-recently-used units until data_dir fits the budget
+def enforce_budget(data_dir=DATA_DIR, budget_gb=STORAGE_BUDGET_GB, min_idle_minutes=MIN_IDLE_MINUTES):
+    if not budget_gb:
+        return []
+    units = storage_units(data_dir)
+    excess = dir_size(data_dir) - int(budget_gb * GB)
+    evicted = []
+    for unit in eviction_order(units, min_idle_minutes=min_idle_minutes):
+        if excess <= 0:
+            break
+        excess -= evict(unit)
+        evicted.append(unit)
+
+    freed = sum(u["bytes"] for u in evicted)
+    if evicted:
+        print(f"🧹 Evicted {len(evicted)} items ({human_size(freed)}) to fit the {budget_gb:g} GB budget")
+    if excess > 0:
+        print(f"⚠️ data_dir is still {human_size(excess)} over budget (nothing else idle and restorable)")
+    return evicted
+
+
+# 📦 Bring evicted band files back from the scene's source zip
+def restore_scene(scene_folder, data_dir=DATA_DIR):
+    marker = os.path.join(scene_folder, EVICTED_MARKER)
+    if not os.path.exists(marker):
+        return False
+    with open(marker, "r") as f:
+        evicted = json.load(f)
+    root, archive = source_archive(scene_folder, data_dir)
+    archive = archive or evicted.get("archive")
+    if not root or not archive or not os.path.exists(archive):
+        print(f"❌ Cannot restore {scene_folder}: source zip {archive} is gone")
+        return False
+
+    prefix = os.path.relpath(scene_folder, root).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix
+    wanted = set(evicted["files"])
+    restored = 0
+    with zipfile.ZipFile(archive, "r") as zf:
+        for member in zf.namelist():
+            name = member.rstrip("/")
+            if prefix:
+                if not name.startswith(prefix + "/"):
+                    continue
+                name = name[len(prefix) + 1:]
+            if name in wanted:
+                zf.extract(member, root)
+                restored += 1
+    os.remove(marker)
+    print(f"📦 Restored {restored} band files of {scene_folder} from {os.path.basename(archive)}")
+    return True
+
+
+def restore_evicted(folder, data_dir=DATA_DIR):
+    """Restore every evicted scene below folder; returns how many were restored."""
+    restored = 0
+    for root, dirs, files in os.walk(folder):
+        if EVICTED_MARKER in files and restore_scene(root, data_dir):
+            restored += 1
+    return restored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="data_dir storage report and LRU eviction")
+    parser.add_argument("--enforce", action="store_true", help="evict until data_dir fits the budget")
+    parser.add_argument("--budget-gb", type=float, default=STORAGE_BUDGET_GB)
+    parser.add_argument("--min-idle-minutes", type=float, default=MIN_IDLE_MINUTES)
+    args = parser.parse_args(argv)
+
+    if args.enforce:
+        enforce_budget(DATA_DIR, args.budget_gb, args.min_idle_minutes)
+    storage_report(DATA_DIR, args.budget_gb)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
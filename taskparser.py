@@ -0,0 +1,280 @@
+import csv
+import calendar
+import os
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv")
+
+# All dates leave the parser (and the LLM fallback) in this format
+DATE_FORMAT = "%d %B %Y"
+
+# Below this the caller should fall back to the LLM
+FAST_PATH_CONFIDENCE = 0.8
+
+TASK_KEYWORDS = {
+    "flood_risk_mapping": ["flood", "inundat", "water extent", "waterlog", "deluge"],
+    "ndvi_change_detection": ["ndvi", "vegetation", "green cover", "crop", "deforest"],
+    "site_suitability": ["suitab", "site selection", "where to build"],
+}
+DEFAULT_TASK = "flood_risk_mapping"
+
+MONTHS = {}
+for _i in range(1, 13):
+    MONTHS[calendar.month_name[_i].lower()] = _i
+    MONTHS[calendar.month_abbr[_i].lower()] = _i
+MONTHS["sept"] = 9
+
+_MONTH = r"(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(\d{4})"
+_RANGE = r"\s*(?:-|–|—|to|till|until|through|and)\s*"
+
+# (name, regex) in priority order; earlier patterns claim their span first
+DATE_PATTERNS = [
+    ("iso", re.compile(r"\b" + _YEAR + r"-(\d{1,2})-(\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-]" + _YEAR + r"\b")),
+    ("day_range", re.compile(r"\b" + _DAY + _RANGE + _DAY + r"\s+(?:of\s+)?" + _MONTH + r"(?:,?\s*" + _YEAR + r")?\b", re.I)),
+    ("month_day_range", re.compile(r"\b" + _MONTH + r"\s+" + _DAY + _RANGE + _DAY + r"(?:,?\s*" + _YEAR + r")?\b", re.I)),
+    ("day_month", re.compile(r"\b" + _DAY + r"\s+(?:of\s+)?" + _MONTH + r"(?:,?\s*" + _YEAR + r")?\b", re.I)),
+    ("month_day", re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r"(?!\d)(?:,?\s*" + _YEAR + r")?\b", re.I)),
+    ("month_year", re.compile(r"\b" + _MONTH + r",?\s+" + _YEAR + r"\b", re.I)),
+]
+
+RELATIVE_PATTERN = re.compile(r"\b(?:last|past|previous)\s+(\d+)?\s*(day|week|month)s?\b", re.I)
+COORD_PATTERN = re.compile(
+    r"(?:lat(?:itude)?\s*[:=]?\s*)?(-?\d{1,2}\.\d+)\s*°?\s*([NS])?\s*,?\s*"
+    r"(?:lon(?:gitude)?\s*[:=]?\s*|lng\s*[:=]?\s*)?(-?\d{1,3}\.\d+)\s*°?\s*([EW])?",
+    re.I
+)
+
+
+# 📚 Gazetteer: normalized place name → (canonical name, lat, lon), loaded once
+@lru_cache(maxsize=1)
+def load_gazetteer(path=GAZETTEER_FILE):
+    index = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            entry = (row["name"], float(row["latitude"]), float(row["longitude"]))
+            index[row["name"].lower()] = entry
+            for alias in (row.get("aliases") or "").split("|"):
+                if alias.strip():
+                    index[alias.strip().lower()] = entry
+    return index
+
+
+@lru_cache(maxsize=1)
+def _gazetteer_max_words(path=GAZETTEER_FILE):
+    return max(len(name.split()) for name in load_gazetteer(path))
+
+
+def find_location(text):
+    gazetteer = load_gazetteer()
+    words = re.findall(r"[a-z]+", text.lower())
+    max_words = _gazetteer_max_words()
+    # Longest n-gram first so "new delhi" wins over "delhi"
+    for n in range(max_words, 0, -1):
+        for i in range(len(words) - n + 1):
+            entry = gazetteer.get(" ".join(words[i:i + n]))
+            if entry:
+                return entry
+    return None
+
+
+def find_coordinates(text):
+    match = COORD_PATTERN.search(text)
+    if not match:
+        return None
+    lat, lat_hemi, lon, lon_hemi = match.groups()
+    lat, lon = float(lat), float(lon)
+    if lat_hemi and lat_hemi.upper() == "S":
+        lat = -abs(lat)
+    if lon_hemi and lon_hemi.upper() == "W":
+        lon = -abs(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def find_task(text):
+    lowered = text.lower()
+    for task, keywords in TASK_KEYWORDS.items():
+        if any(k in lowered for k in keywords):
+            return task
+    return None
+
+
+def _mentions(text):
+    """Return partial date mentions as dicts with day/month/year (None when absent), in text order."""
+    taken = []
+    mentions = []
+
+    def free(span):
+        return all(span[1] <= s or span[0] >= e for s, e in taken)
+
+    for name, pattern in DATE_PATTERNS:
+        for m in pattern.finditer(text):
+            if not free(m.span()):
+                continue
+            taken.append(m.span())
+            g = m.groups()
+            if name == "iso":
+                found = [dict(day=int(g[2]), month=int(g[1]), year=int(g[0]))]
+            elif name == "numeric":
+                # Day-first, as written in India
+                found = [dict(day=int(g[0]), month=int(g[1]), year=int(g[2]))]
+            elif name == "day_range":
+                month, year = MONTHS[g[2].lower()], int(g[3]) if g[3] else None
+                found = [dict(day=int(g[0]), month=month, year=year), dict(day=int(g[1]), month=month, year=year)]
+            elif name == "month_day_range":
+                month, year = MONTHS[g[0].lower()], int(g[3]) if g[3] else None
+                found = [dict(day=int(g[1]), month=month, year=year), dict(day=int(g[2]), month=month, year=year)]
+            elif name == "day_month":
+                found = [dict(day=int(g[0]), month=MONTHS[g[1].lower()], year=int(g[2]) if g[2] else None)]
+            elif name == "month_day":
+                found = [dict(day=int(g[1]), month=MONTHS[g[0].lower()], year=int(g[2]) if g[2] else None)]
+            else:
+                found = [dict(day=None, month=MONTHS[g[0].lower()], year=int(g[1]))]
+            for d in found:
+                d["pos"] = m.start()
+            mentions.extend(found)
+
+    mentions.sort(key=lambda d: d["pos"])
+    return mentions
+
+
+def _resolve(mention, year, last_day=False):
+    month = mention["month"]
+    day = mention["day"]
+    if day is None:
+        day = calendar.monthrange(year, month)[1] if last_day else 1
+    return date(year, month, day)
+
+
+def find_date_range(text, today=None):
+    today = today or date.today()
+    mentions = _mentions(text)
+
+    if mentions:
+        # Borrow a missing year from the nearest later mention, then earlier, then today
+        years = [m["year"] for m in mentions]
+        for i, m in enumerate(mentions):
+            if m["year"] is None:
+                later = next((y for y in years[i + 1:] if y), None)
+                earlier = next((y for y in reversed(years[:i]) if y), None)
+                m["year"] = later or earlier or today.year
+        first, last = mentions[0], mentions[-1]
+        try:
+            start = _resolve(first, first["year"])
+            end = _resolve(last, last["year"], last_day=True)
+            if len(mentions) == 1 and first["day"] is not None:
+                return start, None
+            if end < start and not (years[0] and years[-1]):
+                # "20 December to 5 January": the range crosses New Year. The end rolls into the next year,
+                # unless only the end year was given or, with no years at all, that end would be in the future.
+                start_only_borrowed = years[-1] and not years[0]
+                if start_only_borrowed or (not years[-1] and not years[0] and
+                                           _resolve(last, last["year"] + 1, last_day=True) > today):
+                    start = _resolve(first, first["year"] - 1)
+                else:
+                    end = _resolve(last, last["year"] + 1, last_day=True)
+        except ValueError:
+            return None, None
+        if end < start:
+            # Both years written out: a reversed range
+            start, end = end, start
+        return start, end
+
+    match = RELATIVE_PATTERN.search(text)
+    if match:
+        count = int(match.group(1) or 1)
+        unit = match.group(2).lower()
+        days = {"day": 1, "week": 7, "month": 30}[unit] * count
+        return today - timedelta(days=days), today
+
+    return None, None
+
+
+def normalize_date(value):
+    """Parse any supported date phrasing (or a date object) into DATE_FORMAT; None if unparseable."""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime(DATE_FORMAT)
+    for fmt in (DATE_FORMAT, "%Y-%m-%d", "%d %b %Y", "%B %d, %Y", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    mentions = _mentions(str(value))
+    if mentions and mentions[0]["year"] and mentions[0]["day"]:
+        try:
+            return _resolve(mentions[0], mentions[0]["year"]).strftime(DATE_FORMAT)
+        except ValueError:
+            return None
+    return None
+
+
+def normalize_task_name(task):
+    if not task:
+        return None
+    return find_task(str(task)) or re.sub(r"[^a-z0-9]+", "_", str(task).lower()).strip("_")
+
+
+# ⚡ Rule-based extraction; returns (info, confidence in [0, 1])
+def parse_task(user_input, today=None):
+    info = {
+        "task": None,
+        "location": None,
+        "latitude": None,
+        "longitude": None,
+        "start_date": None,
+        "end_date": None,
+    }
+    confidence = 0.0
+
+    task = find_task(user_input)
+    info["task"] = task or DEFAULT_TASK
+    confidence += 0.2 if task else 0.1
+
+    place = find_location(user_input)
+    coords = find_coordinates(user_input)
+    if place:
+        info["location"], info["latitude"], info["longitude"] = place
+    if coords:
+        info["latitude"], info["longitude"] = coords
+        info["location"] = info["location"] or f"{coords[0]}, {coords[1]}"
+    if place or coords:
+        confidence += 0.4
+
+    start, end = find_date_range(user_input, today=today)
+    info["start_date"] = normalize_date(start)
+    info["end_date"] = normalize_date(end)
+    if start and end:
+        confidence += 0.4
+    elif start:
+        confidence += 0.15
+
+    return info, round(confidence, 2)
+
+
+def merge_task_info(parsed, llm_info):
+    """Fill gaps in the rule-based result with the LLM's answer, normalizing its formats."""
+    merged = dict(parsed)
+    llm_info = llm_info or {}
+    llm_task = normalize_task_name(llm_info.get("task"))
+    if merged.get("task") in (None, DEFAULT_TASK) and llm_task in TASK_KEYWORDS:
+        merged["task"] = llm_task
+    for key in ("location", "latitude", "longitude"):
+        if merged.get(key) is None and llm_info.get(key) is not None:
+            merged[key] = llm_info[key]
+    for key in ("start_date", "end_date"):
+        if merged.get(key) is None:
+            merged[key] = normalize_date(llm_info.get(key))
+    for key in ("latitude", "longitude"):
+        try:
+            merged[key] = float(merged[key]) if merged[key] is not None else None
+        except (TypeError, ValueError):
+            merged[key] = None
+    return merged
@@ -0,0 +1,26 @@
+import json
+
+import cli
+import sceneindex
+
+ARGS = ["--lat", "13.08", "--lon", "80.27", "--start", "01 October 2024", "--end", "10 October 2024", "--json"]
+
+
+def test_analyze_fails_without_a_scene_pair(monkeypatch, capsys):
+    monkeypatch.setattr(sceneindex, "select_scene_pair_for_task", lambda data_dir, info: None)
+    assert cli.main(["analyze", *ARGS]) == 1
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert "No before/after scene pair" in err
+
+
+def test_json_mode_keeps_logs_off_stdout(monkeypatch, capsys):
+    def stage(args, config):
+        print("🚀 working")
+        return {"flood": {"flooded_percent": 12.5}}
+
+    monkeypatch.setitem(cli.STAGES, "analyze", stage)
+    assert cli.main(["analyze", *ARGS]) == 0
+    out, err = capsys.readouterr()
+    assert json.loads(out) == {"flood": {"flooded_percent": 12.5}}
+    assert "🚀 working" in err
@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+import cube
+import generation
+
+AOI = {"bounds": [80.2, 13.0, 80.3, 13.1], "polygon": None}
+
+
+@pytest.fixture
+def scenes(tmp_path, monkeypatch):
+    """Six acquisitions whose NDWI/NDVI rasters hold their own index (0..5) everywhere."""
+    rows, products = [], {}
+    for i in range(6):
+        folder = tmp_path / f"scene{i}"
+        folder.mkdir()
+        paths = []
+        for name in cube.CUBE_INDEXES:
+            path = str(folder / f"{name}.tif")
+            with rasterio.open(path, "w", driver="GTiff", width=20, height=20, count=1, dtype="float32",
+                               crs="EPSG:4326", transform=from_origin(80.2, 13.1, 0.005, 0.005)) as dst:
+                dst.write(np.full((20, 20), i, dtype="float32"), 1)
+            paths.append(path)
+        products[str(folder)] = tuple(paths)
+        rows.append({"folder": str(folder), "acquisition_time": f"2024-10-{i + 1:02d}T05:30:00"})
+    monkeypatch.setattr(generation, "scene_products", lambda folder, aoi: products[folder])
+    return rows
+
+
+def _check(rows, cubes_dir):
+    loaded = cube.load_cube(AOI, cubes_dir)
+    assert sorted(loaded["dates"]) == sorted(row["acquisition_time"] for row in rows)
+    for i, row in enumerate(rows):
+        for name in cube.CUBE_INDEXES:
+            layer = cube.cube_layer(AOI, name, row["acquisition_time"], cubes_dir)
+            assert float(layer[0, 0]) == i
+
+
+def test_slot_comes_from_the_acquisition_time(scenes, tmp_path):
+    cubes_dir = str(tmp_path / "cubes")
+    db = str(tmp_path / "jobs.sqlite")
+    cube.add_scene(AOI, scenes[1], cubes_dir=cubes_dir, db_path=db)
+    cube.add_scene(AOI, scenes[0], cubes_dir=cubes_dir, db_path=db)
+    cube.add_scene(AOI, scenes[0], cubes_dir=cubes_dir, db_path=db)
+    assert cube.load_cube(AOI, cubes_dir)["dates"][scenes[0]["acquisition_time"]]["slot"] == "20241001053000"
+    _check(scenes[:2], cubes_dir)
+
+
+def test_concurrent_threads_keep_every_date(scenes, tmp_path):
+    cubes_dir = str(tmp_path / "cubes")
+    db = str(tmp_path / "jobs.sqlite")
+    threads = [threading.Thread(target=cube.add_scene, args=(AOI, row), kwargs={"cubes_dir": cubes_dir, "db_path": db})
+               for row in scenes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    _check(scenes, cubes_dir)
+
+
+def _add_all(rows, cubes_dir, db):
+    for row in rows:
+        cube.add_scene(AOI, row, cubes_dir=cubes_dir, db_path=db)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the patched scene_products only reaches forked workers")
+def test_concurrent_processes_keep_every_date(scenes, tmp_path):
+    cubes_dir = str(tmp_path / "cubes")
+    db = str(tmp_path / "jobs.sqlite")
+    workers = [multiprocessing.Process(target=_add_all, args=(scenes[i::2], cubes_dir, db)) for i in range(2)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert all(w.exitcode == 0 for w in workers)
+    _check(scenes, cubes_dir)
@@ -0,0 +1,90 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import downloader
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with Range support; the server's `plan` scripts each response in order."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append({"path": self.path, "range": self.headers.get("Range")})
+        action = server.plan.pop(0) if server.plan else "ok"
+        if action == "error":
+            self.send_error(500)
+            return
+
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Disposition", f'attachment; filename="{server.filename}"')
+        self.end_headers()
+        # "truncate": promise the whole body but drop the connection halfway
+        self.wfile.write(body[:len(body) // 2] if action == "truncate" else body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(downloader, "CHUNK_SIZE", 64 * 1024)  # so the truncated half reaches the .part file
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.plan, httpd.requests, httpd.filename = [], [], "R2A_scene.bin"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+
+
+def _url(server, path="/product"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_resumes_a_truncated_download(server, tmp_path):
+    server.plan = ["truncate"]
+    path = downloader.download_file(requests.Session(), _url(server), str(tmp_path), expected_size=len(PAYLOAD))
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert server.requests[0]["range"] is None
+    assert server.requests[1]["range"] == f"bytes={len(PAYLOAD) // 2}-"
+
+
+def test_retries_server_errors(server, tmp_path):
+    server.plan = ["error", "error"]
+    path = downloader.download_file(requests.Session(), _url(server), str(tmp_path), retries=3)
+    assert os.path.getsize(path) == len(PAYLOAD)
+    assert len(server.requests) == 3
+
+
+def test_gives_up_with_a_download_error(server, tmp_path):
+    server.plan = ["error"] * 5
+    with pytest.raises(downloader.DownloadError, match="giving up"):
+        downloader.download_file(requests.Session(), _url(server), str(tmp_path), retries=0)
+    assert len(server.requests) == 1
+
+
+def test_same_filename_does_not_overwrite(server, tmp_path):
+    (tmp_path / "R2A_scene.bin").write_bytes(b"another product")
+    path = downloader.download_file(requests.Session(), _url(server), str(tmp_path))
+    assert os.path.basename(path) == "R2A_scene_1.bin"
+    assert (tmp_path / "R2A_scene.bin").read_bytes() == b"another product"
+
+    # The identical file again is not stored twice
+    again = downloader.download_file(requests.Session(), _url(server, "/mirror"), str(tmp_path))
+    assert again == path
+    assert sorted(os.listdir(tmp_path)) == ["R2A_scene.bin", "R2A_scene_1.bin"]
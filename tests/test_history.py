@@ -0,0 +1,91 @@
+import sys
+import types
+
+import pytest
+
+import history
+from jobqueue import _db, finish_job, init_db, submit_job
+
+TASK = {"task": "flood", "location": "Chennai", "latitude": 13.08, "longitude": 80.27,
+        "start_date": "1 November 2023", "end_date": "30 November 2023"}
+AOI = {"bounds": [80.2, 13.0, 80.3, 13.1], "polygon": None}
+PAIR = {"before": {"folder": "scenes/a"}, "after": {"folder": "scenes/b"}}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_artifacts_present", lambda job_id: True)
+    return str(tmp_path / "jobs.sqlite")
+
+
+def _finish(db, kind, downloaded, payload=None):
+    job_id = submit_job(kind, payload or {}, db_path=db)
+    results = {"task": TASK, "aoi": AOI, "scenes": PAIR, "downloaded": downloaded}
+    finish_job(job_id, results, db_path=db)
+    history.record_run(job_id, results, kind=kind, db_path=db, completed_at="2024-01-01T00:00:00")
+    return job_id
+
+
+def test_missing_ranges():
+    runs = [{"start_date": "2023-11-05", "end_date": "2023-11-10", "completed_at": "2024-01-01T00:00:00"},
+            {"start_date": "2023-11-20", "end_date": "2023-12-31", "completed_at": "2023-11-25T10:00:00"}]
+    assert history.missing_ranges("2023-11-01", "2023-11-30", runs) == [
+        ("2023-11-01", "2023-11-04"), ("2023-11-11", "2023-11-19"), ("2023-11-26", "2023-11-30")]
+    assert history.missing_ranges("2023-11-06", "2023-11-09", runs) == []
+
+
+def test_downloading_run_covers_its_dates(db):
+    job_id = _finish(db, "workflow", True)
+    assert [run["job_id"] for run in history.covering_runs(AOI["bounds"], "2023-11-01", "2023-11-30", db)] == [job_id]
+    assert history.plan_download({**TASK, "aoi_polygon": [[80.21, 13.01], [80.29, 13.09], [80.21, 13.09]]}, db) is None
+
+
+def test_run_without_download_covers_nothing(db):
+    _finish(db, "aoi", False, {"download": False})
+    assert history.covering_runs(AOI["bounds"], "2023-11-01", "2023-11-30", db) == []
+
+
+def test_reuse_matches_job_kind(db):
+    aoi_job = _finish(db, "aoi", True)
+    assert history.find_reusable_run("workflow", TASK, AOI, PAIR, db) is None
+    assert history.find_reusable_run("aoi", TASK, AOI, PAIR, db)["id"] == aoi_job
+
+    workflow_job = _finish(db, "workflow", True)
+    assert history.find_reusable_run("workflow", TASK, AOI, PAIR, db)["id"] == workflow_job
+
+
+def test_old_table_is_rebuilt_from_jobs(db):
+    init_db(db)
+    kept = submit_job("aoi", {"download": True}, db_path=db)
+    skipped = submit_job("aoi", {"download": False}, db_path=db)
+    for job_id in (kept, skipped):
+        finish_job(job_id, {"task": TASK, "aoi": AOI, "scenes": PAIR}, db_path=db)
+    with _db(db) as conn:
+        conn.execute("CREATE TABLE request_history (job_id TEXT PRIMARY KEY, task TEXT)")
+
+    history.init_history(db)
+    with _db(db) as conn:
+        rows = {row["job_id"]: dict(row) for row in conn.execute("SELECT * FROM request_history")}
+    assert rows[kept]["kind"] == "aoi" and rows[kept]["downloaded"] == 1
+    assert rows[skipped]["downloaded"] == 0
+
+
+def test_failed_portal_run_covers_nothing(db, tmp_path, monkeypatch):
+    import storage
+    import user
+
+    # Stands in for the Selenium portal automation: one of two downloads failed
+    outcome = {"requested": ["P1", "P2"], "held": [], "downloaded": ["P1.zip"], "failed": [{"row": 1, "error": "timeout"}]}
+    webscrap = types.SimpleNamespace(login_and_enter_location=lambda **kwargs: outcome)
+    monkeypatch.setitem(sys.modules, "webscrap", webscrap)
+    monkeypatch.setattr(user, "portal_credentials", lambda: ("user", "secret"))
+    monkeypatch.setattr(user, "WATCH_DOWNLOADS", False)
+    monkeypatch.setattr(user, "DOWNLOADS_DIR", str(tmp_path))
+    monkeypatch.setattr(user, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "STORAGE_BUDGET_GB", 0)
+
+    _finish(db, "aoi", user.fetch_task_scenes(TASK, db_path=db))
+    assert history.covering_runs(AOI["bounds"], "2023-11-01", "2023-11-30", db) == []
+
+    monkeypatch.setattr(webscrap, "login_and_enter_location", lambda **kwargs: None)
+    assert user.fetch_task_scenes(TASK, db_path=db) is False
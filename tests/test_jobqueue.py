@@ -0,0 +1,83 @@
+import multiprocessing
+import time
+
+import pytest
+
+import jobqueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    jobqueue.init_db(path)
+    return path
+
+
+def test_claim_respects_the_global_job_limit(db):
+    for _ in range(3):
+        jobqueue.submit_job("aoi", {}, db_path=db)
+    assert jobqueue.claim_next_job(db, max_running=2)
+    assert jobqueue.claim_next_job(db, max_running=2)
+    assert jobqueue.claim_next_job(db, max_running=2) is None
+
+
+def test_batch_workers_only_claim_their_batch(db):
+    ui_job = jobqueue.submit_job("workflow", {"prompt": "flood in Chennai"}, db_path=db)
+    batch_job = jobqueue.submit_job("aoi", {}, db_path=db, batch_id="batch-1")
+    assert jobqueue.claim_next_job(db, batch_id="batch-1")["id"] == batch_job
+    assert jobqueue.claim_next_job(db, batch_id="batch-1") is None
+    assert jobqueue.claim_next_job(db)["id"] == ui_job
+
+
+def test_fair_share_between_batch_and_ui_jobs(db):
+    first = jobqueue.submit_job("aoi", {}, db_path=db, batch_id="batch-1")
+    jobqueue.submit_job("aoi", {}, db_path=db, batch_id="batch-1")
+    ui_job = jobqueue.submit_job("workflow", {"prompt": "p"}, db_path=db)
+    assert jobqueue.claim_next_job(db)["id"] == first
+    assert jobqueue.claim_next_job(db)["id"] == ui_job
+
+
+def test_stage_lock_is_released(db):
+    with jobqueue.stage_lock("ingest", db):
+        with jobqueue._db(db) as conn:
+            assert conn.execute("SELECT holder_pid FROM locks WHERE name = 'ingest'").fetchone()
+    with jobqueue._db(db) as conn:
+        assert conn.execute("SELECT holder_pid FROM locks WHERE name = 'ingest'").fetchone() is None
+
+
+def _slow_job(job_id, payload, db_path):
+    time.sleep(payload["seconds"])
+    return {"slept": payload["seconds"]}
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the test handler only reaches forked workers")
+def test_stopped_workers_finish_their_current_job(db, monkeypatch):
+    monkeypatch.setitem(jobqueue.JOB_HANDLERS, "slow", _slow_job)
+    job_id = jobqueue.submit_job("slow", {"seconds": 1.0}, db_path=db, batch_id="batch-1")
+    stop = multiprocessing.Event()
+    workers = jobqueue.start_workers(1, db, batch_id="batch-1", stop=stop)
+    deadline = time.monotonic() + 10
+    while jobqueue.get_job(job_id, db)["status"] == jobqueue.QUEUED and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    jobqueue.stop_workers(workers, stop)
+    job = jobqueue.get_job(job_id, db)
+    assert job["status"] == jobqueue.DONE and job["result"] == {"slept": 1.0}
+    assert not any(worker.is_alive() for worker in workers)
+
+
+def _init(db, ready):
+    ready.wait(5)
+    jobqueue.init_db(db)
+
+
+def test_concurrent_init_on_a_fresh_database(tmp_path):
+    db = str(tmp_path / "fresh.sqlite")
+    ready = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=_init, args=(db, ready)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    ready.set()
+    for w in workers:
+        w.join()
+    assert [w.exitcode for w in workers] == [0] * 4
@@ -0,0 +1,42 @@
+import pytest
+
+import llmmchat
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    sent = []
+
+    def fake_generate(prompt, context, system_prompt):
+        sent.append((prompt, context))
+        return f"answer {len(sent)}", [len(sent)] * (len(context or []) + 10)
+
+    monkeypatch.setattr(llmmchat, "_run_ollama_with_context", fake_generate)
+    return sent
+
+
+def test_same_results_continue_the_context_with_this_turns_facts(calls):
+    history = []
+    _, history = llmmchat.run_llm_chat("How much flooded?", history, facts="- flooded 38.6%\n", results_key="job-1")
+    _, history = llmmchat.run_llm_chat("NDVI gain?", history, facts="- NDVI gain 44.3%\n", results_key="job-1")
+    assert calls[1] == ("- NDVI gain 44.3%\n\nQuestion: NDVI gain?", [1] * 10)
+    assert [turn["user"] for turn in history] == ["How much flooded?", "NDVI gain?"]
+    assert [turn.get("results_key") for turn in history] == [None, "job-1"]
+
+
+def test_new_results_reset_the_context(calls):
+    history = []
+    _, history = llmmchat.run_llm_chat("How much flooded?", history, facts="- flooded 38.6%\n", results_key="job-1")
+    _, history = llmmchat.run_llm_chat("How much flooded?", history, facts="- flooded 12.0%\n", results_key="job-2")
+    prompt, context = calls[1]
+    assert context is None
+    assert "flooded 12.0%" in prompt and "flooded 38.6%" not in prompt
+    assert "answer 1" in prompt  # the earlier turn comes back through the window
+
+
+def test_oversized_context_is_dropped(calls, monkeypatch):
+    monkeypatch.setattr(llmmchat, "MAX_CONTEXT_TOKENS", 12)
+    history = []
+    _, history = llmmchat.run_llm_chat("first question", history)
+    _, history = llmmchat.run_llm_chat("a second, longer question", history)
+    assert calls[1][1] is None
@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import llmqueue
+from jobqueue import _db
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "jobs.sqlite")
+
+
+def _statuses(db):
+    with _db(db) as conn:
+        return [row["status"] for row in conn.execute("SELECT status FROM llm_requests ORDER BY enqueued_at")]
+
+
+def test_runs_and_records_result(db):
+    assert llmqueue.run_scheduled({"prompt": "a"}, lambda: "answer", db_path=db) == "answer"
+    assert _statuses(db) == [llmqueue.DONE]
+    assert llmqueue.llm_metrics(db)["queue_depth"] == 0
+
+
+def test_identical_requests_share_one_generation(db):
+    calls = []
+    release = threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return "shared"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        llmqueue.run_scheduled({"prompt": "same"}, generate, db_path=db, poll_interval=0.01))) for _ in range(3)]
+    for t in threads:
+        t.start()
+        time.sleep(0.2)
+    release.set()
+    for t in threads:
+        t.join(10)
+    assert results == ["shared"] * 3
+    assert len(calls) == 1
+
+
+def test_interrupted_generation_does_not_block_the_queue(db):
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        llmqueue.run_scheduled({"prompt": "stop"}, interrupted, db_path=db)
+    assert _statuses(db) == [llmqueue.FAILED]
+    assert llmqueue.run_scheduled({"prompt": "next"}, lambda: "ok", db_path=db, timeout=2) == "ok"
+
+
+def test_failed_generation_raises_and_frees_the_slot(db):
+    def broken():
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        llmqueue.run_scheduled({"prompt": "x"}, broken, db_path=db)
+    assert llmqueue.run_scheduled({"prompt": "y"}, lambda: "ok", db_path=db, timeout=2) == "ok"
+
+
+def test_stale_running_row_of_a_live_process_is_failed(db):
+    # Same pid as ours (like a stopped Streamlit session thread), but no heartbeat for a minute
+    llmqueue.init_llm_queue(db)
+    request_id, _ = llmqueue._enqueue("orphan", llmqueue.PRIORITY_CHAT, db)
+    old = (datetime.now() - timedelta(minutes=1)).isoformat()
+    with _db(db) as conn:
+        conn.execute("UPDATE llm_requests SET status = ?, heartbeat_at = ? WHERE id = ?",
+                     (llmqueue.RUNNING, old, request_id))
+
+    assert llmqueue.run_scheduled({"prompt": "after"}, lambda: "ok", db_path=db, timeout=2) == "ok"
+    with _db(db) as conn:
+        row = conn.execute("SELECT status, error FROM llm_requests WHERE id = ?", (request_id,)).fetchone()
+    assert row["status"] == llmqueue.FAILED
+    assert row["error"] == "owner stopped responding"
+
+
+def test_waiting_for_a_busy_slot_times_out_and_closes_the_row(db):
+    release = threading.Event()
+    busy = threading.Thread(target=lambda: llmqueue.run_scheduled(
+        {"prompt": "long"}, lambda: release.wait(10), db_path=db))
+    busy.start()
+    time.sleep(0.3)
+    try:
+        with pytest.raises(TimeoutError):
+            llmqueue.run_scheduled({"prompt": "short"}, lambda: "never", db_path=db, timeout=0.5)
+    finally:
+        release.set()
+        busy.join(10)
+    assert sorted(_statuses(db)) == [llmqueue.DONE, llmqueue.FAILED]
+
+
+def test_chat_runs_before_queued_workflow(db):
+    order = []
+    release = threading.Event()
+    first = threading.Thread(target=lambda: llmqueue.run_scheduled(
+        {"prompt": "running"}, lambda: release.wait(10), db_path=db, poll_interval=0.01))
+    first.start()
+    time.sleep(0.2)
+    workflow = threading.Thread(target=lambda: llmqueue.run_scheduled(
+        {"prompt": "report"}, lambda: order.append("workflow"), llmqueue.PRIORITY_WORKFLOW, db_path=db,
+        poll_interval=0.01))
+    workflow.start()
+    time.sleep(0.2)
+    chat = threading.Thread(target=lambda: llmqueue.run_scheduled(
+        {"prompt": "question"}, lambda: order.append("chat"), llmqueue.PRIORITY_CHAT, db_path=db,
+        poll_interval=0.01))
+    chat.start()
+    time.sleep(0.2)
+    release.set()
+    for t in (first, workflow, chat):
+        t.join(10)
+    assert order == ["chat", "workflow"]
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import rasterio
+import rasterio.warp
+from rasterio.transform import from_origin
+
+import rasterutil
+
+PROFILE = dict(driver="GTiff", width=512, height=512, crs="EPSG:4326", transform=from_origin(80.0, 13.5, 0.001, 0.001))
+
+
+@pytest.mark.parametrize("encoding", ["float32", "int16"])
+def test_decimated_reads_use_the_index_overviews(tmp_path, encoding):
+    path = str(tmp_path / "NDVI.tif")
+    rasterutil.write_index(path, np.full((512, 512), 0.5, dtype="float32"), PROFILE, encoding=encoding)
+    with rasterio.open(path) as src:
+        assert src.overviews(1) == [2, 4, 8]
+
+    # Overwrite the full-resolution pixels only: a read that still decodes them would see the change
+    with rasterio.open(path, "r+") as dst:
+        dst.write(np.zeros((512, 512), dtype=dst.dtypes[0]), 1)
+
+    preview, profile = rasterutil.read_band(path, decimation=8)
+    assert preview.shape == (64, 64) and profile["width"] == 64
+    assert np.allclose(preview, 0.5)
+    full, _ = rasterutil.read_band(path)
+    assert np.allclose(full, 0.0)
+
+
+def test_read_aligned_reprojects_onto_the_reference_grid(tmp_path):
+    # Lon/lat raster whose pixels hold their own centre longitude, as degrees east of 80°E
+    path = str(tmp_path / "NDWI.tif")
+    offsets = 0.001 * (np.arange(512, dtype="float32") + 0.5)
+    rasterutil.write_index(path, np.tile(offsets, (512, 1)), PROFILE, encoding="int16")
+
+    # UTM 44N grid over Chennai, reaching past the raster's eastern edge (80.512°E)
+    ref = {"crs": rasterio.crs.CRS.from_epsg(32644), "height": 60, "width": 120,
+           "transform": from_origin(424000, 1481000, 500, 500)}
+    values = rasterutil.read_aligned(path, ref, resampling=rasterio.enums.Resampling.nearest)
+
+    rows, cols = np.meshgrid(np.arange(60), np.arange(120), indexing="ij")
+    xs, ys = rasterio.transform.xy(ref["transform"], rows.ravel(), cols.ravel())
+    centre_lons, _ = rasterio.warp.transform(ref["crs"], "EPSG:4326", xs, ys)
+    centre_lons = np.array(centre_lons).reshape(60, 120)
+
+    inside = centre_lons < 80.511
+    assert inside.any() and (~inside).any()
+    assert np.allclose(values[inside], centre_lons[inside] - 80.0, atol=0.001)
+    assert np.isnan(values[centre_lons > 80.513]).all()
@@ -0,0 +1,50 @@
+import os
+import threading
+
+import sceneindex
+
+
+def _table(*dates):
+    table = sceneindex._empty_table()
+    for i, acquired in enumerate(dates):
+        row = {column: None for column in sceneindex.COLUMNS}
+        row.update(folder=f"data/scene{i}", acquisition_time=acquired, cloud_cover=10.0)
+        for column in sceneindex.COLUMNS:
+            table[column].append(row[column])
+    return table
+
+
+def test_pair_within_the_dates():
+    table = _table("2024-10-01T05:30:00", "2024-10-09T05:30:00", "2024-12-01T05:30:00")
+    pair = sceneindex.select_scene_pair(table, start_date="1 October 2024", end_date="10 October 2024")
+    assert (pair["before"]["folder"], pair["after"]["folder"]) == ("data/scene0", "data/scene1")
+    assert pair["out_of_range"] is False
+    assert sceneindex.scene_results(pair)["scenes_out_of_range"] is False
+
+
+def test_fallback_outside_the_dates_is_flagged():
+    table = _table("2024-10-01T05:30:00", "2024-10-09T05:30:00")
+    pair = sceneindex.select_scene_pair(table, start_date="1 January 2020", end_date="10 January 2020")
+    assert pair["out_of_range"] is True
+    results = sceneindex.scene_results(pair)
+    assert results["scenes_out_of_range"] is True
+    assert set(results["scenes"]) == {"before", "after"}
+
+
+def test_no_pair_from_a_single_scene():
+    assert sceneindex.select_scene_pair(_table("2024-10-01T05:30:00")) is None
+
+
+def test_missing_data_dir_gives_an_empty_table(tmp_path):
+    assert sceneindex.build_scene_index(str(tmp_path / "missing")) == sceneindex._empty_table()
+
+
+def test_concurrent_saves_leave_a_complete_index(tmp_path):
+    tables = [_table(f"2024-10-{day:02d}", f"2024-10-{day + 1:02d}") for day in range(1, 9)]
+    threads = [threading.Thread(target=sceneindex.save_index, args=(str(tmp_path), table)) for table in tables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sceneindex.load_index(str(tmp_path)) in tables
+    assert os.listdir(tmp_path) == [sceneindex.INDEX_FILE]
@@ -0,0 +1,17 @@
+import pytest
+
+import settings
+
+
+def test_portal_credentials_from_environment(monkeypatch):
+    monkeypatch.setenv("BHOONIDHI_USERNAME", "analyst")
+    monkeypatch.setenv("BHOONIDHI_PASSWORD", "secret")
+    assert settings.portal_credentials() == ("analyst", "secret")
+
+
+def test_missing_portal_credentials_fail(monkeypatch):
+    monkeypatch.delenv("BHOONIDHI_USERNAME", raising=False)
+    monkeypatch.delenv("BHOONIDHI_PASSWORD", raising=False)
+    monkeypatch.setattr(settings, "load_config", lambda: {"data_dir": "./data"})
+    with pytest.raises(RuntimeError, match="credentials missing"):
+        settings.portal_credentials()
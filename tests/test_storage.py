@@ -0,0 +1,34 @@
+import os
+import time
+
+import storage
+
+MB = 1024 ** 2
+
+
+def _tile(data_dir, version, y, age_s):
+    path = data_dir / "tile_cache" / "ndvi" / str(version) / "10" / "5" / f"{y}.png"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * MB)
+    stamp = time.time() - age_s
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_tile_cache_is_evicted_to_fit_the_budget(tmp_path):
+    stale = _tile(tmp_path, 100, 0, 0)           # superseded raster version: evicted even though just written
+    served_long_ago = _tile(tmp_path, 200, 0, 3600)
+    served_just_now = _tile(tmp_path, 200, 1, 0)
+
+    evicted = storage.enforce_budget(str(tmp_path), budget_gb=1.5 * MB / storage.GB, min_idle_minutes=30)
+
+    assert [unit.get("stale", False) for unit in evicted] == [True, False]
+    assert not stale.parent.parent.parent.exists()
+    assert not served_long_ago.exists() and served_just_now.exists()
+    assert storage.dir_size(str(tmp_path)) <= 1.5 * MB
+
+
+def test_tile_cache_is_reported_once(tmp_path):
+    _tile(tmp_path, 200, 0, 0)
+    usage = storage.storage_usage(str(tmp_path))
+    assert usage["tiles"] == MB and usage["managed"] == 0 and usage["other"] == 0
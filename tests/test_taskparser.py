@@ -0,0 +1,24 @@
+from datetime import date
+
+import pytest
+
+from taskparser import find_date_range
+
+TODAY = date(2025, 3, 1)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("flood in Chennai 1-10 Oct 2024", (date(2024, 10, 1), date(2024, 10, 10))),
+    ("flood 20 December to 5 January 2025", (date(2024, 12, 20), date(2025, 1, 5))),
+    ("flood 20 December 2024 to 5 January", (date(2024, 12, 20), date(2025, 1, 5))),
+    ("flood 20 December to 5 January", (date(2024, 12, 20), date(2025, 1, 5))),
+    ("flood 5 January 2025 to 20 December 2024", (date(2024, 12, 20), date(2025, 1, 5))),
+    ("flood 20 December 2024 to 5 January 2026", (date(2024, 12, 20), date(2026, 1, 5))),
+])
+def test_find_date_range(text, expected):
+    assert find_date_range(text, today=TODAY) == expected
+
+
+def test_cross_year_range_without_years_stays_in_the_past():
+    assert find_date_range("20 December to 5 January", today=date(2025, 12, 25)) == (date(2024, 12, 20), date(2025, 1, 5))
+    assert find_date_range("20 December to 5 January", today=date(2026, 1, 10)) == (date(2025, 12, 20), date(2026, 1, 5))
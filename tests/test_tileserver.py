@@ -0,0 +1,70 @@
+import io
+import os
+
+import matplotlib
+import numpy as np
+import pytest
+import rasterio
+from PIL import Image
+from rasterio.transform import from_origin
+
+import tileserver
+
+
+@pytest.fixture
+def scaled_layer(tmp_path):
+    """A 2048² int16 raster holding 0.5 as 5000 × 1e-4, around Chennai."""
+    path = str(tmp_path / "delta_ndvi.tif")
+    profile = dict(driver="GTiff", width=2048, height=2048, count=1, dtype="int16", nodata=-32768,
+                   crs="EPSG:4326", transform=from_origin(80.0, 13.5, 0.0005, 0.0005))
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.full((2048, 2048), 5000, dtype="int16"), 1)
+        dst.scales, dst.offsets = (1e-4,), (0.0,)
+    tileserver.register_layer("test-scaled", path, cmap="RdYlGn", vmin=-1, vmax=1)
+    yield "test-scaled", path
+    tileserver.LAYERS.pop("test-scaled", None)
+
+
+def _centre_pixel(png):
+    return np.asarray(Image.open(io.BytesIO(png)))[128, 128]
+
+
+def _tile_at(z, lon=80.5, lat=13.0):
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n)
+    return z, x, y
+
+
+def test_overview_tiles_keep_scale_and_offset(scaled_layer):
+    name, path = scaled_layer
+    tileserver.ensure_overviews(path)
+    z, x, y = _tile_at(8)
+    assert tileserver._overview_level(path, z) is not None
+
+    expected = matplotlib.colormaps["RdYlGn"](0.75, bytes=True)
+    pixel = _centre_pixel(tileserver.render_tile(name, z, x, y))
+    assert tuple(pixel[:3]) == tuple(expected[:3]) and pixel[3] == 255
+
+
+def test_overviews_are_built_aside_and_moved_into_place(scaled_layer, monkeypatch):
+    _, path = scaled_layer
+    with open(path, "rb") as f:
+        original = f.read()
+    opened, open_dataset = [], rasterio.open
+
+    def spy_open(fp, mode="r", **kwargs):
+        opened.append((fp, mode))
+        return open_dataset(fp, mode, **kwargs)
+
+    monkeypatch.setattr(rasterio, "open", spy_open)
+    monkeypatch.setattr(tileserver.shutil, "copyfile", None)  # the raster is never copied
+    tileserver.ensure_overviews(path)
+
+    assert all(mode == "r" for fp, mode in opened if fp == path)
+
+    assert os.path.exists(path + ".ovr")
+    with open(path, "rb") as f:
+        assert f.read() == original
+    assert sorted(os.listdir(os.path.dirname(path))) == ["delta_ndvi.tif", "delta_ndvi.tif.ovr"]
+    assert tileserver.raster_info(path)[0] == tuple(tileserver.OVERVIEW_FACTORS)
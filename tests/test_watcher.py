@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+
+import watcher
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return watcher.IngestLedger(str(tmp_path / watcher.LEDGER_NAME), max_attempts=2, backoff_s=0)
+
+
+def _archive(tmp_path, name="R2A_broken.zip", content=b"not a zip"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_failed_archive_is_given_up_after_max_attempts(tmp_path, ledger):
+    path = _archive(tmp_path)
+    assert ledger.ready(path)
+    assert ledger.record_failure(path, "extraction failed") == 1
+    assert ledger.ready(path)
+    assert ledger.record_failure(path, "extraction failed") == 2
+    assert not ledger.ready(path)
+    assert os.path.basename(path) not in ledger
+
+    # Persisted: a restarted watcher does not retry it either
+    reloaded = watcher.IngestLedger(ledger.path, max_attempts=2, backoff_s=0)
+    assert not reloaded.ready(path)
+
+
+def test_failed_archive_backs_off(tmp_path):
+    ledger = watcher.IngestLedger(str(tmp_path / watcher.LEDGER_NAME), max_attempts=3, backoff_s=3600)
+    path = _archive(tmp_path)
+    ledger.record_failure(path, "extraction failed")
+    assert not ledger.ready(path)
+
+
+def test_redownloaded_archive_starts_afresh(tmp_path, ledger):
+    path = _archive(tmp_path)
+    ledger.record_failure(path, "extraction failed")
+    ledger.record_failure(path, "extraction failed")
+    _archive(tmp_path, content=b"a longer, re-downloaded file")
+    assert ledger.ready(path)
+    assert ledger.record_failure(path, "extraction failed") == 1
+
+
+def test_ingest_records_extraction_failure(tmp_path):
+    target = tmp_path / "data"
+    target.mkdir()
+    path = _archive(tmp_path)
+    archive_watcher = watcher.ArchiveWatcher([str(tmp_path)], str(target))
+    assert archive_watcher._ingest(path) is None
+    with open(target / watcher.LEDGER_NAME) as f:
+        assert json.load(f)[os.path.basename(path)]["attempts"] == 1
+    archive_watcher.pool.shutdown()
+
+
+def test_ingested_archive_is_skipped(tmp_path, ledger):
+    path = tmp_path / "R2A_good.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("BAND2.tif", b"")
+    ledger.add(path.name, str(tmp_path / "scene"))
+    assert path.name in ledger and not ledger.ready(str(path))
+
+
+def test_failed_archive_is_retried_with_filesystem_events(tmp_path, monkeypatch):
+    target = tmp_path / "data"
+    target.mkdir()
+    path = tmp_path / "R23_retry.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("BAND2.tif", b"")
+
+    monkeypatch.setattr(watcher, "RESCAN_INTERVAL", 0.1)
+    archive_watcher = watcher.ArchiveWatcher([str(tmp_path)], str(target))
+    archive_watcher.ledger = watcher.IngestLedger(str(target / watcher.LEDGER_NAME), max_attempts=3, backoff_s=0.5)
+    archive_watcher.ledger.record_failure(str(path), "extraction failed")
+    # No new event arrives for the file: only the periodic rescan can pick it up again
+    monkeypatch.setattr(archive_watcher, "_start_observer", lambda: True)
+    queued = threading.Event()
+    monkeypatch.setattr(archive_watcher, "_enqueue", lambda queued_path: queued.set())
+
+    archive_watcher.start()
+    try:
+        assert not queued.is_set()
+        assert queued.wait(5)
+    finally:
+        archive_watcher.stop(drain=False)
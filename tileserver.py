@@ -0,0 +1,333 @@
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, transform_bounds
+import matplotlib
+from PIL import Image
+from rasterutil import is_scaled
+from settings import load_config
+from storage import touch_access
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+TILE_PORT = int(config.get("tile_server_port", 8765))
+TILE_URL = config.get("tile_server_url", f"http://localhost:{TILE_PORT}")
+TILE_CACHE_DIR = os.path.join(DATA_DIR, "tile_cache")
+
+TILE_SIZE = 256
+MEMORY_CACHE_TILES = 2048
+OVERVIEW_FACTORS = [2, 4, 8, 16, 32, 64]
+WEB_MERCATOR = CRS.from_epsg(3857)
+ORIGIN_SHIFT = 20037508.342789244  # half the web-mercator world width in meters
+METERS_PER_DEGREE = 111320.0
+
+# name → {"path", "cmap", "vmin", "vmax", "resampling", "transparent"}
+LAYERS = {}
+_layers_lock = threading.Lock()
+_overview_lock = threading.Lock()
+
+
+def register_layer(name, path, cmap="viridis", vmin=0.0, vmax=1.0, categorical=False, transparent=None):
+    with _layers_lock:
+        LAYERS[name] = {
+            "path": str(path),
+            "cmap": cmap,
+            "vmin": vmin,
+            "vmax": vmax,
+            "resampling": Resampling.nearest if categorical else Resampling.average,
+            "transparent": transparent or [],
+        }
+
+
+LAYER_FILES = {
+    "flood_mask": "flood_extent/flood_mask.tif",
+    "delta_ndvi": "flood_extent/delta_ndvi.tif",
+    "site_suitability": "site_suitability_outputs/site_suitability.tif",
+}
+LAYER_STYLES = {
+    "flood_mask": dict(cmap="Blues", vmin=0, vmax=1, categorical=True, transparent=[0]),
+    "delta_ndvi": dict(cmap="RdYlGn", vmin=-1, vmax=1),
+    "site_suitability": dict(cmap="Greens", vmin=0, vmax=1, categorical=True, transparent=[0]),
+}
+
+
+def register_default_layers(data_dir=DATA_DIR):
+    for name, rel_path in LAYER_FILES.items():
+        register_layer(name, os.path.join(data_dir, *rel_path.split("/")), **LAYER_STYLES[name])
+    return list(LAYER_FILES)
+
+
+def register_job_layers(job_id):
+    """Register a job's stored artifacts as "<job_id>-<layer>" so sessions never share layers."""
+    from workspace import artifact_path
+
+    names = []
+    for name, rel_path in LAYER_FILES.items():
+        path = artifact_path(job_id, rel_path)
+        if path:
+            register_layer(f"{job_id}-{name}", path, **LAYER_STYLES[name])
+            names.append(f"{job_id}-{name}")
+    return names
+
+
+@lru_cache(maxsize=64)
+def _raster_info(path, mtime, ovr_mtime):
+    with rasterio.open(path) as src:
+        # Scale/offset/nodata come from the base dataset: an OVERVIEW_LEVEL dataset reports (1.0,)/(0.0,)
+        scaling = (src.scales[0], src.offsets[0]) if is_scaled(src) else None
+        return tuple(src.overviews(1)), _source_resolution_m(src), max(src.width, src.height), scaling, src.nodata
+
+
+def raster_info(path):
+    ovr_path = path + ".ovr"
+    ovr_mtime = os.path.getmtime(ovr_path) if os.path.exists(ovr_path) else None
+    return _raster_info(path, os.path.getmtime(path), ovr_mtime)
+
+
+# 🏔️ Build external (.ovr) overviews once so low zooms read a few KB instead of the full raster.
+# External so the source file (possibly a content-addressed blob) is never modified, or even
+# opened for writing: a VRT in a temp folder points at the raster, and its overviews (always an
+# external <vrt>.ovr, a GeoTIFF like the raster's own .ovr) are moved into place in one os.replace.
+# Other processes reading the raster never see a half-written .ovr.
+def ensure_overviews(path, resampling=Resampling.average):
+    with _overview_lock:
+        factors, _, size, _, _ = raster_info(path)
+        if factors or size <= TILE_SIZE:
+            return
+        build_dir = tempfile.mkdtemp(prefix=".ovr-", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            vrt_path = os.path.join(build_dir, os.path.basename(path) + ".vrt")
+            rasterio.shutil.copy(os.path.abspath(path), vrt_path, driver="VRT")
+            with rasterio.open(vrt_path, "r+") as vrt:
+                vrt.build_overviews(OVERVIEW_FACTORS, resampling)
+            os.replace(vrt_path + ".ovr", path + ".ovr")
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+    print(f"🏔️ Built overviews {OVERVIEW_FACTORS} for {path}")
+
+
+def layer_bounds(name):
+    layer = LAYERS[name]
+    with rasterio.open(layer["path"]) as src:
+        return transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+
+
+def tile_bounds(z, x, y):
+    size = 2 * ORIGIN_SHIFT / (2 ** z)
+    left = -ORIGIN_SHIFT + x * size
+    top = ORIGIN_SHIFT - y * size
+    return left, top - size, left + size, top
+
+
+def _source_resolution_m(src):
+    res = abs(src.transform.a)
+    return res * METERS_PER_DEGREE if src.crs and src.crs.is_geographic else res
+
+
+def _overview_level(path, z):
+    """Index of the coarsest overview that is still at least as fine as the tile, or None for full res."""
+    factors, src_res, _, _, _ = raster_info(path)
+    tile_res = 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** z)
+    level = None
+    for i, factor in enumerate(factors):
+        if src_res * factor <= tile_res:
+            level = i
+    return level
+
+
+def _colorize(data, valid, layer):
+    norm = (data - layer["vmin"]) / (layer["vmax"] - layer["vmin"] or 1)
+    rgba = matplotlib.colormaps[layer["cmap"]](np.clip(norm, 0, 1), bytes=True)
+    for value in layer["transparent"]:
+        valid &= data != value
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+
+def render_tile(name, z, x, y):
+    layer = LAYERS[name]
+    path = layer["path"]
+    level = _overview_level(path, z)
+    _, _, _, scaling, nodata = raster_info(path)
+    # OVERVIEW_LEVEL is a GDAL open option: the dataset then *is* that overview
+    open_kwargs = {"OVERVIEW_LEVEL": level} if level is not None else {}
+
+    destination = np.zeros((TILE_SIZE, TILE_SIZE), dtype="float32")
+    dst_transform = from_bounds(*tile_bounds(z, x, y), TILE_SIZE, TILE_SIZE)
+    nodata_fill = np.float32(-9999.0)
+    destination.fill(nodata_fill)
+
+    with rasterio.open(path, **open_kwargs) as src:
+        reproject(
+            source=rasterio.band(src, 1),
+            destination=destination,
+            src_nodata=nodata,
+            dst_transform=dst_transform,
+            dst_crs=WEB_MERCATOR,
+            dst_nodata=nodata_fill,
+            resampling=layer["resampling"],
+        )
+
+    valid = destination != nodata_fill
+    if scaling is not None:
+        # Scaled int16 index rasters: back to physical values before colouring
+        scale, offset = scaling
+        destination[valid] = destination[valid] * scale + offset
+    rgba = _colorize(destination, valid, layer)
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+class TileCache:
+    """In-memory LRU in front of an on-disk cache; entries are keyed by source mtime."""
+
+    def __init__(self, cache_dir=TILE_CACHE_DIR, max_tiles=MEMORY_CACHE_TILES):
+        self.cache_dir = cache_dir
+        self.max_tiles = max_tiles
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _disk_path(self, name, version, z, x, y):
+        return os.path.join(self.cache_dir, name, version, str(z), str(x), f"{y}.png")
+
+    def get(self, name, z, x, y):
+        layer = LAYERS[name]
+        version = str(int(os.path.getmtime(layer["path"])))
+        key = (name, version, z, x, y)
+
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+        disk_path = self._disk_path(name, version, z, x, y)
+        if os.path.exists(disk_path):
+            with open(disk_path, "rb") as f:
+                tile = f.read()
+            touch_access(disk_path)  # storage.enforce_budget evicts the least recently served tiles first
+        else:
+            tile = render_tile(name, z, x, y)
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tile)
+            os.replace(tmp_path, disk_path)
+
+        with self.lock:
+            self.memory[key] = tile
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_tiles:
+                self.memory.popitem(last=False)
+        return tile
+
+
+TILE_ROUTE = re.compile(r"^/tiles/(?P<name>[\w-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    cache = None
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if status == 200 and content_type == "image/png":
+            self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/layers":
+            available = {}
+            for name, layer in LAYERS.items():
+                if os.path.exists(layer["path"]):
+                    available[name] = {"bounds": layer_bounds(name)}
+            self._send(200, json.dumps(available).encode("utf-8"), "application/json")
+            return
+
+        match = TILE_ROUTE.match(self.path)
+        if not match or match.group("name") not in LAYERS:
+            self._send(404, b"not found", "text/plain")
+            return
+
+        name = match.group("name")
+        z, x, y = int(match.group("z")), int(match.group("x")), int(match.group("y"))
+        if not os.path.exists(LAYERS[name]["path"]) or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            self._send(404, b"not found", "text/plain")
+            return
+
+        try:
+            ensure_overviews(LAYERS[name]["path"], LAYERS[name]["resampling"])
+            self._send(200, self.cache.get(name, z, x, y), "image/png")
+        except Exception as e:
+            self._send(500, str(e).encode("utf-8"), "text/plain")
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 🗺️ Serve XYZ tiles from a daemon thread; returns the server (call .shutdown() to stop)
+def start_tile_server(port=TILE_PORT, data_dir=DATA_DIR):
+    register_default_layers(data_dir)
+    TileRequestHandler.cache = TileCache(os.path.join(data_dir, "tile_cache"))
+    server = ThreadingHTTPServer(("127.0.0.1", port), TileRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"🗺️ Tile server running at http://127.0.0.1:{port}/tiles/<layer>/<z>/<x>/<y>.png")
+    return server
+
+
+def slippy_map_html(layers, bounds=None, tile_url=TILE_URL, height=520):
+    """Leaflet map with an OSM basemap and the given tile layers as toggleable overlays."""
+    overlays = ",\n".join(
+        f'"{name}": L.tileLayer("{tile_url}/tiles/{name}/{{z}}/{{x}}/{{y}}.png", {{opacity: 0.8, maxZoom: 18}})'
+        for name in layers
+    )
+    fit = ""
+    if bounds:
+        west, south, east, north = bounds
+        fit = f"map.fitBounds([[{south}, {west}], [{north}, {east}]]);"
+    first = f'overlays["{layers[0]}"].addTo(map);' if layers else ""
+    return f"""
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<div id="map" style="height: {height}px;"></div>
+<script>
+  var map = L.map("map").setView([20.5, 78.9], 5);
+  L.tileLayer("https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png", {{
+      maxZoom: 18, attribution: "&copy; OpenStreetMap contributors"
+  }}).addTo(map);
+  var overlays = {{
+{overlays}
+  }};
+  {first}
+  L.control.layers(null, overlays, {{collapsed: false}}).addTo(map);
+  {fit}
+</script>
+"""
+
+
+if __name__ == "__main__":
+    server = start_tile_server()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
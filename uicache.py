@@ -0,0 +1,120 @@
+import io
+import os
+import re
+
+import streamlit as st
+from PIL import Image
+
+from storage import is_scene_folder
+
+THUMBNAIL_SIZE = 512
+IMAGE_LIST_TTL = 60  # seconds; also catches new outputs deep inside existing folders
+
+
+def clean_date_folder(date_folder):
+    return re.sub(r'_\d+$', '', date_folder)
+
+
+def file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def dir_signature(base_dir):
+    """Cheap change marker: names and mtimes of the top-level entries only (no recursive walk)."""
+    try:
+        return tuple(sorted((e.name, e.stat().st_mtime) for e in os.scandir(base_dir)))
+    except OSError:
+        return ()
+
+
+COMPOSITE_FILE = "false_color_composite.png"
+
+
+def _scene_composite(scene_folder):
+    """Full-scene false-colour composite if already made, else an AOI-clipped one, else None."""
+    outputs = os.path.join(scene_folder, "outputs")
+    found = None
+    for root, dirs, files in os.walk(outputs):
+        dirs.sort()
+        for file in files:
+            if file.lower() == COMPOSITE_FILE:
+                if root == outputs:
+                    return os.path.join(root, file)
+                found = found or os.path.join(root, file)
+    return found
+
+
+@st.cache_data(ttl=IMAGE_LIST_TTL, show_spinner=False)
+def _scan_scene_images(base_dir, signature):
+    images = []
+    for root, dirs, files in os.walk(base_dir):
+        if is_scene_folder(files):
+            parts = root.split(os.sep)
+            date_folder = next((p for p in parts if p.startswith("2024") or p.startswith("2025")), "Unknown")
+            date_folder_clean = clean_date_folder(date_folder)
+            images.append((date_folder_clean, root, _scene_composite(root)))
+    # Deduplicate, preferring scenes that already have a composite
+    unique_images = {}
+    for date, scene, path in images:
+        if date not in unique_images or (path and not unique_images[date][1]):
+            unique_images[date] = (scene, path)
+    return sorted((date, scene, path) for date, (scene, path) in unique_images.items())
+
+
+# 🖼️ (date, scene folder, composite path or None), re-walked only when data_dir changes (or the TTL expires)
+def get_scene_images(base_dir):
+    return _scan_scene_images(base_dir, dir_signature(base_dir))
+
+
+def refresh_scene_images():
+    _scan_scene_images.clear()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _thumbnail(path, mtime, max_size):
+    with Image.open(path) as img:
+        img.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def load_thumbnail(path, max_size=THUMBNAIL_SIZE):
+    return _thumbnail(path, file_mtime(path), max_size)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _file_bytes(path, mtime):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_file_bytes(path):
+    return _file_bytes(path, file_mtime(path))
+
+
+# ⬇️ Download button whose payload is only read after the user asks for it
+def lazy_download_button(label, path, file_name, mime, key):
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    # Prepared for this exact file: a new job (other path) or a rewritten output (new mtime) asks again
+    ready_key = f"{key}_ready"
+    version = [path, file_mtime(path)]
+    if st.session_state.get(ready_key) != version:
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        if st.button(f"{label} ({size_mb:.1f} MB)", key=f"{key}_prepare"):
+            st.session_state[ready_key] = version
+            st.rerun()
+        return
+
+    st.download_button(
+        label=label,
+        data=read_file_bytes(path),
+        file_name=file_name,
+        mime=mime,
+        key=key
+    )
@@ -1,28 +1,33 @@
-import ollama
 import json
 from datetime import datetime
 
-import yaml
+from settings import load_config, portal_credentials
 import os
 
 # ✅ Load config
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_config()
 
 DATA_DIR = config["data_dir"]
 DOWNLOADS_DIR = config["downloads_dir"]
+WATCH_DOWNLOADS = config.get("watch_downloads", True)
 
 
 
-from filehandle import (
-    extract_today_zip_files,
-    rename_folders_to_date_format,
-    process_all_scenes
-)
-from webscrap import login_and_enter_location
+# Heavy stacks (ollama, Selenium, rasterio/matplotlib via filehandle) are imported
+# inside the functions that need them, so parsing-only callers start fast.
+from taskparser import parse_task, merge_task_info, FAST_PATH_CONFIDENCE
 
-# 🔍 Extract structured task info using LLaMA
+# 🔍 Extract structured task info: rule-based fast path, LLaMA only when unsure
 def extract_task_info(user_input):
+    info, confidence = parse_task(user_input)
+    if confidence >= FAST_PATH_CONFIDENCE:
+        print(f"⚡ Parsed request without LLM (confidence {confidence})")
+        return info
+
+    print(f"🤔 Low parser confidence ({confidence}), asking LLaMA...")
+    return merge_task_info(info, extract_task_info_llm(user_input))
+
+def extract_task_info_llm(user_input):
     prompt = f"""
 You are a GIS assistant for flood risk mapping.
 
@@ -46,8 +51,14 @@ Return a JSON object with the following fields:
 Strictly return only JSON. Do not explain anything.
 """
     try:
-        response = ollama.chat(model='llama3:8b', messages=[{"role": "user", "content": prompt}])
-        content = response['message']['content']
+        import ollama
+        from llmqueue import run_scheduled, PRIORITY_TASK_PARSE
+        messages = [{"role": "user", "content": prompt}]
+        content = run_scheduled(
+            {"api": "chat", "model": "llama3:8b", "messages": messages},
+            lambda: ollama.chat(model='llama3:8b', messages=messages)['message']['content'],
+            PRIORITY_TASK_PARSE
+        )
         json_start = content.find("{")
         json_end = content.rfind("}") + 1
         return json.loads(content[json_start:json_end])
@@ -74,10 +85,14 @@ def run_flood_risk_analysis(coords, start_date, end_date):
     print("✅ Flood risk analysis complete. (placeholder output)")
 
 # 🧠 Full pipeline handler
-def process_user_prompt(user_input):
+def process_user_prompt(user_input, progress=None, dry_run=False, download=True):
+    # progress(stage, fraction, message) is called at each stage when given (e.g. by a queued job).
+    # download=False only parses and logs the request (jobs fetch the scenes themselves).
+    progress = progress or (lambda stage, fraction, message="": None)
     print("🧠 Thinking with LLaMA 3...")
 
     try:
+        progress("parsing", 0.02)
         info = extract_task_info(user_input)
 
         print(f"\n📍 Location: {info['location']} ({info['latitude']}, {info['longitude']})")
@@ -90,23 +105,92 @@ def process_user_prompt(user_input):
             info['end_date']
         )
 
-        print("\n🌐 Launching web automation using Selenium...")
-        driver = login_and_enter_location(
-            username="nemu",
-            password="Nemu@2005",
+        if download:
+            fetch_task_scenes(info, progress=progress, dry_run=dry_run)
+        return info
+
+    except Exception as e:
+        print(f"❌ Failed to process user prompt: {e}")
+        return None
+
+# 🛰️ Download only the AOI/dates no earlier completed run has fetched.
+# True when the task's scenes are now local: already covered, or fetched by a portal run with no failures.
+def fetch_task_scenes(info, progress=None, dry_run=False, db_path=None):
+    from history import REQUEST_REUSE, plan_download
+    from jobqueue import JOB_DB
+
+    fetch = plan_download(info, db_path or JOB_DB) if REQUEST_REUSE else info
+    if not fetch:
+        return not dry_run
+    return download_and_ingest(fetch, progress=progress, dry_run=dry_run)
+
+# 🛰️ Portal search/download for an already-parsed task, then extract and process the scenes.
+# Returns True only when the portal run finished with every download in place (False for dry runs).
+def download_and_ingest(info, progress=None, dry_run=False):
+    from filehandle import (
+        extract_today_zip_files,
+        rename_folders_to_date_format,
+        process_all_scenes,
+        task_products
+    )
+    from webscrap import login_and_enter_location
+    from watcher import ArchiveWatcher
+    from rasterutil import aoi_from_task
+
+    progress = progress or (lambda stage, fraction, message="": None)
+    progress("downloading", 0.1, f"{info['location']} {info['start_date']} → {info['end_date']}")
+    downloads_dir = DOWNLOADS_DIR
+    target_dir = DATA_DIR
+    # City-scale requests only need the pixels around the location (aoi_mode in config)
+    aoi = aoi_from_task(info)
+    # Only the products this task's analysis reads; the rest are made on demand (e.g. by the UI)
+    products = task_products(info.get("task"))
+
+    username, password = portal_credentials()  # fail before any watcher or browser starts
+
+    # Browser downloads land in downloads_dir; direct HTTP downloads are written into data_dir.
+    # With the watcher running, each archive is extracted and processed as soon as it lands.
+    # dry_run only reports which scenes would be requested (and the bytes saved by skipping held ones)
+    watch = WATCH_DOWNLOADS and not dry_run
+    watcher = ArchiveWatcher([downloads_dir, target_dir], target_dir, aoi=aoi, products=products).start() if watch else None
+
+    print("\n🌐 Launching web automation using Selenium...")
+    try:
+        outcome = login_and_enter_location(
+            username=username,
+            password=password,
             latitude=str(info['latitude']),
             longitude=str(info['longitude']),
             start_date=info['start_date'],
-            end_date=info['end_date']
+            end_date=info['end_date'],
+            dry_run=dry_run
         )
-
+    finally:
+        if watcher:
+            progress("ingesting", 0.4, "finishing archives still in flight")
+            watcher.stop(drain=True)
+
+    succeeded = outcome is not None and not outcome["failed"]
+    if outcome is None:
+        print("⚠️ Portal automation failed; continuing with the scenes already on disk")
+    if dry_run:
+        return False
+    if not watcher:
+        progress("ingesting", 0.4)
         print("\n📁 Starting satellite file handling workflow...")
-        downloads_dir = DOWNLOADS_DIR
-        target_dir = DATA_DIR
-
         extract_today_zip_files(downloads_dir, target_dir)
+        extract_today_zip_files(target_dir, target_dir)
         rename_folders_to_date_format(target_dir)
-        process_all_scenes(target_dir)
-
-    except Exception as e:
-        print(f"❌ Failed to process user prompt: {e}")
+        process_all_scenes(target_dir, aoi, products)
+
+    # Append the new acquisitions to this AOI's time cube (any date pair can then be compared in the UI)
+    from cube import TIME_CUBE, update_cube
+    if TIME_CUBE and aoi:
+        progress("ingesting", 0.55, "updating time cube")
+        update_cube(target_dir, aoi)
+
+    # Keep data_dir within storage_budget_gb (least recently used derived products first)
+    from storage import STORAGE_BUDGET_GB, enforce_budget
+    if STORAGE_BUDGET_GB:
+        enforce_budget(target_dir)
+    return succeeded
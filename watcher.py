@@ -0,0 +1,305 @@
+import fnmatch
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+DOWNLOADS_DIR = config["downloads_dir"]
+WATCH_WORKERS = int(config.get("watch_workers", 2))
+MAX_ATTEMPTS = int(config.get("watch_max_attempts", 3))
+RETRY_BACKOFF_S = float(config.get("watch_retry_backoff_s", 30))
+
+ARCHIVE_PATTERN = "R23*.zip"
+POLL_INTERVAL = 1.0      # seconds between scans when inotify/watchdog is unavailable
+RESCAN_INTERVAL = 10.0   # with watchdog: seconds between scans for failed archives whose backoff has passed
+STABLE_CHECKS = 2        # consecutive equal sizes before an archive counts as finished
+LEDGER_NAME = ".ingested.json"
+
+# rename_folder_to_date_format scans target_dir for a free name, so renames must not interleave
+_rename_lock = threading.Lock()
+
+
+def is_archive_complete(path, previous_size=None):
+    """A download is finished when its size stopped changing and the zip directory is readable."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False, None
+    if previous_size is None or size != previous_size:
+        return False, size
+    return zipfile.is_zipfile(path), size
+
+
+def scene_folders(root):
+    from sensors import sensor_for_files
+    for folder, dirs, files in os.walk(root):
+        if sensor_for_files(files):
+            yield folder
+
+
+# 📒 Names of archives already extracted, so restarts and duplicate events are no-ops.
+# Failed archives are recorded too: retried with backoff, then given up after MAX_ATTEMPTS.
+class IngestLedger:
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS, backoff_s=RETRY_BACKOFF_S):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def __contains__(self, name):
+        """True once the archive was ingested."""
+        with self.lock:
+            return "scene" in self.entries.get(name, {})
+
+    def ready(self, path):
+        """Whether the archive at path should be (re)tried now; a re-downloaded file (new size) starts afresh."""
+        name = os.path.basename(path)
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None:
+            return True
+        if "scene" in entry:
+            return False
+        try:
+            if os.path.getsize(path) != entry.get("size"):
+                return True
+        except OSError:
+            return False
+        return entry["attempts"] < self.max_attempts and datetime.now().isoformat() >= entry["retry_after"]
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, name, scene_path):
+        with self.lock:
+            self.entries[name] = {"scene": scene_path, "ingested_at": datetime.now().isoformat()}
+            self._save()
+
+    def record_failure(self, path, error):
+        """Count a failed attempt; returns the number of attempts so far."""
+        name = os.path.basename(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        with self.lock:
+            entry = self.entries.get(name) or {}
+            attempts = entry.get("attempts", 0) + 1 if entry.get("size") == size else 1
+            retry_after = datetime.now() + timedelta(seconds=self.backoff_s * 2 ** (attempts - 1))
+            self.entries[name] = {"attempts": attempts, "size": size, "error": str(error),
+                                  "failed_at": datetime.now().isoformat(), "retry_after": retry_after.isoformat()}
+            self._save()
+        if attempts >= self.max_attempts:
+            print(f"⛔ Giving up on {name} after {attempts} failed attempts: {error}")
+        else:
+            print(f"⚠️ {name} failed (attempt {attempts}/{self.max_attempts}), retrying after "
+                  f"{retry_after:%H:%M:%S}: {error}")
+        return attempts
+
+
+class ArchiveWatcher:
+    """Extract and process each R23*.zip as soon as its download finishes.
+
+    Uses watchdog (inotify on Linux, ReadDirectoryChangesW on Windows) when installed,
+    otherwise falls back to polling the watched folders.
+    """
+
+    def __init__(self, watch_dirs=(DOWNLOADS_DIR,), target_dir=DATA_DIR, workers=WATCH_WORKERS,
+                 pattern=ARCHIVE_PATTERN, aoi=None, products=None):
+        self.watch_dirs = [d for d in watch_dirs if d and os.path.isdir(d)]
+        self.target_dir = target_dir
+        self.pattern = pattern
+        self.aoi = aoi  # when set, scenes are processed only inside this window
+        self.products = products  # filehandle product names; None computes all of them
+        self.ledger = IngestLedger(os.path.join(target_dir, LEDGER_NAME))
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.candidates = queue.Queue()
+        self.in_flight = set()
+        self.futures = []
+        self.processed = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.observer = None
+        self.threads = []
+
+    # 👀 Event side: every create/move/modify of a matching name becomes a candidate
+    def notify(self, path):
+        if fnmatch.fnmatch(os.path.basename(path), self.pattern):
+            self.candidates.put(path)
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                # Chrome writes <name>.crdownload and renames it when done
+                if not event.is_directory:
+                    watcher.notify(event.dest_path)
+
+        self.observer = Observer()
+        for folder in self.watch_dirs:
+            self.observer.schedule(Handler(), folder, recursive=False)
+        self.observer.start()
+        return True
+
+    def _poll_loop(self, interval=POLL_INTERVAL):
+        while not self.stopping.is_set():
+            self._scan_existing()
+            self.stopping.wait(interval)
+
+    def _scan_existing(self, today_only=True):
+        for folder in self.watch_dirs:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if not fnmatch.fnmatch(name, self.pattern) or not self.ledger.ready(path):
+                    continue
+                if today_only and datetime.fromtimestamp(os.path.getctime(path)).date() != date.today():
+                    continue
+                self.notify(path)
+
+    # ⏳ Settle side: wait until a candidate's size is stable, then hand it to the pool
+    def _settle_loop(self):
+        pending = {}  # path → last seen size
+        while not (self.stopping.is_set() and self.candidates.empty() and not pending):
+            try:
+                while True:
+                    path = self.candidates.get_nowait()
+                    pending.setdefault(path, None)
+            except queue.Empty:
+                pass
+
+            for path in list(pending):
+                name = os.path.basename(path)
+                if not os.path.exists(path) or not self.ledger.ready(path):
+                    pending.pop(path)
+                    continue
+                complete, size = is_archive_complete(path, pending[path])
+                if complete:
+                    pending.pop(path)
+                    self._enqueue(path)
+                elif self.stopping.is_set() and size == pending[path]:
+                    # Stable but unreadable: a broken download, not one still in progress
+                    self.ledger.record_failure(path, "not a valid zip archive")
+                    pending.pop(path)
+                else:
+                    pending[path] = size
+
+            time.sleep(POLL_INTERVAL / STABLE_CHECKS)
+
+    def _enqueue(self, path):
+        name = os.path.basename(path)
+        with self.lock:
+            if name in self.in_flight:
+                return
+            self.in_flight.add(name)
+            self.futures.append(self.pool.submit(self._ingest, path))
+        print(f"📥 Download finished, queued for processing: {name}")
+
+    def _ingest(self, zip_path):
+        from filehandle import extract_zip_file, rename_folder_to_date_format, process_scene
+
+        name = os.path.basename(zip_path)
+        try:
+            extracted = extract_zip_file(zip_path, self.target_dir)
+            if not extracted:
+                self.ledger.record_failure(zip_path, "extraction failed")
+                return None
+            with _rename_lock:
+                scene_root = rename_folder_to_date_format(self.target_dir, os.path.basename(extracted))
+            scene_root = scene_root or extracted
+            for folder in scene_folders(scene_root):
+                process_scene(folder, self.aoi, self.products)
+            self.ledger.add(name, scene_root)
+            with self.lock:
+                self.processed.append(scene_root)
+            return scene_root
+        except Exception as e:
+            self.ledger.record_failure(zip_path, f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.discard(name)
+
+    def start(self):
+        os.makedirs(self.target_dir, exist_ok=True)
+        if self._start_observer():
+            print(f"👀 Watching {', '.join(self.watch_dirs)} for {self.pattern} (filesystem events)")
+            # A failed archive raises no new event when its backoff ends: rescan for retries
+            self.threads.append(threading.Thread(target=self._poll_loop, args=(RESCAN_INTERVAL,), daemon=True))
+        else:
+            print(f"👀 Watching {', '.join(self.watch_dirs)} for {self.pattern} (polling every {POLL_INTERVAL}s)")
+            self.threads.append(threading.Thread(target=self._poll_loop, daemon=True))
+        self.threads.append(threading.Thread(target=self._settle_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        # Archives that finished before we started watching
+        self._scan_existing(today_only=True)
+        return self
+
+    def stop(self, drain=True):
+        """Stop watching; with drain=True, pick up any last archives and wait for processing to finish."""
+        if drain:
+            self._scan_existing(today_only=True)
+        self.stopping.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            futures = list(self.futures)
+        for future in futures:
+            if drain:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"⚠️ Ingest failed: {e}")
+            else:
+                future.cancel()
+        self.pool.shutdown(wait=drain)
+        print(f"✅ Watcher stopped ({len(self.processed)} archives processed)")
+        return list(self.processed)
+
+
+if __name__ == "__main__":
+    watcher = ArchiveWatcher([DOWNLOADS_DIR, DATA_DIR], DATA_DIR).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        watcher.stop(drain=True)
@@ -9,12 +9,14 @@ from selenium.webdriver.common.keys import Keys
 import time
 
 
-import yaml
+from settings import load_config
+from browserpool import BrowserPool
+from downloader import collect_cart_downloads, session_from_driver, download_all
+from sceneindex import plan_scene_requests, report_scene_plan
 import os
 
 # ✅ Load config
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_config()
 
 DOWNLOADS_DIR = config["downloads_dir"]
 DATA_DIR = config["data_dir"]
@@ -60,201 +62,293 @@ def wait_for_download_completion(download_dir, timeout=120, move_to_data_folder=
         return None
 
 
-def login_and_enter_location(username: str, password: str, latitude: str, longitude: str, start_date: str, end_date: str):
-    options = Options()
-    options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(service=Service(), options=options)
+# 📑 Search-result rows as {"index", "element", "text", "cells": {header: text}}
+def read_search_results(driver):
+    headers = [th.text.strip() for th in driver.find_elements(By.XPATH, "//tbody[@id='resTBody']/../thead//th")]
+    results = []
+    for index, row in enumerate(driver.find_elements(By.CSS_SELECTOR, "#resTBody > tr")):
+        cells = [td.text.strip() for td in row.find_elements(By.TAG_NAME, "td")]
+        named = {(headers[i] if i < len(headers) and headers[i] else f"col{i}"): text for i, text in enumerate(cells)}
+        # Product names often sit in a title/tooltip rather than visible text
+        extra = " ".join(filter(None, (row.get_attribute("title"), row.get_attribute("data-id"))))
+        results.append({"index": index, "element": row, "text": f"{row.text} {extra}", "cells": named})
+    return results
 
-    try:
-        driver.get("https://bhoonidhi.nrsc.gov.in/bhoonidhi/login.html")
 
-        # Step 1: Login
-        driver.find_element(By.ID, "login").send_keys(username)
-        driver.find_element(By.ID, "password").send_keys(password)
-        driver.find_element(By.CSS_SELECTOR, "button.btn.sbtn").click()
+LOGIN_URL = "https://bhoonidhi.nrsc.gov.in/bhoonidhi/login.html"
+INDEX_URL = "https://bhoonidhi.nrsc.gov.in/bhoonidhi/index.html"
 
-        # Step 2: Checkbox
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input.chk[value='AC02']"))
+
+def dismiss_index_popup(driver, timeout=10):
+    # Step 7: Handle popup in index.html
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.bootbox-accept"))
         ).click()
+        print("✅ Index popup 'OK' clicked.")
+        time.sleep(2)
+    except Exception:
+        pass
 
-        # Step 3: First Submit
-        driver.find_element(By.ID, "buttonFeedBackClass").click()
 
-        # Step 4: Handle Secondary Popup & Dropdown
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "button.bootbox-accept"))
-            ).click()
-            print("⚠️ 'OK' clicked from secondary popup.")
+# 🔐 Full login and consent-popup sequence (only needed when saved cookies have expired)
+def portal_login(driver, username, password):
+    driver.get(LOGIN_URL)
 
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, "SUB_AC02"))
-            )
-            dropdown = Select(driver.find_element(By.ID, "SUB_AC02"))
-            dropdown.select_by_value("Forest cover and type mapping_AC02#05")
-            print("✅ Selected dropdown option.")
+    # Step 1: Login
+    driver.find_element(By.ID, "login").send_keys(username)
+    driver.find_element(By.ID, "password").send_keys(password)
+    driver.find_element(By.CSS_SELECTOR, "button.btn.sbtn").click()
 
-            driver.find_element(By.ID, "buttonFeedBackClass").click()
-            print("✅ Submitted dropdown form.")
+    # Step 2: Checkbox
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "input.chk[value='AC02']"))
+    ).click()
 
-        except Exception as e:
-            print("⚠️ Skipping secondary popup or dropdown:", e)
+    # Step 3: First Submit
+    driver.find_element(By.ID, "buttonFeedBackClass").click()
 
-        # Step 5: HOME button
+    # Step 4: Handle Secondary Popup & Dropdown
+    try:
         WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'HOME')]"))
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.bootbox-accept"))
         ).click()
-        print("🏠 HOME button clicked.")
+        print("⚠️ 'OK' clicked from secondary popup.")
 
-        # Step 6: Wait for index.html
         WebDriverWait(driver, 10).until(
-            lambda d: "/bhoonidhi/index.html" in d.current_url
+            EC.presence_of_element_located((By.ID, "SUB_AC02"))
         )
-        print("✅ Redirected to:", driver.current_url)
+        dropdown = Select(driver.find_element(By.ID, "SUB_AC02"))
+        dropdown.select_by_value("Forest cover and type mapping_AC02#05")
+        print("✅ Selected dropdown option.")
 
-        # Step 7: Handle popup in index.html
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.bootbox-accept"))
-        ).click()
-        print("✅ Index popup 'OK' clicked.")
-        time.sleep(2)
+        driver.find_element(By.ID, "buttonFeedBackClass").click()
+        print("✅ Submitted dropdown form.")
 
-        # Step 8: Click on Location tab
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "locPanelLink"))
-        ).click()
-        print("📍 'Location' tab opened.")
+    except Exception as e:
+        print("⚠️ Skipping secondary popup or dropdown:", e)
 
-        # Step 9: Enter latitude
-        lat_input = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "LatDeci"))
-        )
-        lat_input.clear()
-        lat_input.send_keys(latitude)
-        print(f"✅ Latitude entered: {latitude}")
+    # Step 5: HOME button
+    WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'HOME')]"))
+    ).click()
+    print("🏠 HOME button clicked.")
 
-        # Step 10: Enter longitude
-        lng_input = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "LngDeci"))
-        )
-        lng_input.clear()
-        lng_input.send_keys(longitude)
-        print(f"✅ Longitude entered: {longitude}")
+    # Step 6: Wait for index.html
+    WebDriverWait(driver, 10).until(
+        lambda d: "/bhoonidhi/index.html" in d.current_url
+    )
+    print("✅ Redirected to:", driver.current_url)
 
-        # Step 11: Click Map Location button
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "MapLoc"))
-        ).click()
-        print("🗺️ 'Map Location' button clicked.")
+    dismiss_index_popup(driver)
 
 
-                
-        try:
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "sdate")))
-            driver.execute_script("document.getElementById('sdate').value = arguments[0];", start_date)
-            print(f"📅 Start date set to {start_date}")
-        except Exception as e:
-            print("❌ Failed to set start date:", e)
+def portal_is_logged_in(driver):
+    try:
+        driver.get(INDEX_URL)
+        time.sleep(1)  # an expired session is redirected to the login page after load
+        if "login.html" in driver.current_url or "/bhoonidhi/index.html" not in driver.current_url:
+            return False
+        dismiss_index_popup(driver, timeout=5)
+        return True
+    except Exception:
+        return False
 
-        try:
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "edate")))
-            driver.execute_script("document.getElementById('edate').value = arguments[0];", end_date)
-            print(f"📅 End date set to {end_date}")
-        except Exception as e:
-            print("❌ Failed to set end date:", e)
 
+_browser_pool = None
 
 
+def browser_pool():
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool(portal_login, portal_is_logged_in, INDEX_URL)
+    return _browser_pool
+
+
+# 🌐 Lease a logged-in session from the pool, then search, cart and download.
+# Returns the outcome (see search_and_download), never the driver: it goes back to the pool on return.
+def login_and_enter_location(username: str, password: str, latitude: str, longitude: str, start_date: str, end_date: str,
+                             dry_run: bool = False):
+    try:
+        with browser_pool().lease(username, password) as driver:
+            return search_and_download(driver, latitude, longitude, start_date, end_date, dry_run)
+    except Exception as e:
+        print("❌ Error during full automation flow:", e)
+        return None
 
 
+def search_and_download(driver, latitude: str, longitude: str, start_date: str, end_date: str, dry_run: bool = False):
+    """{"requested", "held"}: product ids searched for / already local; {"downloaded", "failed"}: file paths / items."""
+    outcome = {"requested": [], "held": [], "downloaded": [], "failed": []}
 
+    # Step 8: Click on Location tab
+    WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "locPanelLink"))
+    ).click()
+    print("📍 'Location' tab opened.")
+
+    # Step 9: Enter latitude
+    lat_input = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.ID, "LatDeci"))
+    )
+    lat_input.clear()
+    lat_input.send_keys(latitude)
+    print(f"✅ Latitude entered: {latitude}")
+
+    # Step 10: Enter longitude
+    lng_input = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.ID, "LngDeci"))
+    )
+    lng_input.clear()
+    lng_input.send_keys(longitude)
+    print(f"✅ Longitude entered: {longitude}")
+
+    # Step 11: Click Map Location button
+    WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "MapLoc"))
+    ).click()
+    print("🗺️ 'Map Location' button clicked.")
+
+
+            
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "sdate")))
+        driver.execute_script("document.getElementById('sdate').value = arguments[0];", start_date)
+        print(f"📅 Start date set to {start_date}")
+    except Exception as e:
+        print("❌ Failed to set start date:", e)
+
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "edate")))
+        driver.execute_script("document.getElementById('edate').value = arguments[0];", end_date)
+        print(f"📅 End date set to {end_date}")
+    except Exception as e:
+        print("❌ Failed to set end date:", e)
 
 
-        open_data_checkbox = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//input[@type='checkbox' and contains(@class, 'tw-control')]/following-sibling::text()[contains(., 'OpenData_DirectDownload')]/preceding-sibling::input"))
+
+
+
+
+
+
+    open_data_checkbox = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, "//input[@type='checkbox' and contains(@class, 'tw-control')]/following-sibling::text()[contains(., 'OpenData_DirectDownload')]/preceding-sibling::input"))
+    )
+    driver.execute_script("arguments[0].click();", open_data_checkbox)
+    print("✅ 'OpenData_DirectDownload' checkbox selected.")
+
+    # Step:12 Select 'ResourceSat-2_LISS3_L2' checkbox after OpenData_DirectDownload is expanded
+    try:
+        resource_liss3_checkbox = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, "//input[@type='checkbox' and @value='ResourceSat-2_LISS3_L2']"))
         )
-        driver.execute_script("arguments[0].click();", open_data_checkbox)
-        print("✅ 'OpenData_DirectDownload' checkbox selected.")
+        driver.execute_script("arguments[0].click();", resource_liss3_checkbox)
+        print("✅ 'ResourceSat-2_LISS3_L2' checkbox selected.")
+    except Exception as e:
+        print("❌ Failed to select 'ResourceSat-2_LISS3_L2':", e)
 
-        # Step:12 Select 'ResourceSat-2_LISS3_L2' checkbox after OpenData_DirectDownload is expanded
-        try:
-            resource_liss3_checkbox = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//input[@type='checkbox' and @value='ResourceSat-2_LISS3_L2']"))
-            )
-            driver.execute_script("arguments[0].click();", resource_liss3_checkbox)
-            print("✅ 'ResourceSat-2_LISS3_L2' checkbox selected.")
-        except Exception as e:
-            print("❌ Failed to select 'ResourceSat-2_LISS3_L2':", e)
 
+                
+    try:
+        submit_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.ID, "getProdButton"))
+        )
+        submit_button.click()
+        print("✅ Submit button clicked.")
+    except Exception as e:
+        print("❌ Failed to click Submit button:", e)
 
-                    
-        try:
-            submit_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.ID, "getProdButton"))
-            )
-            submit_button.click()
-            print("✅ Submit button clicked.")
-        except Exception as e:
-            print("❌ Failed to click Submit button:", e)
+    #search resuts            
+    try:
+        search_results_tab = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Search-Results')]"))
+        )
+        search_results_tab.click()
+        print("✅ 'Search-Results' tab clicked.")
+    except Exception as e:
+        print("❌ Failed to click 'Search-Results' tab:", e)
 
-        #search resuts            
-        try:
-            search_results_tab = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Search-Results')]"))
-            )
-            search_results_tab.click()
-            print("✅ 'Search-Results' tab clicked.")
-        except Exception as e:
-            print("❌ Failed to click 'Search-Results' tab:", e)
 
+    try:
+        # Wait for the table body to load
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.ID, "resTBody"))
+        )
 
-        try:
-            # Wait for the table body to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, "resTBody"))
-            )
+        # Only request scenes that are not already in data_dir
+        results = read_search_results(driver)
+        print(f"📦 Total rows found: {len(results)}")
+        wanted, skipped = plan_scene_requests(results, DATA_DIR)
+        report_scene_plan(wanted, skipped)
+        outcome["requested"] = [r["scene"]["product_id"] for r in wanted]
+        outcome["held"] = [r["scene"]["product_id"] for r in skipped]
+        if dry_run:
+            print("🧪 Dry run: nothing added to the cart.")
+            return outcome
+
+        # Loop through each missing scene and click the "Add to Cart" button
+        for result in wanted:
+            index, row = result["index"], result["element"]
+            try:
+                add_button = row.find_element(
+                    By.XPATH,
+                    ".//button[@id='cartId' and @value='add' and contains(@style, '#337AB7')]"
+                )
+                driver.execute_script("arguments[0].click();", add_button)
+                print(f"🛒 Row {index}: Add to Cart clicked.")
+            except Exception as e:
+                print(f"⚠️ Row {index}: No 'Add to Cart' button or failed to click - {e}")
+
+        if not wanted:
+            print("✅ Every scene is already held locally; nothing to download.")
+            return outcome
 
-            # Get all rows in the results table
-            rows = driver.find_elements(By.CSS_SELECTOR, "#resTBody > tr")
-            print(f"📦 Total rows found: {len(rows)}")
+    except Exception as e:
+        print("❌ Error processing result rows:", e)
 
-            # Loop through each row and click the "Add to Cart" button
-            for index, row in enumerate(rows, start=0):
-                try:
-                    add_button = row.find_element(
-                        By.XPATH,
-                        ".//button[@id='cartId' and @value='add' and contains(@style, '#337AB7')]"
-                    )
-                    driver.execute_script("arguments[0].click();", add_button)
-                    print(f"🛒 Row {index}: Add to Cart clicked.")
-                except Exception as e:
-                    print(f"⚠️ Row {index}: No 'Add to Cart' button or failed to click - {e}")
+    # A dry run never reaches the cart, also when reading the result rows failed
+    if dry_run:
+        print("🧪 Dry run: nothing added to the cart.")
+        return outcome
 
-        except Exception as e:
-            print("❌ Error processing result rows:", e)
 
+    try:
+        cart_tab = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Cart') and @href='#cartDiv']"))
+        )
+        cart_tab.click()
+        print("🛒 'Cart' tab clicked.")
+    except Exception as e:
+        print("❌ Failed to click 'Cart' tab:", e)
 
-        try:
-            cart_tab = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Cart') and @href='#cartDiv']"))
-            )
-            cart_tab.click()
-            print("🛒 'Cart' tab clicked.")
-        except Exception as e:
-            print("❌ Failed to click 'Cart' tab:", e)
+    try:
+        confirm_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.ID, "confirmCartButton"))
+        )
+        driver.execute_script("arguments[0].click();", confirm_button)
+        print("✅ 'Confirm Cart' button clicked via JS.")
+        time.sleep(2)  # Allow backend to process confirmation
+    except Exception as e:
+        print("❌ Failed to click 'Confirm Cart' button:", e)
 
-        try:
-            confirm_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.ID, "confirmCartButton"))
-            )
-            driver.execute_script("arguments[0].click();", confirm_button)
-            print("✅ 'Confirm Cart' button clicked via JS.")
-            time.sleep(2)  # Allow backend to process confirmation
-        except Exception as e:
-            print("❌ Failed to click 'Confirm Cart' button:", e)
 
+    # Preferred path: fetch product URLs directly over HTTP with the browser's session
+    direct_downloads = []
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "cartBody")))
+        direct_downloads = collect_cart_downloads(driver)
+    except Exception as e:
+        print("⚠️ Could not read download URLs from cart:", e)
+
+    if direct_downloads:
+        print(f"⬇️ Downloading {len(direct_downloads)} products directly into {DATA_DIR}")
+        outcome["downloaded"], outcome["failed"] = download_all(session_from_driver(driver), direct_downloads, DATA_DIR)
+        if outcome["failed"]:
+            print(f"❌ {len(outcome['failed'])} direct downloads failed")
 
+    if not direct_downloads:
+        # Fallback: click each row's button and wait for the browser download
         try:
             # Wait for the cart table body to load
             WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "cartBody")))
@@ -278,6 +372,10 @@ def login_and_enter_location(username: str, password: str, latitude: str, longit
                                         move_to_data_folder=True,
                                         target_dir=DATA_DIR
                                     )
+                        if downloaded_file:
+                            outcome["downloaded"].append(downloaded_file)
+                        else:
+                            outcome["failed"].append({"row": index, "error": "browser download did not finish"})
 
                         time.sleep(1)  # Wait a bit between clicks to avoid overwhelming server
                     else:
@@ -289,28 +387,7 @@ def login_and_enter_location(username: str, password: str, latitude: str, longit
         except Exception as e:
             print("❌ Error processing download buttons:", e)
 
-        # Optional: wait to see the map loaded
-        time.sleep(5)
-
-        # Inject JavaScript to isolate only the map path
-        
-        # Inject custom SVG into a clean view
-        js_hide_left_pane = '''
-        const leftPane = document.getElementById("left-pane");
-        if (leftPane) {
-            leftPane.style.display = "none";
-            console.log("✅ Left panel hidden.");
-        } else {
-            console.log("❌ Left panel not found.");
-        }
-        '''
-        driver.execute_script(js_hide_left_pane)
-        print("✅ Left panel (#left-pane) is now hidden.")
-        return driver  # you can use driver to proceed further
-
-    except Exception as e:
-        print("❌ Error during full automation flow:", e)
-        driver.quit()
-        return None, None 
+    print(f"📦 Portal run finished: {len(outcome['downloaded'])} downloaded, {len(outcome['failed'])} failed")
+    return outcome
 
 
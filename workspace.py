@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+from settings import load_config
+
+# ✅ Load config
+config = load_config()
+
+DATA_DIR = config["data_dir"]
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs")
+MANIFEST = "manifest.json"
+HASH_CHUNK = 4 * 1024 * 1024
+
+
+def workspace_dir(job_id, jobs_dir=JOBS_DIR):
+    return os.path.join(jobs_dir, job_id)
+
+
+# 📂 Private scratch directory for one job's outputs
+def create_workspace(job_id, jobs_dir=JOBS_DIR):
+    path = os.path.join(workspace_dir(job_id, jobs_dir), "work")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def blob_path(digest, ext="", blobs_dir=BLOBS_DIR):
+    return os.path.join(blobs_dir, digest[:2], digest + ext)
+
+
+# 🧱 Move a file into the content-addressed store; identical content is stored once
+def store_blob(path, blobs_dir=BLOBS_DIR):
+    digest = file_digest(path)
+    ext = os.path.splitext(path)[1].lower()
+    target = blob_path(digest, ext, blobs_dir)
+    size = os.path.getsize(path)
+
+    if os.path.exists(target):
+        os.remove(path)
+        return digest, target, size, True
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+    shutil.move(path, tmp_target)
+    os.replace(tmp_target, target)
+    return digest, target, size, False
+
+
+def commit_workspace(job_id, jobs_dir=JOBS_DIR, blobs_dir=BLOBS_DIR):
+    """Store every file of the job's scratch dir as a blob and record them in the job manifest."""
+    job_dir = workspace_dir(job_id, jobs_dir)
+    work_dir = os.path.join(job_dir, "work")
+    artifacts = {}
+    saved_bytes = 0
+
+    for root, dirs, files in os.walk(work_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            rel_name = os.path.relpath(path, work_dir).replace(os.sep, "/")
+            digest, target, size, deduplicated = store_blob(path, blobs_dir)
+            artifacts[rel_name] = {"digest": digest, "size": size, "path": target}
+            if deduplicated:
+                saved_bytes += size
+
+    manifest = {
+        "job_id": job_id,
+        "created_at": datetime.now().isoformat(),
+        "artifacts": artifacts,
+    }
+    with open(os.path.join(job_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"🧱 Job {job_id}: {len(artifacts)} artifacts stored ({saved_bytes / 1e6:.1f} MB deduplicated)")
+    return manifest
+
+
+def link_workspace(job_id, source_job_id, jobs_dir=JOBS_DIR):
+    """Give job_id the artifacts of an earlier job (same blobs, no copies)."""
+    source = load_manifest(source_job_id, jobs_dir)
+    manifest = {
+        "job_id": job_id,
+        "created_at": datetime.now().isoformat(),
+        "artifacts": source["artifacts"] if source else {},
+        "source_job_id": source_job_id,
+    }
+    job_dir = workspace_dir(job_id, jobs_dir)
+    os.makedirs(job_dir, exist_ok=True)
+    with open(os.path.join(job_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(os.path.join(job_dir, "work"), ignore_errors=True)
+    return manifest
+
+
+def load_manifest(job_id, jobs_dir=JOBS_DIR):
+    path = os.path.join(workspace_dir(job_id, jobs_dir), MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def artifact_path(job_id, name, jobs_dir=JOBS_DIR):
+    manifest = load_manifest(job_id, jobs_dir)
+    if not manifest:
+        return None
+    artifact = manifest["artifacts"].get(name)
+    return artifact["path"] if artifact else None
+
+
+def rewrite_artifact_paths(value, job_id, jobs_dir=JOBS_DIR):
+    """Point any workspace paths inside a results dict at their stored blobs."""
+    manifest = load_manifest(job_id, jobs_dir)
+    if not manifest:
+        return value
+    work_dir = os.path.abspath(os.path.join(workspace_dir(job_id, jobs_dir), "work"))
+
+    def rewrite(item):
+        if isinstance(item, dict):
+            return {k: rewrite(v) for k, v in item.items()}
+        if isinstance(item, list):
+            return [rewrite(v) for v in item]
+        if isinstance(item, str):
+            absolute = os.path.abspath(item)
+            if absolute.startswith(work_dir + os.sep):
+                rel_name = os.path.relpath(absolute, work_dir).replace(os.sep, "/")
+                artifact = manifest["artifacts"].get(rel_name)
+                if artifact:
+                    return artifact["path"]
+        return item
+
+    return rewrite(value)